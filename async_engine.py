@@ -0,0 +1,476 @@
+"""asyncio fetch engine, an alternative to the nested ThreadPoolExecutors.
+
+All users of a batch run in one event loop. Search pagination, detail checks and
+image fetches are coroutines on one aiohttp connection pool, and a semaphore caps
+how many requests are in flight instead of 5 × 15 blocked OS threads. Parsing,
+filtering and the email reuse the Scraper methods, so both engines send the same
+report.
+
+Selected with ``--engine asyncio``; needs aiohttp.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import nullcontext
+from typing import Optional
+from urllib.parse import urlencode
+
+from cassette import Cassette, content_charset
+from http_client import DEFAULT_POOL_SIZE
+from profiling import Profiler
+from rate_limiter import RateLimiter, retry_after_seconds
+from retry_policy import RetryPolicy
+from search_checkpoint import SearchIncompleteError
+from search_planner import attach_cards, plan_batch
+
+DEFAULT_CONCURRENCY = 20
+
+
+class HTTPStatusError(Exception):
+    pass
+
+
+class _Response:
+    """The parts of requests.Response that Scraper and ResponseCache read."""
+
+    apparent_encoding = None
+
+    def __init__(self, url, status_code, headers, content, encoding):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPStatusError(f"{self.status_code} for url: {self.url}")
+
+
+def _with_query(url: str, params: Optional[dict]) -> str:
+    """url with params appended, as the request line aiohttp sends carries them."""
+    if not params:
+        return url
+    return f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+
+
+class AsyncEngine:
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cassette: Optional[Cassette] = None,
+        profiler: Optional[Profiler] = None,
+    ):
+        """rate_limiter: per-host pacing (normally http_client's shared one).
+
+        retry_policy: retries and circuit breakers (normally http_client's).
+        cassette: record responses to it, or replay them from it (normally
+        http_client's).
+        profiler: profiles each run() as a whole ("asyncio"); users share the
+        event loop thread, so it cannot be split per user.
+        """
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.cassette = cassette
+        self.profiler = profiler
+        self._session = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def run(
+        self,
+        scrapers: list,
+        plan_searches: bool = False,
+        start_offsets: Optional[list] = None,
+    ):
+        """Run every scraper to completion (the asyncio counterpart of Scraper.main).
+
+        plan_searches: fetch merged batch queries first (see search_planner).
+        start_offsets: seconds after that at which each user starts.
+        """
+        profiling = (
+            self.profiler.run("asyncio") if self.profiler is not None else nullcontext()
+        )
+        with profiling:
+            asyncio.run(self._run(scrapers, plan_searches, start_offsets))
+
+    async def _run(self, scrapers, plan_searches, start_offsets=None):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, limit_per_host=self.pool_size
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with aiohttp.ClientSession(
+            connector=connector, headers=scrapers[0]._page_request_headers()
+        ) as session:
+            self._session = session
+            if plan_searches:
+                try:
+                    await self._prefetch(scrapers)
+                except Exception:
+                    logging.exception(
+                        "Batch search planner failed; users will paginate on their own."
+                    )
+            start_offsets = start_offsets or [0.0] * len(scrapers)
+            results = await asyncio.gather(
+                *(
+                    self._run_user(s, offset)
+                    for s, offset in zip(scrapers, start_offsets)
+                ),
+                return_exceptions=True,
+            )
+        self._session = None
+
+        for scraper, result in zip(scrapers, results):
+            if isinstance(result, SearchIncompleteError):
+                logging.error(
+                    "Search incomplete for user %s: %s",
+                    scraper.user_config["user"],
+                    result,
+                )
+            elif isinstance(result, BaseException):
+                logging.error(
+                    "Scraper failed for user %s",
+                    scraper.user_config["user"],
+                    exc_info=result,
+                )
+
+    async def _get(self, url, params=None, headers=None, timeout=30) -> _Response:
+        import aiohttp
+
+        def attempt():
+            return self._get_once(url, params, headers, timeout)
+
+        if self.retry_policy is None:
+            return await attempt()
+        return await self.retry_policy.asend(
+            url, attempt, (aiohttp.ClientError, asyncio.TimeoutError)
+        )
+
+    async def _get_once(self, url, params, headers, timeout) -> _Response:
+        import aiohttp
+
+        bucket = self.rate_limiter.bucket(url) if self.rate_limiter else None
+        if bucket is not None:
+            await bucket.aacquire()
+        async with self._semaphore:
+            if self.cassette is not None and self.cassette.replaying:
+                return await self._replay(url, params, bucket)
+            start = time.monotonic()
+            try:
+                async with self._session.get(
+                    url,
+                    params=params,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as resp:
+                    content = await resp.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if bucket is not None:
+                    bucket.observe(None, time.monotonic() - start)
+                raise
+            elapsed = time.monotonic() - start
+            if bucket is not None:
+                bucket.observe(
+                    resp.status,
+                    elapsed,
+                    retry_after_seconds(resp.headers.get("Retry-After")),
+                )
+            if self.cassette is not None:
+                self.cassette.record(
+                    "GET",
+                    _with_query(url, params),
+                    resp.status,
+                    resp.headers,
+                    content,
+                    elapsed,
+                )
+            return _Response(
+                str(resp.url),
+                resp.status,
+                dict(resp.headers),
+                content,
+                resp.charset,
+            )
+
+    async def _replay(self, url, params, bucket) -> _Response:
+        """_get_once answered from the cassette (redirects followed in it)."""
+        url = _with_query(url, params)
+        replayed = self.cassette.replay("GET", url, follow_redirects=True)
+        if replayed.delay:
+            await asyncio.sleep(replayed.delay)
+        if bucket is not None:
+            bucket.observe(replayed.status, replayed.delay)
+        return _Response(
+            url,
+            replayed.status,
+            replayed.headers,
+            replayed.content,
+            content_charset(replayed.headers),
+        )
+
+    async def _search_page(self, scraper, query_params, page_num, headers) -> str:
+        with scraper.metrics.span("search.fetch"):
+            response = await self._get(
+                scraper.LISTING_AJAX_URL,
+                params={
+                    k: str(v) for k, v in dict(query_params, page=page_num).items()
+                },
+                headers=headers,
+                timeout=30,
+            )
+        scraper.metrics.response("search", response.status_code, len(response.content))
+        response.raise_for_status()
+        return response.text
+
+    async def _search_pages(self, scraper, query_params: Optional[dict] = None):
+        """Async version of Scraper.iter_search_pages (including page_window).
+
+        Close it (aclose) when stopping early, so that the checkpoint is dropped.
+        """
+        if query_params is None:
+            query_params = scraper._search_listings_query_params(1)
+        headers = {"Referer": "https://fasteignir.visir.is/search/results/?stype=sale"}
+        checkpoints = scraper.search_checkpoints
+
+        saved = checkpoints.load(query_params)
+        if saved:
+            logging.info(
+                "Resuming search from checkpoint: %d saved page(s), fetching from "
+                "page %d.",
+                len(saved),
+                len(saved) + 1,
+            )
+        pending = {}
+        window = min(2, scraper.page_window)
+        next_submit = page_num = len(saved) + 1
+        try:
+            for saved_page in saved:
+                yield saved_page
+            while page_num <= scraper.MAX_SEARCH_PAGES:
+                while (
+                    next_submit < page_num + window
+                    and next_submit <= scraper.MAX_SEARCH_PAGES
+                ):
+                    pending[next_submit] = asyncio.ensure_future(
+                        self._search_page(scraper, query_params, next_submit, headers)
+                    )
+                    next_submit += 1
+
+                try:
+                    text = await pending.pop(page_num)
+                except Exception as e:
+                    scraper._search_page_failed(page_num, e)
+
+                if scraper._is_last_search_page(page_num, text):
+                    break
+
+                checkpoints.save_page(query_params, page_num, text)
+                yield page_num, text
+                page_num += 1
+                if scraper.page_window > 1:
+                    window = min(window * 2, scraper.page_window)
+                elif self.rate_limiter is None:
+                    await asyncio.sleep(0.5)
+        except GeneratorExit:
+            checkpoints.clear(query_params)
+            raise
+        finally:
+            for task in pending.values():
+                task.cancel()
+        checkpoints.clear(query_params)
+
+    async def _extract_cards(self, scraper, text: str) -> list:
+        """Scraper.extract_listing_cards, awaiting the parse pool when there is one."""
+        if scraper.parse_pool is None:
+            return scraper.extract_listing_cards(text, scraper.BASE_URL)
+        with scraper.metrics.span("search.parse"):
+            return await scraper.parse_pool.aparse_cards(
+                scraper.card_parser.name, text, scraper.BASE_URL
+            )
+
+    async def _prefetch(self, scrapers):
+        async def fetch_plan(plan, members):
+            leader = members[0][0]
+            cards = []
+            pages = self._search_pages(leader, plan.query.to_params())
+            try:
+                async for page_num, text in pages:
+                    page_cards = await self._extract_cards(leader, text)
+                    logging.info(
+                        "Batch search page %s: %s card(s) (running total %s).",
+                        page_num,
+                        len(page_cards),
+                        len(cards) + len(page_cards),
+                    )
+                    if not page_cards:
+                        break
+                    cards.extend(page_cards)
+            except SearchIncompleteError as e:
+                # Partial results would hide listings; the members search alone.
+                logging.error(
+                    "Batch query %s incomplete: %s", plan.query.to_params(), e
+                )
+                leader.search_incomplete = False
+                return
+            finally:
+                await pages.aclose()
+            attach_cards(plan, members, cards)
+
+        await asyncio.gather(
+            *(fetch_plan(plan, members) for plan, members in plan_batch(scrapers))
+        )
+
+    async def _iter_new_properties(self, scraper):
+        """Async version of Scraper.iter_new_properties."""
+        if scraper.prefetched_cards is not None or not scraper._has_search_params():
+            # No network involved: filter the batch cards / log the config error.
+            for page in scraper.iter_new_properties():
+                yield page
+            return
+
+        skip_address_substrings = scraper.user_config.get("ignored_strings", [])
+        processed_links = set()
+        pages = self._search_pages(scraper)
+        try:
+            async for page_num, text in pages:
+                added = scraper._parse_search_page(
+                    page_num,
+                    text,
+                    skip_address_substrings,
+                    processed_links,
+                    await self._extract_cards(scraper, text),
+                )
+                if added is None:
+                    break
+                yield added
+        finally:
+            await pages.aclose()
+
+    async def _check_details(self, scraper, prop):
+        """Async version of Scraper.check_property_details."""
+        if not prop.link:
+            return
+        headers = scraper._detail_request_headers()
+        try:
+            with scraper.metrics.span("detail.fetch"):
+                response = await self._get_detail_page(scraper, prop.link, headers)
+            with scraper.metrics.span("detail.parse"):
+                if scraper.parse_pool is not None:
+                    scraper._apply_details(
+                        prop,
+                        await scraper.parse_pool.aextract_details(
+                            scraper.detail_extractor.keywords,
+                            response,
+                            prop.link,
+                            scraper._wants_detail_markup(prop),
+                        ),
+                    )
+                else:
+                    scraper._apply_detail_page(prop, response.text)
+        except Exception as e:
+            scraper._apply_detail_failure(prop, e)
+
+    async def _get_detail_page(self, scraper, url: str, headers: dict):
+        """Async version of Scraper._get_detail_page."""
+        sent = []
+
+        async def get(url, **kwargs):
+            response = await self._get(url, **kwargs)
+            sent.append(response)
+            scraper.metrics.response(
+                "detail", response.status_code, len(response.content)
+            )
+            return response
+
+        if scraper.response_cache is not None:
+            response = await scraper.response_cache.afetch(
+                url, get, headers=headers, timeout=15
+            )
+            if not sent:
+                scraper.metrics.count("detail_cache_hits")
+            elif sent[0].status_code == 304:
+                scraper.metrics.count("detail_cache_revalidated")
+            return response
+        response = await get(url, headers=headers, timeout=15)
+        response.raise_for_status()
+        return response
+
+    async def _fetch_image(self, scraper, image_url, referer=None):
+        """Async version of Scraper._fetch_image."""
+        with scraper.metrics.span("image.fetch"):
+            response = await self._get(
+                image_url, headers=scraper._image_request_headers(referer), timeout=15
+            )
+        scraper.metrics.response("image", response.status_code, len(response.content))
+        response.raise_for_status()
+        return response.content, response.headers.get("Content-Type")
+
+    async def _run_user(self, scraper, start_offset: float = 0.0):
+        if start_offset > 0:
+            await asyncio.sleep(start_offset)
+        logging.info(
+            "Running scraper for %s (asyncio engine)...", scraper.user_config["user"]
+        )
+        scraper.search_incomplete = False
+        scraper.metrics.start()
+        try:
+            with scraper.metrics.span("run"):
+                with scraper.metrics.span("scrape"):
+                    new_properties = await self._scrape_and_check_details(scraper)
+                with scraper.metrics.span("aggregate"):
+                    selection = scraper._prepare_report(new_properties)
+                with scraper.metrics.span("images"):
+                    image_data_uris = await scraper.image_pipeline.aembed(
+                        selection.report_properties,
+                        lambda url, referer: self._fetch_image(scraper, url, referer),
+                    )
+                # The Brevo SDK is blocking; keep it off the event loop.
+                await asyncio.to_thread(
+                    scraper._send_report, selection, image_data_uris
+                )
+        finally:
+            scraper._finish_run()
+
+    async def _scrape_and_check_details(self, scraper) -> list:
+        """Async version of Scraper._scrape_and_check_details."""
+        # Detail checks start as soon as their search page is parsed.
+        new_properties = []
+        checks = []
+        to_check = []
+        try:
+            with scraper.metrics.span("search"):
+                async for page in self._iter_new_properties(scraper):
+                    new_properties.extend(page)
+                    for prop in scraper._properties_to_check(page):
+                        to_check.append(prop)
+                        checks.append(
+                            asyncio.ensure_future(self._check_details(scraper, prop))
+                        )
+        except BaseException:
+            for check in checks:
+                check.cancel()
+            raise
+        await asyncio.gather(*checks)
+        logging.info(
+            "Checked %d / %d properties while paginating (asyncio)...",
+            len(to_check),
+            len(new_properties),
+        )
+        scraper.metrics.count("listings", len(new_properties))
+        scraper.metrics.count("details_checked", len(to_check))
+        if to_check:
+            scraper._details_checked(to_check)
+        return new_properties
@@ -0,0 +1,154 @@
+"""Email rendering benchmark: 5,000 synthetic listings.
+
+Compares the previous ``html += ...`` renderer with ReportRenderer on a cold
+fragment cache and a warm one (a second user of the batch, or tomorrow's run of
+the same listings), and a scheduled batch where every user reports the listings.
+
+    python benchmarks/bench_render.py [--listings N] [--users N] [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from listing import (
+    Listing,
+    format_count,
+    format_price,
+    format_size,
+    format_thousands,
+)
+from mortgage import LoanCalculator
+from report_renderer import ReportRenderer
+
+
+def synthetic_listings(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    listings = []
+    for i in range(count):
+        size = round(rng.uniform(35, 220), 1)
+        listings.append(
+            Listing(
+                link=f"https://fasteignir.visir.is/property/{100000 + i}",
+                address=f"Gata {i % 300} {rng.randint(1, 80)}, 10{rng.randint(1, 9)}",
+                price=rng.randrange(25_000_000, 150_000_000, 100_000),
+                size_m2=size,
+                total_rooms=rng.randint(1, 7),
+                bedrooms=rng.randint(1, 5),
+                image_url=f"https://api-beta.fasteignir.is/pictures/{i}.jpg",
+                has_balcony=rng.random() < 0.5,
+                has_terrace=rng.random() < 0.3,
+                has_garage=rng.random() < 0.2,
+                build_year=str(rng.randint(1930, 2024)),
+                fasteignamat=f"{format_thousands(rng.randint(20, 120) * 10**6)} kr",
+            )
+        )
+    LoanCalculator().attach(listings)
+    return listings
+
+
+def legacy_html(properties, title, image_data_uris):
+    """The string-concatenating generate_property_html this replaced."""
+    html = f"<h2>{title}</h2>"
+    for prop in properties:
+        html += (
+            "<div style='margin-bottom: 30px; padding: 15px; border: 1px solid #ddd;'>"
+        )
+        html += f"<h3>{prop.address}</h3>"
+        html += f"<p><strong>Verð:</strong> {format_price(prop.price)}</p>"
+        if prop.fasteignamat and prop.fasteignamat != "N/A":
+            html += f"<p><strong>Fasteignamat:</strong> {prop.fasteignamat}</p>"
+        if prop.price_per_m2:
+            html += f"<p><strong>Fermetraverð:</strong> {format_thousands(prop.price_per_m2)} kr.</p>"
+        html += f"<p><strong>Stærð:</strong> {format_size(prop.size_m2)}</p>"
+        html += f"<p><strong>Svefnherbergi:</strong> {format_count(prop.bedrooms)}</p>"
+        for payment in prop.payments or ():
+            html += f"<p><strong>Mánaðarleg afborgun ({payment.label}):</strong> {format_thousands(payment.monthly)} kr.</p>"
+        if prop.build_year and prop.build_year != "N/A":
+            html += f"<p><strong>Byggt:</strong> {prop.build_year}</p>"
+        if prop.has_balcony is not None:
+            html += (
+                f"<p><strong>Svalir:</strong> {'Já' if prop.has_balcony else 'Nei'}</p>"
+            )
+        if prop.has_terrace is not None:
+            html += (
+                f"<p><strong>Garður:</strong> {'Já' if prop.has_terrace else 'Nei'}</p>"
+            )
+        if prop.has_garage is not None:
+            html += (
+                f"<p><strong>Bílskúr:</strong> {'Já' if prop.has_garage else 'Nei'}</p>"
+            )
+        if prop.image_url:
+            src = image_data_uris.get(prop.image_url, prop.image_url)
+            html += f"<img src='{src}' alt='Property image' style='max-width: 600px; height: auto; margin: 10px 0;' />"
+        html += f"<p><a href='{prop.link}'>View Property</a></p>"
+        html += "</div>"
+    return html
+
+
+def best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    listings = synthetic_listings(args.listings)
+    # A few embedded images, as in a real email within its size budget.
+    images = {
+        p.image_url: "data:image/jpeg;base64," + "A" * 40_000 for p in listings[:40]
+    }
+    title = "Fasteignir í 101 Reykjavík"
+
+    expected = legacy_html(listings, title, images)
+    renderer = ReportRenderer()
+    if renderer.listings_html(listings, title, images) != expected:
+        sys.exit("ReportRenderer output differs from the legacy renderer")
+
+    legacy = best_of(args.repeat, lambda: legacy_html(listings, title, images))
+    cold = best_of(
+        args.repeat,
+        lambda: ReportRenderer().listings_html(listings, title, images),
+    )
+    warm = best_of(args.repeat, lambda: renderer.listings_html(listings, title, images))
+
+    def batch():
+        shared = ReportRenderer()
+        for _ in range(args.users):
+            shared.listings_html(listings, title, images)
+
+    legacy_batch = best_of(
+        args.repeat,
+        lambda: [legacy_html(listings, title, images) for _ in range(args.users)],
+    )
+    renderer_batch = best_of(args.repeat, batch)
+
+    print(f"{args.listings} listings, best of {args.repeat}, {len(expected):,} bytes")
+    print(f"  legacy +=        {legacy * 1000:8.1f} ms")
+    print(f"  renderer (cold)  {cold * 1000:8.1f} ms  {legacy / cold:5.1f}x")
+    print(f"  renderer (warm)  {warm * 1000:8.1f} ms  {legacy / warm:5.1f}x")
+    print(f"batch of {args.users} users")
+    print(f"  legacy +=        {legacy_batch * 1000:8.1f} ms")
+    print(
+        f"  renderer         {renderer_batch * 1000:8.1f} ms"
+        f"  {legacy_batch / renderer_batch:5.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Synthetic, deterministic fixture recordings for the benchmark suite.
+
+Generates what the site would answer for the benchmark user's search: result
+pages of PAGE_SIZE estate cards (then the empty-search message), one detail page
+per listing (padded with the navigation, scripts and "similar listings" markup
+real pages carry, to about ``detail_kb``), and the listing pictures. The output
+is a cassette (cassette.Cassette), so a ``scraper.py --record`` cassette of the
+real site can be benchmarked instead.
+
+    python benchmarks/fixtures.py OUT_DIR [--listings N] [--seed N] [--detail-kb KB]
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import random
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cassette import Cassette, request_key
+from listing import format_thousands
+from postcodes import POSTCODES
+
+PAGE_SIZE = 20
+ZIPS = ("101", "104", "105", "107", "108", "200", "210", "220", "270", "600")
+STREETS = ("Laugavegur", "Hverfisgata", "Álfheimar", "Bólstaðarhlíð", "Hamraborg")
+PICTURES = "https://api-beta.fasteignir.is/pictures"
+HTML_HEADERS = {"Content-Type": "text/html; charset=utf-8"}
+JPEG_HEADERS = {"Content-Type": "image/jpeg"}
+IMAGE_VARIANTS = 4
+
+# Every listing matches this search; what the email keeps is up to the filters.
+BENCH_USER = {
+    "user": "bench",
+    "BREVO_API_KEY": "offline",
+    "FROM_EMAIL": "bench@example.com",
+    "TO_EMAIL": "bench@example.com",
+    "MIN_PRICE": "20000000",
+    "MAX_PRICE": "200000000",
+    "MIN_BEDROOMS": "1",
+    "MAX_BEDROOMS": "10",
+    "ZIP_CODES": ",".join(ZIPS),
+    "EINBYLISHUS": "yes",
+    "FJOLBYLISHUS": "yes",
+    "ATVINNUHUSNAEDI": "no",
+    "RADHUS_PARHUS": "yes",
+    "SUMARHUS": "no",
+    "PARHUS": "yes",
+    "JORD_LOD": "no",
+    "HAED": "yes",
+    "HESTHUS": "no",
+    "OFLOKKAD": "no",
+    "ignored_strings": [],
+}
+
+
+def _listing(rng: random.Random, i: int) -> dict:
+    zip_code = rng.choice(ZIPS)
+    size = rng.randrange(350, 2200) / 10
+    rooms = rng.randint(1, 7)
+    return {
+        "id": 800000 + i,
+        "address": f"{rng.choice(STREETS)} {rng.randint(1, 120)}",
+        "zip": zip_code,
+        "place": POSTCODES.get(zip_code, ("", ""))[0],
+        "price": rng.randrange(25_000_000, 190_000_000, 100_000),
+        "size": size,
+        "rooms": rooms,
+        "bedrooms": max(1, rooms - 1),
+        "static_map": rng.random() < 0.3,
+        "balcony": rng.random() < 0.5,
+        "terrace": rng.random() < 0.3,
+        "garage": rng.random() < 0.2,
+        "built": rng.randint(1925, 2024),
+        "fasteignamat": rng.randint(20, 150) * 1_000_000,
+    }
+
+
+def card_html(item: dict) -> str:
+    if item["static_map"]:
+        image = f"https://maps.googleapis.com/maps/api/staticmap?center={item['id']}"
+    else:
+        image = f"{PICTURES}/{item['id']}/thumb.jpg"
+    size = f"{item['size']:g}".replace(".", ",")
+    return (
+        '<div class="estate__item col-12 col-md-6 col-lg-4">'
+        f'<a class="js-property-link" href="/property/{item["id"]}">'
+        f'<div class="estate__image"><img src="{image}" alt="" loading="lazy"/></div>'
+        "</a>"
+        f'<div class="estate__item-title">{item["address"]}<br/>'
+        f'{item["zip"]} {item["place"]}</div>'
+        f'<div class="estate__price">{format_thousands(item["price"])} kr</div>'
+        '<div class="estate__parameters">'
+        f'<div class="estate__parameters--1">{size} m²</div>'
+        f'<div class="estate__parameters--2">{item["rooms"]}</div>'
+        f'<div class="estate__parameters--4">{item["bedrooms"]}</div>'
+        "</div></div>\n"
+    )
+
+
+_BOILERPLATE = (
+    "<header><nav>"
+    + "".join(f'<a href="/leit/{i}">Flokkur {i}</a>' for i in range(40))
+    + "</nav></header>"
+    + "<script>window.dataLayer=window.dataLayer||[];var config={"
+    + ",".join(f'"k{i}":"{"x" * 40}"' for i in range(60))
+    + "};</script>"
+)
+
+
+def detail_html(item: dict, rng: random.Random, detail_kb: int) -> str:
+    features = []
+    if item["balcony"]:
+        features.append("Suðursvalir með góðu útsýni.")
+    if item["terrace"]:
+        features.append("Sérafnotareitur og sameiginlegur garður.")
+    if item["garage"]:
+        features.append("Innbyggður bílskúr fylgir eigninni.")
+    description = " ".join(
+        features
+        + [
+            "Björt og vel skipulögð íbúð á góðum stað, stutt í alla þjónustu.",
+            f"Húsið er byggt {item['built']} og hefur fengið gott viðhald.",
+        ]
+    )
+    gallery = "".join(
+        f'<img src="{PICTURES}/{item["id"]}/{n}.jpg" alt="Mynd {n}"/>'
+        for n in range(1, 6)
+    )
+    page = (
+        '<!DOCTYPE html><html lang="is"><head><meta charset="utf-8"/>'
+        f"<title>{item['address']} - Fasteignir</title></head><body>"
+        f"{_BOILERPLATE}<main><h1>{item['address']}, {item['zip']}</h1>"
+        f'<div class="gallery">{gallery}</div><p class="description">{description}</p>'
+        '<div class="property-facts">'
+        f"<div><span>Verð</span><span>{format_thousands(item['price'])} kr</span></div>"
+        f"<div><span>Fasteignamat</span>"
+        f"<span>{format_thousands(item['fasteignamat'])} kr</span></div>"
+        f"<div><span>Byggingarár</span><span>{item['built']}</span></div>"
+        "</div>"
+    )
+    similar = []
+    while len(page) + sum(map(len, similar)) < detail_kb * 1024:
+        other = 900000 + rng.randrange(100000)
+        similar.append(
+            f'<div class="similar"><a href="/property/{other}">'
+            f'<img data-src="/thumbs/{other}.jpg"/>Eign {other}</a>'
+            f"<span>{format_thousands(rng.randrange(30, 150) * 10**6)} kr</span></div>"
+        )
+    return page + "".join(similar) + "</main><footer>Fasteignir</footer></body></html>"
+
+
+def image_bytes(rng: random.Random) -> bytes:
+    """A 1024x768 JPEG when Pillow is installed, else JPEG-sized random bytes."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + rng.randbytes(90_000) + b"\xff\xd9"
+    image = Image.effect_noise((1024, 768), rng.randint(20, 80)).convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def _prepared_url(url: str, params: dict) -> str:
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+def generate(directory: str, listings: int, seed: int = 1, detail_kb: int = 60):
+    """Write a cassette of listings synthetic listings to directory."""
+    from scraper import Scraper
+
+    rng = random.Random(seed)
+    items = [_listing(rng, i) for i in range(listings)]
+    recording = Cassette(directory)
+    scraper = Scraper(BENCH_USER)
+
+    pages = max(1, -(-listings // PAGE_SIZE))
+    for page in range(1, pages + 3):
+        chunk = items[(page - 1) * PAGE_SIZE : page * PAGE_SIZE]
+        if chunk:
+            body = '<div class="estate">' + "".join(map(card_html, chunk)) + "</div>"
+        else:
+            body = f"<div><p>{Scraper.NO_SEARCH_RESULTS_TEXT}</p></div>"
+        name = f"search/{page:04d}.html"
+        recording.write_body(name, body.encode("utf-8"))
+        url = _prepared_url(
+            Scraper.LISTING_AJAX_URL, scraper._search_listings_query_params(page)
+        )
+        recording.add(request_key("GET", url), 200, HTML_HEADERS, name)
+
+    images = [f"images/{n}.jpg" for n in range(IMAGE_VARIANTS)]
+    for name in images:
+        recording.write_body(name, image_bytes(rng))
+    for item in items:
+        name = f"detail/{item['id']}.html"
+        recording.write_body(name, detail_html(item, rng, detail_kb).encode("utf-8"))
+        url = f"{Scraper.BASE_URL}/property/{item['id']}"
+        recording.add(request_key("GET", url), 200, HTML_HEADERS, name)
+        for n in ("thumb", 1, 2, 3, 4, 5):
+            recording.add(
+                request_key("GET", f"{PICTURES}/{item['id']}/{n}.jpg"),
+                200,
+                JPEG_HEADERS,
+                images[item["id"] % IMAGE_VARIANTS],
+            )
+    recording.save()
+    return recording
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--listings", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--detail-kb", type=int, default=60)
+    args = parser.parse_args()
+    recording = generate(args.out_dir, args.listings, args.seed, args.detail_kb)
+    print(f"{len(recording.responses)} responses in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""A local HTTP server that replays a cassette, for the benchmark suite.
+
+Recordings are cassette.Cassette directories (manifest.json plus bodies), the
+format ``scraper.py --record`` writes. ReplayServer serves one on 127.0.0.1;
+ReplayAdapter, mounted on a requests.Session, rewrites every request (whatever
+its host) to that server, so the scraper runs unchanged and fully offline over
+real loopback HTTP (unlike ``--replay``, which answers inside the adapter).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cassette import Cassette, request_key
+from http_adapter import PolicyAdapter
+
+_PREFIX = "/__replay__/"
+
+
+class ReplayServer:
+    """Serves a Cassette on 127.0.0.1 (a context manager); unknown requests 404."""
+
+    def __init__(self, recording: Cassette, latency: float = 0.0):
+        self.recording = recording
+        self.latency = latency
+        self.hits = 0
+        self.misses: list[str] = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._serve(self)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:%d" % self._httpd.server_address[1]
+
+    def _serve(self, handler):
+        original = _original_url(handler.path)
+        found = self.recording.lookup(request_key("GET", original))
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if found is None:
+                self.misses.append(original)
+            else:
+                self.hits += 1
+        status, headers, content = found or (404, {}, b"")
+        handler.send_response(status)
+        for name, value in headers.items():
+            if name.lower() not in ("content-length", "transfer-encoding"):
+                handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    def __enter__(self) -> ReplayServer:
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _original_url(path: str) -> str:
+    """http://127.0.0.1:port/__replay__/https/host/p?q -> https://host/p?q."""
+    scheme, _, rest = path[len(_PREFIX) :].partition("/")
+    return f"{scheme}://{rest}"
+
+
+class ReplayAdapter(PolicyAdapter):
+    """PolicyAdapter that sends every request to a ReplayServer instead."""
+
+    def __init__(self, server_url: str, **kwargs):
+        self.server_url = server_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = (
+            f"{self.server_url}{_PREFIX}{parts.scheme}/{parts.netloc}{parts.path}"
+            + (f"?{parts.query}" if parts.query else "")
+        )
+        return super().send(request, **kwargs)
@@ -0,0 +1,398 @@
+"""Offline benchmark suite: the scraper's hot paths at several dataset sizes.
+
+For each size a fixture recording is generated (benchmarks/fixtures.py, cached
+under benchmarks/.fixtures) or taken from --recording, and served on 127.0.0.1
+by replay.ReplayServer; nothing goes to the network. Timed, best of --repeat:
+
+- card_parse.<backend>: every search result page, per available card parser
+  (after checking they all return the same cards as "soup");
+- detail_extract.<backend>: DetailExtractor on every detail page (lxml / soup);
+- aggregate: Scraper._prepare_report (sort, filter, price cube, loan payments);
+- render.cold / render.warm: the email HTML with a fresh / reused ReportRenderer;
+- scraper_main: Scraper.main end to end over loopback HTTP, email send stubbed;
+- startup: ``import scraper`` in a fresh interpreter (``-X importtime``), once,
+  checking that none of LAZY_MODULES is imported at startup.
+
+Results are written as JSON (--output, default benchmarks/results/<time>.json);
+--compare OLD.json prints the change against an earlier run.
+
+    python benchmarks/suite.py [--sizes 100,1000] [--repeat 3] [--only NAME ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import http_client
+from cassette import Cassette
+from detail_parser import DetailExtractor, _SoupDetailDom
+from listing_parser import available_parsers, check_parity
+from listing_parser import get_card_parser
+from rate_limiter import RateLimiter
+from report_renderer import ReportRenderer
+from scraper import Scraper
+
+import fixtures
+from replay import ReplayAdapter, ReplayServer
+
+FIXTURE_DIR = os.path.join(HERE, ".fixtures")
+RESULTS_DIR = os.path.join(HERE, "results")
+BENCHMARKS = (
+    "card_parse",
+    "detail_extract",
+    "aggregate",
+    "render",
+    "scraper_main",
+    "startup",
+)
+# Only imported where first used: a --user run that sends nothing, or --help,
+# must not pay for them.
+LAZY_MODULES = (
+    "requests",
+    "urllib3",
+    "bs4",
+    "sib_api_v3_sdk",
+    "dotenv",
+    "aiohttp",
+    "lxml",
+    "PIL",
+    "numpy",
+    "pyarrow",
+    "asyncio",
+    "multiprocessing",
+)
+
+
+def best_of(repeat: int, fn, setup=None) -> float:
+    """Fastest of repeat runs of fn(setup()); setup is not timed."""
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def import_times(module: str) -> dict:
+    """{imported module: cumulative seconds} of importing module in a fresh
+    interpreter, from ``python -X importtime``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def fixture_recording(size: int, seed: int, detail_kb: int) -> Cassette:
+    directory = os.path.join(FIXTURE_DIR, f"{size}-{seed}-{detail_kb}kb")
+    if not os.path.exists(os.path.join(directory, "manifest.json")):
+        print(f"generating fixtures for {size} listings in {directory} ...")
+        fixtures.generate(directory, size, seed, detail_kb)
+    return Cassette(directory, cache_bodies=True)
+
+
+def replay_session(server_url: str) -> requests.Session:
+    session = requests.Session()
+    adapter = ReplayAdapter(server_url, pool_connections=8, pool_maxsize=20)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(Scraper._page_request_headers())
+    return session
+
+
+def bench_scraper(user_config: dict, session, **kwargs) -> Scraper:
+    scraper = Scraper(user_config, session=session, **kwargs)
+    scraper.send_email_notification = lambda subject, html: True
+    return scraper
+
+
+class Suite:
+    def __init__(self, args):
+        self.args = args
+        self.results = []
+
+    def record(self, name: str, size: int, seconds: float, ops: int, unit: str):
+        self.results.append(
+            {
+                "name": name,
+                "size": size,
+                "seconds": round(seconds, 6),
+                "ops": ops,
+                "unit": unit,
+                "per_second": round(ops / seconds, 1) if seconds else None,
+            }
+        )
+        print(
+            f"  {name:<24} {seconds * 1000:10.1f} ms  "
+            f"{ops / seconds if seconds else 0:10.1f} {unit}/s"
+        )
+
+    def wanted(self, name: str) -> bool:
+        return not self.args.only or name in self.args.only
+
+    def run_size(self, size: int, recording: Cassette) -> dict:
+        repeat = self.args.repeat
+        search = [
+            body.decode("utf-8")
+            for key, body in recording.bodies(f"GET {Scraper.LISTING_AJAX_URL}")
+        ]
+        details = [
+            (key.split(" ", 1)[1], body.decode("utf-8"))
+            for key, body in recording.bodies(f"GET {Scraper.BASE_URL}/property/")
+        ]
+        checks = {}
+
+        if self.wanted("card_parse"):
+            mismatched = sorted(
+                {name for page in search for name in check_parity(page, "")}
+            )
+            checks["card_parser_parity"] = mismatched or "ok"
+            cards = sum(
+                1
+                for p in search
+                for c in get_card_parser("soup").parse(p, "")
+                if c.link
+            )
+            for name in available_parsers():
+                parser = get_card_parser(name)
+                seconds = best_of(
+                    repeat,
+                    lambda parser=parser: [
+                        parser.parse(p, Scraper.BASE_URL) for p in search
+                    ],
+                )
+                self.record(f"card_parse.{name}", size, seconds, cards, "cards")
+
+        if self.wanted("detail_extract"):
+            backends = {"soup": _SoupDetailDom()}
+            try:
+                from detail_parser import _LxmlDetailDom
+
+                backends["lxml"] = _LxmlDetailDom()
+            except ImportError:
+                pass
+            for name, dom in backends.items():
+                extractor = DetailExtractor()
+                extractor._dom = dom
+                seconds = best_of(
+                    repeat,
+                    lambda extractor=extractor: [
+                        extractor.extract(html, url) for url, html in details
+                    ],
+                )
+                self.record(
+                    f"detail_extract.{name}", size, seconds, len(details), "pages"
+                )
+
+        if not any(map(self.wanted, ("aggregate", "render", "scraper_main"))):
+            return checks
+        with ReplayServer(recording, latency=self.args.latency) as server:
+            session = replay_session(server.url)
+            listings = self._listings(session)
+
+            if self.wanted("aggregate"):
+                scraper = bench_scraper(fixtures.BENCH_USER, session)
+                seconds = best_of(
+                    repeat,
+                    scraper._prepare_report,
+                    setup=lambda: [p.copy() for p in listings],
+                )
+                self.record("aggregate", size, seconds, len(listings), "listings")
+
+            if self.wanted("render"):
+                scraper = bench_scraper(fixtures.BENCH_USER, session)
+                selection = scraper._prepare_report([p.copy() for p in listings])
+
+                def render(renderer):
+                    scraper.renderer = renderer
+                    scraper._send_report(selection, {})
+
+                n = len(selection.report_properties)
+                seconds = best_of(repeat, render, setup=ReportRenderer)
+                self.record("render.cold", size, seconds, n, "listings")
+                warm = ReportRenderer()
+                render(warm)
+                seconds = best_of(repeat, render, setup=lambda: warm)
+                self.record("render.warm", size, seconds, n, "listings")
+
+            if self.wanted("scraper_main"):
+                server.hits = 0
+                seconds = best_of(
+                    repeat,
+                    lambda scraper: scraper.main(),
+                    setup=lambda: bench_scraper(
+                        fixtures.BENCH_USER, session, renderer=ReportRenderer()
+                    ),
+                )
+                requests_per_run = server.hits // repeat
+                self.record("scraper_main", size, seconds, len(listings), "listings")
+                checks["scraper_main_requests"] = requests_per_run
+            if server.misses:
+                checks["replay_misses"] = sorted(set(server.misses))[:20]
+        return checks
+
+    def _listings(self, session) -> list:
+        """Every listing with its details, as Scraper.main would have them."""
+        scraper = bench_scraper(fixtures.BENCH_USER, session)
+        listings = scraper._scrape_and_check_details()
+        return listings
+
+    def run_startup(self) -> dict:
+        """Time `import scraper` and list the LAZY_MODULES it imports."""
+        seconds = float("inf")
+        for _ in range(self.args.repeat):
+            times = import_times("scraper")
+            seconds = min(seconds, times["scraper"])
+        self.record("startup", 0, seconds, 1, "imports")
+        eager = sorted({name.split(".")[0] for name in times} & set(LAZY_MODULES))
+        return {"startup_eager_imports": eager or "ok"}
+
+    def run(self) -> dict:
+        # The scraper sleeps between search pages without a rate limiter; pace
+        # nothing here so that only the code is measured.
+        http_client.configure(rate_limiter=RateLimiter(rate=1e9, burst=10**9))
+        checks = {}
+        if self.wanted("startup"):
+            print("startup")
+            checks["startup"] = self.run_startup()
+        sized = any(self.wanted(name) for name in BENCHMARKS if name != "startup")
+        for size in self.args.sizes if sized else ():
+            print(f"{size} listings")
+            if self.args.recording:
+                recording = Cassette(self.args.recording, cache_bodies=True)
+            else:
+                recording = fixture_recording(size, self.args.seed, self.args.detail_kb)
+            checks[str(size)] = self.run_size(size, recording)
+        return {
+            "meta": environment(self.args),
+            "checks": checks,
+            "results": self.results,
+        }
+
+
+def environment(args) -> dict:
+    def has(module):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            return False
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "optional": {m: has(m) for m in ("lxml", "numpy", "PIL", "aiohttp")},
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "detail_kb": args.detail_kb,
+        "latency_ms": args.latency * 1000,
+        "recording": args.recording,
+    }
+
+
+def compare(report: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"compared with {baseline_path} (>1.00x is faster now)")
+    for result in report["results"]:
+        old = baseline.get((result["name"], result["size"]))
+        if old and result["seconds"]:
+            print(
+                f"  {result['name']:<24} {result['size']:>6}  "
+                f"{old['seconds'] / result['seconds']:6.2f}x"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda s: [int(n) for n in s.split(",")],
+        default=[100, 1000],
+        help="Listing counts to benchmark (default: 100,1000).",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--detail-kb", type=int, default=60)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Delay the replay server adds to every response (default: none).",
+    )
+    parser.add_argument(
+        "--recording",
+        metavar="DIR",
+        help="Benchmark this cassette (e.g. from scraper.py --record) instead of generated fixtures.",
+    )
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS)
+    parser.add_argument("--output", metavar="FILE")
+    parser.add_argument("--compare", metavar="BASELINE.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = Suite(args).run()
+    for size, checks in report["checks"].items():
+        print(f"checks ({size}): {checks}")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, time.strftime("bench-%Y%m%d-%H%M%S.json")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results: {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+    failed = any(
+        checks.get("card_parser_parity", "ok") != "ok"
+        or checks.get("startup_eager_imports", "ok") != "ok"
+        or checks.get("replay_misses")
+        for checks in report["checks"].values()
+    )
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""HTTP cassettes: record a run's traffic to disk and replay it offline.
+
+``--record DIR`` sends requests as usual and stores every response the run gets
+(search pages, detail pages, images) plus the Brevo email send in a cassette;
+``--replay DIR`` answers the same requests from it, with optional latency, so a
+run is reproducible and never touches the network or sends an email.
+
+A cassette is a directory with ``manifest.json`` and the response bodies:
+
+    {"version": 1,
+     "responses": {"GET https://fasteignir.visir.is/ajaxsearch/getresults?...&page=1":
+                   {"status": 200, "headers": {"Content-Type": "..."},
+                    "body": "bodies/3f2a….html.gz", "elapsed": 0.412}}}
+
+Keys are request_key(): method plus the URL with its query parameters sorted,
+so the order the parameters were sent in does not matter. Bodies are named by
+content hash, so identical responses are stored once, and text bodies are
+gzipped. Recording into an existing cassette adds to it (a later response for
+the same request replaces the earlier one). Requests missing from a cassette
+replay as 404 and are counted in stats().
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qsl, quote, urlencode, urljoin, urlsplit, urlunsplit
+
+MANIFEST = "manifest.json"
+BREVO_SEND_URL = "https://api.brevo.com/v3/smtp/email"
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+# Not meaningful once the body is stored decoded.
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+_TEXT_TYPES = ("text/", "application/json", "application/xml", "application/javascript")
+_EXTENSIONS = {
+    "text/html": ".html",
+    "application/json": ".json",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+
+def request_key(method: str, url: str) -> str:
+    """Canonical "METHOD url" for a request (query parameters sorted)."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    path = quote(parts.path or "/", safe="/%:@!$&'()*+,;=-._~")
+    return f"{method.upper()} " + urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, query, "")
+    )
+
+
+def email_url(to_email: str, user: str) -> str:
+    """The cassette URL of one user's Brevo send (the API URL is the same for all)."""
+    return f"{BREVO_SEND_URL}?{urlencode({'to': to_email, 'user': user})}"
+
+
+def _header(headers: dict, name: str) -> Optional[str]:
+    name = name.lower()
+    return next((v for k, v in headers.items() if k.lower() == name), None)
+
+
+def content_charset(headers: dict) -> Optional[str]:
+    """charset parameter of the Content-Type header, or None."""
+    from email.message import Message
+
+    message = Message()
+    message["Content-Type"] = _header(headers, "Content-Type") or ""
+    return message.get_content_charset()
+
+
+class Replayed(NamedTuple):
+    status: int
+    headers: dict
+    content: bytes
+    delay: float  # seconds to wait before answering
+
+
+class Cassette:
+    """A manifest of responses plus the directory holding their bodies; thread-safe.
+
+    record: add the responses passed to record() (save() writes the manifest);
+    otherwise replay() answers from the cassette.
+    latency: seconds every replayed response is delayed by;
+    recorded_latency: delay each one by the time it took when recorded instead.
+    cache_bodies: keep bodies in memory once read (for replaying a cassette
+    many times over).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        record: bool = False,
+        latency: float = 0.0,
+        recorded_latency: bool = False,
+        cache_bodies: bool = False,
+    ):
+        self.directory = directory
+        self.recording = record
+        self.latency = latency
+        self.recorded_latency = recorded_latency
+        self.responses: dict[str, dict] = {}
+        self._bodies: Optional[dict[str, bytes]] = {} if cache_bodies else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._missed: set = set()
+        path = os.path.join(directory, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.responses = json.load(f)["responses"]
+
+    @property
+    def replaying(self) -> bool:
+        return not self.recording
+
+    def add(self, key: str, status: int, headers: dict, body_name: str, **extra):
+        with self._lock:
+            self.responses[key] = {
+                "status": status,
+                "headers": headers,
+                "body": body_name,
+                **extra,
+            }
+
+    def write_body(self, name: str, content: bytes):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = gzip.compress(content, mtime=0) if name.endswith(".gz") else content
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def store_body(self, content: bytes, content_type: Optional[str]) -> str:
+        """Write content under its hash (once) and return its name."""
+        mime = (content_type or "").split(";")[0].strip().lower()
+        name = "bodies/" + hashlib.sha1(content).hexdigest()[:20]
+        name += _EXTENSIONS.get(mime, ".bin")
+        if mime.startswith(_TEXT_TYPES):
+            name += ".gz"
+        if not os.path.exists(os.path.join(self.directory, name)):
+            self.write_body(name, content)
+        return name
+
+    def record(
+        self,
+        method: str,
+        url: str,
+        status: int,
+        headers,
+        content: bytes,
+        elapsed: float,
+        request_body: Optional[bytes] = None,
+    ):
+        """Store one response (and optionally the request body that produced it)."""
+        headers = {
+            name: value
+            for name, value in headers.items()
+            if name.lower() not in _DROPPED_HEADERS
+        }
+        extra = {"elapsed": round(elapsed, 3)}
+        if request_body is not None:
+            extra["request_body"] = self.store_body(request_body, "text/html")
+        self.add(
+            request_key(method, url),
+            status,
+            headers,
+            self.store_body(content, _header(headers, "Content-Type")),
+            **extra,
+        )
+        with self._lock:
+            self.recorded += 1
+
+    def save(self):
+        """Write the manifest (atomically)."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, MANIFEST)
+        with self._lock:
+            manifest = {"version": 1, "responses": dict(self.responses)}
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def body(self, name: str) -> bytes:
+        if self._bodies is not None and name in self._bodies:
+            return self._bodies[name]
+        with open(os.path.join(self.directory, name), "rb") as f:
+            content = f.read()
+        if name.endswith(".gz"):
+            content = gzip.decompress(content)
+        if self._bodies is not None:
+            self._bodies[name] = content
+        return content
+
+    def lookup(self, key: str) -> Optional[tuple[int, dict, bytes]]:
+        entry = self.responses.get(key)
+        if entry is None:
+            return None
+        return entry["status"], entry["headers"], self.body(entry["body"])
+
+    def bodies(self, prefix: str) -> list:
+        """[(key, body)] for the responses whose key starts with prefix."""
+        return [
+            (key, self.body(entry["body"]))
+            for key, entry in sorted(self.responses.items())
+            if key.startswith(prefix)
+        ]
+
+    def replay(self, method: str, url: str, follow_redirects: bool = False) -> Replayed:
+        """The recorded response to a request (404 when it was not recorded).
+
+        follow_redirects: answer with the end of a recorded redirect chain, for
+        clients that follow redirects themselves (aiohttp).
+        """
+        key = request_key(method, url)
+        entry = self.responses.get(key)
+        for _ in range(MAX_REDIRECTS if follow_redirects else 0):
+            if entry is None or entry["status"] not in REDIRECT_STATUSES:
+                break
+            location = _header(entry["headers"], "Location")
+            if not location:
+                break
+            url = urljoin(url, location)
+            entry = self.responses.get(request_key("GET", url))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                first_miss = key not in self._missed
+                self._missed.add(key)
+            else:
+                self.hits += 1
+        if entry is None:
+            if first_miss:
+                logging.warning("Not in cassette, replaying 404: %s", key)
+            return Replayed(404, {}, b"", self.latency)
+        delay = entry.get("elapsed", 0.0) if self.recorded_latency else self.latency
+        return Replayed(
+            entry["status"], dict(entry["headers"]), self.body(entry["body"]), delay
+        )
+
+    def same_request_body(self, method: str, url: str, content: bytes) -> bool:
+        """Whether content is the request body recorded for this request."""
+        entry = self.responses.get(request_key(method, url)) or {}
+        recorded = entry.get("request_body")
+        return recorded is not None and recorded.startswith(
+            "bodies/" + hashlib.sha1(content).hexdigest()[:20]
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": "record" if self.recording else "replay",
+                "responses": len(self.responses),
+                "recorded": self.recorded,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,96 @@
+"""requests transport adapter behind http_client's shared session.
+
+PolicyAdapter paces every request through a RateLimiter, retries failures with a
+RetryPolicy, and records responses to (or replays them from) a Cassette.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from cassette import Cassette
+from rate_limiter import RateLimiter, retry_after_seconds
+from retry_policy import RetryPolicy
+
+# Failures worth another attempt (DNS, refused/reset connections, timeouts).
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+class PolicyAdapter(HTTPAdapter):
+    """HTTPAdapter that paces requests through a RateLimiter and retries them."""
+
+    def __init__(
+        self,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cassette: Optional[Cassette] = None,
+        **kwargs,
+    ):
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.retry_policy is None:
+            return self._send_once(request, **kwargs)
+        return self.retry_policy.send(
+            request.url, lambda: self._send_once(request, **kwargs), RETRY_EXCEPTIONS
+        )
+
+    def _send_once(self, request, **kwargs):
+        if self.rate_limiter is None:
+            return self._transmit(request, **kwargs)
+        bucket = self.rate_limiter.bucket(request.url)
+        bucket.acquire()
+        start = time.monotonic()
+        try:
+            response = self._transmit(request, **kwargs)
+        except requests.RequestException:
+            bucket.observe(None, time.monotonic() - start)
+            raise
+        bucket.observe(
+            response.status_code,
+            time.monotonic() - start,
+            retry_after_seconds(response.headers.get("Retry-After")),
+        )
+        return response
+
+    def _transmit(self, request, **kwargs):
+        """Send over the network, recording the response, or replay it."""
+        if self.cassette is None:
+            return super().send(request, **kwargs)
+        if self.cassette.replaying:
+            replayed = self.cassette.replay(request.method, request.url)
+            if replayed.delay:
+                time.sleep(replayed.delay)
+            return self._replayed_response(request, replayed)
+        start = time.monotonic()
+        response = super().send(request, **kwargs)
+        self.cassette.record(
+            request.method,
+            request.url,
+            response.status_code,
+            response.headers,
+            response.content,
+            time.monotonic() - start,
+        )
+        return response
+
+    def _replayed_response(self, request, replayed) -> requests.Response:
+        response = requests.Response()
+        response.status_code = replayed.status
+        response.headers = CaseInsensitiveDict(replayed.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = replayed.content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
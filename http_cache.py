@@ -0,0 +1,260 @@
+"""HTTP response cache for detail pages, keyed by URL.
+
+ResponseCache.fetch() serves a stored response while it is younger than the TTL.
+Once it is stale, the request is sent with If-None-Match / If-Modified-Since when
+the server gave us an ETag / Last-Modified, and a 304 just refreshes the entry.
+Entries are evicted least-recently-used first once the cache exceeds max_bytes.
+
+DiskResponseCache stores the entries on disk, so they survive restarts and a
+daily run reuses yesterday's pages.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+DEFAULT_CACHE_DIR = ".http_cache"
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class UncachedNotModifiedError(Exception):
+    """A 304 answered a request for a page the cache has no entry for."""
+
+
+@dataclass
+class CachedResponse:
+    """The parts of a requests.Response the scraper reads (.text/.content/.headers)."""
+
+    url: str
+    status_code: int
+    content: bytes
+    encoding: Optional[str] = None
+    headers: dict = field(default_factory=dict)
+    stored_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_response(cls, url: str, response) -> CachedResponse:
+        keep = ("Content-Type", "ETag", "Last-Modified", "Cache-Control")
+        return cls(
+            url=url,
+            status_code=response.status_code,
+            content=response.content,
+            encoding=response.encoding or response.apparent_encoding,
+            headers={k: response.headers[k] for k in keep if k in response.headers},
+        )
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def raise_for_status(self):
+        """Cached entries are always successful responses."""
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+    def validators(self) -> dict:
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.headers.get("ETag"):
+            headers["If-None-Match"] = self.headers["ETag"]
+        if self.headers.get("Last-Modified"):
+            headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return headers
+
+
+class ResponseCache(ABC):
+    """Base class: TTL, conditional revalidation, LRU bookkeeping and counters.
+
+    Subclasses store entries via _load / _store / _delete.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[str, int] = OrderedDict()  # key -> size, oldest first
+        self._total_bytes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    @abstractmethod
+    def _load(self, key: str) -> Optional[CachedResponse]:
+        """The entry stored under key, or None."""
+
+    @abstractmethod
+    def _store(self, key: str, entry: CachedResponse) -> int:
+        """Persist entry; returns the bytes it occupies."""
+
+    @abstractmethod
+    def _delete(self, key: str):
+        """Remove the entry stored under key, if any."""
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._lru),
+                "bytes": self._total_bytes,
+            }
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        key = self._key(url)
+        with self._lock:
+            if key not in self._lru:
+                return None
+            self._lru.move_to_end(key)
+        return self._load(key)
+
+    def put(self, url: str, entry: CachedResponse):
+        if "no-store" in entry.headers.get("Cache-Control", ""):
+            return
+        key = self._key(url)
+        size = self._store(key, entry)
+        with self._lock:
+            self._total_bytes -= self._lru.pop(key, 0)
+            self._lru[key] = size
+            self._total_bytes += size
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._lru) > 1:
+                old_key, old_size = self._lru.popitem(last=False)
+                self._total_bytes -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._delete(old_key)
+
+    def fetch(self, url: str, get, headers: Optional[dict] = None, **kwargs):
+        """GET url through the cache; get is the transport (e.g. requests.get).
+
+        Returns a CachedResponse; raises whatever get / raise_for_status raise.
+        """
+        entry, request_headers = self._lookup(url, headers)
+        if request_headers is None:
+            return entry
+        return self._complete(url, entry, get(url, headers=request_headers, **kwargs))
+
+    async def afetch(self, url: str, get, headers: Optional[dict] = None, **kwargs):
+        """fetch() for coroutine transports: get(...) must be awaitable."""
+        entry, request_headers = self._lookup(url, headers)
+        if request_headers is None:
+            return entry
+        return self._complete(
+            url, entry, await get(url, headers=request_headers, **kwargs)
+        )
+
+    def _lookup(self, url, headers):
+        """(fresh entry, None) on a hit, else (stale entry or None, request headers)."""
+        entry = self.get(url)
+        if entry is not None and time.time() - entry.stored_at < self.ttl_seconds:
+            with self._lock:
+                self.hits += 1
+            return entry, None
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            request_headers.update(entry.validators())
+        return entry, request_headers
+
+    def _complete(self, url, entry, response) -> CachedResponse:
+        if response.status_code == 304:
+            if entry is None:
+                raise UncachedNotModifiedError(f"304 Not Modified for {url}")
+            entry.stored_at = time.time()
+            self.put(url, entry)
+            with self._lock:
+                self.revalidated += 1
+            return entry
+
+        response.raise_for_status()
+        entry = CachedResponse.from_response(url, response)
+        self.put(url, entry)
+        with self._lock:
+            self.misses += 1
+        return entry
+
+
+class DiskResponseCache(ResponseCache):
+    """One file per URL: a JSON metadata line followed by the raw body.
+
+    Recency survives restarts through the files' mtimes.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._lru[name] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            logging.warning("HTTP cache: dropping unreadable entry %s: %s", key, e)
+            with self._lock:
+                self._total_bytes -= self._lru.pop(key, 0)
+            return None
+        return CachedResponse(content=content, **meta)
+
+    def _store(self, key, entry):
+        meta = {
+            "url": entry.url,
+            "status_code": entry.status_code,
+            "encoding": entry.encoding,
+            "headers": entry.headers,
+            "stored_at": entry.stored_at,
+        }
+        path = self._path(key)
+        header = json.dumps(meta).encode("utf-8") + b"\n"
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(entry.content)
+        os.replace(tmp, path)
+        return len(header) + entry.size
+
+    def _delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,108 @@
+"""Process-wide keep-alive HTTP session shared by every Scraper.
+
+One requests.Session means one urllib3 connection pool per host, so search pages,
+detail pages and images reuse TCP/TLS connections instead of handshaking for every
+request. urllib3's pools are thread-safe; the session is shared by all scheduler
+and detail-check threads.
+
+With a RateLimiter configured, every request the session sends (search pages,
+detail pages, images, cache revalidations) first waits for its host's token and
+reports its status and latency back, so all users and threads share one budget.
+With a RetryPolicy, failed requests are retried with backoff behind the host's
+circuit breaker. With a Cassette, responses are recorded to it or, when replaying,
+answered from it instead of the network (pacing and retries still apply).
+
+requests (and http_adapter.PolicyAdapter, which does the above) is imported when
+the session is first needed, so importing this module to configure it is cheap.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from cassette import Cassette
+from rate_limiter import RateLimiter
+from retry_policy import RetryPolicy
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_POOL_SIZE = 20
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_pool_size = DEFAULT_POOL_SIZE
+_rate_limiter: Optional[RateLimiter] = None
+_retry_policy: Optional[RetryPolicy] = None
+_cassette: Optional[Cassette] = None
+
+
+def configure(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    cassette: Optional[Cassette] = None,
+):
+    """Set the per-host pool size, rate limiter, retry policy and cassette.
+
+    Drops the current session, if any.
+    """
+    global _pool_size, _rate_limiter, _retry_policy, _cassette
+    with _lock:
+        _pool_size = pool_size
+        _rate_limiter = rate_limiter
+        _retry_policy = retry_policy
+        _cassette = cassette
+        _close_locked()
+
+
+def rate_limiter() -> Optional[RateLimiter]:
+    """The limiter shared requests go through, or None when unthrottled."""
+    return _rate_limiter
+
+
+def retry_policy() -> Optional[RetryPolicy]:
+    return _retry_policy
+
+
+def cassette() -> Optional[Cassette]:
+    """The cassette shared requests are recorded to or replayed from, if any."""
+    return _cassette
+
+
+def shared_session(default_headers: Optional[dict] = None) -> requests.Session:
+    """Return the shared session, creating it with default_headers on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+
+            from http_adapter import PolicyAdapter
+
+            session = requests.Session()
+            adapter = PolicyAdapter(
+                _rate_limiter,
+                _retry_policy,
+                _cassette,
+                pool_connections=8,
+                pool_maxsize=_pool_size,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if default_headers:
+                session.headers.update(default_headers)
+            _session = session
+        return _session
+
+
+def close():
+    with _lock:
+        _close_locked()
+
+
+def _close_locked():
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
@@ -0,0 +1,390 @@
+"""Listing pictures for the report email: fetched, shrunk, cached and embedded.
+
+- Every distinct image URL is fetched once per process, concurrently (a thread
+  pool for the thread engine, coroutines for the asyncio engine), even when
+  several users report the same listing.
+- With a cache directory, images are stored on disk under the SHA-256 of their
+  content plus a URL -> content-hash index, so one picture reachable through two
+  URLs is kept once and later runs do not download it again.
+- With Pillow installed, pictures wider or taller than max_px (or bigger than
+  max_image_bytes) are re-encoded as JPEG thumbnails. Without Pillow they are
+  embedded as downloaded, and skipped when over max_image_bytes.
+- embed() returns {image_url: data URI} for the listings, in report order, whose
+  pictures fit in budget_bytes; the rest keep their remote image_url.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import asyncio
+
+DEFAULT_IMAGE_CACHE_DIR = ".image_cache"
+DEFAULT_BUDGET_BYTES = 2 * 1024 * 1024
+DEFAULT_MAX_PX = 600
+DEFAULT_MAX_IMAGE_BYTES = 500 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_CACHE_MAX_BYTES = 100 * 1024 * 1024
+# How long a URL -> image mapping is trusted before the URL is fetched again.
+URL_TTL_SECONDS = 7 * 24 * 3600
+# Processed images kept in memory for the other users of a batch.
+MEMORY_BYTES = 32 * 1024 * 1024
+
+EMBEDDABLE_TYPES = ("image/jpeg", "image/png", "image/gif", "image/webp")
+THUMBNAIL_QUALITY = 80
+
+
+@dataclass
+class EmbeddedImage:
+    content: bytes
+    content_type: str
+
+    def data_uri(self) -> str:
+        b64 = base64.b64encode(self.content).decode("ascii")
+        return f"data:{self.content_type};base64,{b64}"
+
+
+def _embeddable_type(content_type: Optional[str]) -> str:
+    content_type = (content_type or "image/jpeg").split(";")[0].strip()
+    return content_type if content_type in EMBEDDABLE_TYPES else "image/jpeg"
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImagePipeline:
+    """Shared by every Scraper of a batch (like the HTTP response cache)."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        budget_bytes: int = DEFAULT_BUDGET_BYTES,
+        max_px: int = DEFAULT_MAX_PX,
+        max_image_bytes: int = DEFAULT_MAX_IMAGE_BYTES,
+        workers: int = DEFAULT_WORKERS,
+        max_cache_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ):
+        """cache_dir: on-disk image cache (None keeps images in memory only).
+
+        budget_bytes: total size of the data URIs embedded in one email.
+        max_px: longest side of the thumbnails (0 keeps the original size).
+        max_cache_bytes: images on disk beyond this are pruned, oldest use first.
+        """
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.max_px = max_px
+        self.max_image_bytes = max_image_bytes
+        self.workers = workers
+        self.max_cache_bytes = max_cache_bytes
+        if cache_dir:
+            os.makedirs(os.path.join(cache_dir, "urls"), exist_ok=True)
+            os.makedirs(os.path.join(cache_dir, "images"), exist_ok=True)
+            self.prune()
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, EmbeddedImage] = OrderedDict()
+        self._memory_bytes = 0
+        self._pending: dict[str, Future] = {}
+        self._apending: dict[str, asyncio.Future] = {}
+        self._pillow = None
+        self.fetched = 0
+        self.disk_hits = 0
+        self.memory_hits = 0
+        self.failed = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "fetched": self.fetched,
+                "disk_hits": self.disk_hits,
+                "memory_hits": self.memory_hits,
+                "failed": self.failed,
+            }
+
+    # -- embedding ---------------------------------------------------------------
+
+    @staticmethod
+    def _wanted(props: list) -> list:
+        """[(image_url, referer)] for props with a remote picture, deduplicated."""
+        seen = set()
+        wanted = []
+        for prop in props:
+            url = prop.image_url or ""
+            if url.startswith("http") and url not in seen:
+                seen.add(url)
+                wanted.append((url, prop.link))
+        return wanted
+
+    def embed(self, props: list, fetch, wrap=None) -> dict:
+        """{image_url: data URI} for props; fetch(url, referer) -> (bytes, content type).
+
+        wrap: applied to the per-image work run in the worker threads (e.g.
+        Profiler.wrap).
+        """
+        wanted = self._wanted(props)
+        if not wanted or self.budget_bytes <= 0:
+            return {}
+
+        def work(w):
+            return self.get(w[0], w[1], fetch)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            images = list(executor.map(wrap(work) if wrap else work, wanted))
+        return self._within_budget(wanted, images)
+
+    async def aembed(self, props: list, afetch) -> dict:
+        """embed() for coroutine transports: afetch(url, referer) must be awaitable."""
+        import asyncio
+
+        wanted = self._wanted(props)
+        if not wanted or self.budget_bytes <= 0:
+            return {}
+        images = await asyncio.gather(*(self.aget(u, r, afetch) for u, r in wanted))
+        return self._within_budget(wanted, images)
+
+    def _within_budget(self, wanted, images) -> dict:
+        data_uris = {}
+        total = 0
+        for (url, _), image in zip(wanted, images):
+            if image is None:
+                continue
+            uri = image.data_uri()
+            if total + len(uri) > self.budget_bytes:
+                continue
+            data_uris[url] = uri
+            total += len(uri)
+        logging.info(
+            "Embedded %d of %d listing image(s) (%d KB of %d KB budget).",
+            len(data_uris),
+            len(wanted),
+            total // 1024,
+            self.budget_bytes // 1024,
+        )
+        return data_uris
+
+    # -- one image ---------------------------------------------------------------
+
+    def get(self, url: str, referer, fetch) -> Optional[EmbeddedImage]:
+        """The processed image at url; concurrent callers share one download."""
+        with self._lock:
+            if url in self._memory:
+                self._memory.move_to_end(url)
+                self.memory_hits += 1
+                return self._memory[url]
+            future = self._pending.get(url)
+            owner = future is None
+            if owner:
+                future = self._pending[url] = Future()
+        if not owner:
+            return future.result()
+
+        image = None
+        try:
+            image = self._load(url)
+            if image is None:
+                content, content_type = fetch(url, referer)
+                image = self._process_and_store(url, content, content_type)
+        except Exception as e:
+            logging.debug("Image %s not embedded: %s", url, e)
+        self._finish(url, image)
+        future.set_result(image)
+        return image
+
+    async def aget(self, url: str, referer, afetch) -> Optional[EmbeddedImage]:
+        import asyncio
+
+        with self._lock:
+            if url in self._memory:
+                self._memory.move_to_end(url)
+                self.memory_hits += 1
+                return self._memory[url]
+        if url in self._apending:
+            return await asyncio.shield(self._apending[url])
+        future = self._apending[url] = asyncio.get_running_loop().create_future()
+
+        image = None
+        try:
+            image = await asyncio.to_thread(self._load, url)
+            if image is None:
+                content, content_type = await afetch(url, referer)
+                image = await asyncio.to_thread(
+                    self._process_and_store, url, content, content_type
+                )
+        except Exception as e:
+            logging.debug("Image %s not embedded: %s", url, e)
+        finally:
+            # Also on cancellation, so that other waiters are not left hanging.
+            self._finish(url, image)
+            del self._apending[url]
+            future.set_result(image)
+        return image
+
+    def _finish(self, url, image):
+        """Remember a processed image; failures are retried by the next caller."""
+        with self._lock:
+            self._pending.pop(url, None)
+            if image is None:
+                self.failed += 1
+                return
+            self._memory[url] = image
+            self._memory_bytes += len(image.content)
+            while self._memory_bytes > MEMORY_BYTES and len(self._memory) > 1:
+                _, old = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old.content)
+
+    def _process_and_store(
+        self, url, content: bytes, content_type
+    ) -> Optional[EmbeddedImage]:
+        with self._lock:
+            self.fetched += 1
+        # The thumbnail only depends on the bytes, so it is stored by their hash.
+        image_key = f"{_sha256(content)}-{self.max_px}"
+        image = self._read_image(image_key)
+        if image is None:
+            image = self._process(content, content_type)
+            if image is None:
+                return None
+            if self.cache_dir:
+                self._write_image(image_key, image)
+        if self.cache_dir:
+            self._write_url_entry(url, image_key)
+        return image
+
+    def _process(self, content: bytes, content_type) -> Optional[EmbeddedImage]:
+        image = EmbeddedImage(content, _embeddable_type(content_type))
+        if self.max_px > 0:
+            image = self._thumbnail(image) or image
+        if len(image.content) > self.max_image_bytes:
+            return None
+        return image
+
+    def _thumbnail(self, image: EmbeddedImage) -> Optional[EmbeddedImage]:
+        """JPEG thumbnail when image is over max_px / max_image_bytes (needs Pillow)."""
+        if self._pillow is None:
+            try:
+                from PIL import Image
+            except ImportError:
+                Image = False
+            self._pillow = Image
+        Image = self._pillow
+        if not Image:
+            return None
+        try:
+            with Image.open(io.BytesIO(image.content)) as img:
+                if (
+                    max(img.size) <= self.max_px
+                    and len(image.content) <= self.max_image_bytes
+                ):
+                    return None
+                img.thumbnail((self.max_px, self.max_px))
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                out = io.BytesIO()
+                img.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        except Exception as e:
+            logging.debug("Could not downscale image: %s", e)
+            return None
+        return EmbeddedImage(out.getvalue(), "image/jpeg")
+
+    # -- disk cache --------------------------------------------------------------
+    # urls/<sha256 of url>: JSON {"image": image key, "stored_at": ...}
+    # images/<sha256 of downloaded bytes>-<max_px>: content type line + image bytes
+
+    def _url_path(self, url):
+        return os.path.join(self.cache_dir, "urls", _sha256(url.encode("utf-8")))
+
+    def _image_path(self, image_key):
+        return os.path.join(self.cache_dir, "images", image_key)
+
+    def _load(self, url) -> Optional[EmbeddedImage]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._url_path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("stored_at", 0) >= URL_TTL_SECONDS:
+            return None
+        if not entry.get("image", "").endswith(f"-{self.max_px}"):
+            return None  # stored at another thumbnail size
+        image = self._read_image(entry["image"])
+        if image is not None:
+            with self._lock:
+                self.disk_hits += 1
+        return image
+
+    def _read_image(self, image_key) -> Optional[EmbeddedImage]:
+        if not self.cache_dir:
+            return None
+        path = self._image_path(image_key)
+        try:
+            with open(path, "rb") as f:
+                content_type = f.readline().decode("ascii").strip()
+                content = f.read()
+            os.utime(path)
+        except (OSError, UnicodeDecodeError):
+            return None
+        return EmbeddedImage(content, content_type)
+
+    def _write_image(self, image_key, image: EmbeddedImage):
+        header = image.content_type.encode("ascii") + b"\n"
+        self._write(self._image_path(image_key), header + image.content)
+
+    def _write_url_entry(self, url, image_key):
+        entry = {"image": image_key, "stored_at": time.time()}
+        self._write(self._url_path(url), json.dumps(entry).encode("utf-8"))
+
+    def _write(self, path, data: bytes):
+        if not self.cache_dir:
+            return
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def prune(self):
+        """Drop expired URL entries and the least recently used images over
+        max_cache_bytes (on creation, and after every batch)."""
+        if not self.cache_dir:
+            return
+        now = time.time()
+        urls_dir = os.path.join(self.cache_dir, "urls")
+        for name in os.listdir(urls_dir):
+            path = os.path.join(urls_dir, name)
+            try:
+                if now - os.path.getmtime(path) >= URL_TTL_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+        images_dir = os.path.join(self.cache_dir, "images")
+        images = []
+        for name in os.listdir(images_dir):
+            try:
+                st = os.stat(os.path.join(images_dir, name))
+            except OSError:
+                continue
+            images.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in images)
+        for _, size, name in sorted(images):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(os.path.join(images_dir, name))
+            except OSError:
+                pass
+            total -= size
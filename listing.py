@@ -0,0 +1,155 @@
+"""Listing: one property from the search results.
+
+Price, size, room and bedroom counts are parsed from the card text once, when the
+card is read, and kept as numbers; the display strings are produced by the
+format_* helpers where a listing is printed, emailed or fingerprinted. __slots__
+keeps each listing to a fixed set of attributes (no per-instance dict).
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+
+def parse_price(text: Optional[str]) -> Optional[int]:
+    """Card price text as an int ("45.900.000 kr" -> 45900000); None for "Tilboð"."""
+    try:
+        return int(text.replace(".", "").replace(" kr", ""))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def parse_size(text: Optional[str]) -> Optional[float]:
+    """Card size text as a float ("80,5 m²" -> 80.5)."""
+    try:
+        return float(text.replace("m²", "").replace(",", "."))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def parse_count(text: Optional[str]) -> Optional[int]:
+    try:
+        return int(text)
+    except (ValueError, TypeError):
+        return None
+
+
+def format_thousands(value: int) -> str:
+    """1234567 -> "1.234.567" (Icelandic grouping)."""
+    return f"{value:,}".replace(",", ".")
+
+
+def format_price(price: Optional[int]) -> str:
+    return "N/A" if price is None else f"{format_thousands(price)} kr"
+
+
+def format_size(size: Optional[float]) -> str:
+    if size is None:
+        return "N/A"
+    number = f"{size:f}".rstrip("0").rstrip(".")
+    return f"{number.replace('.', ',')} m²"
+
+
+def format_count(count: Optional[int]) -> str:
+    return "N/A" if count is None else str(count)
+
+
+class Listing:
+    """A search result card plus the details filled in from its detail page.
+
+    Detail fields (has_*, build_year, fasteignamat) stay None until checked;
+    payments (mortgage.Payment per loan product) until LoanCalculator.attach();
+    market (price_history.MarketPosition) until PriceHistory.attach().
+    """
+
+    __slots__ = (
+        "link",
+        "address",
+        "price",
+        "size_m2",
+        "total_rooms",
+        "bedrooms",
+        "price_per_m2",
+        "image_url",
+        "has_balcony",
+        "has_terrace",
+        "has_garage",
+        "build_year",
+        "fasteignamat",
+        "payments",
+        "market",
+    )
+
+    def __init__(
+        self,
+        link: Optional[str],
+        address: Optional[str],
+        price: Optional[int] = None,
+        size_m2: Optional[float] = None,
+        total_rooms: Optional[int] = None,
+        bedrooms: Optional[int] = None,
+        image_url: Optional[str] = None,
+        has_balcony: Optional[bool] = None,
+        has_terrace: Optional[bool] = None,
+        has_garage: Optional[bool] = None,
+        build_year: Optional[str] = None,
+        fasteignamat: Optional[str] = None,
+    ):
+        self.link = link
+        self.address = address
+        self.price = price
+        self.size_m2 = size_m2
+        self.total_rooms = total_rooms
+        self.bedrooms = bedrooms
+        self.price_per_m2 = (
+            int(price / size_m2) if price and size_m2 and size_m2 > 0 else None
+        )
+        self.image_url = image_url
+        self.has_balcony = has_balcony
+        self.has_terrace = has_terrace
+        self.has_garage = has_garage
+        self.build_year = build_year
+        self.fasteignamat = fasteignamat
+        self.payments = None
+        self.market = None
+
+    @classmethod
+    def from_card_text(
+        cls,
+        link: Optional[str],
+        address: Optional[str],
+        price: Optional[str],
+        size: Optional[str],
+        rooms: Optional[str],
+        bedrooms: Optional[str],
+        image_url: Optional[str] = None,
+    ) -> Listing:
+        """Listing from the raw card strings (None where the card lacks a field).
+
+        A card without a bedroom count is taken to have one bedroom.
+        """
+        return cls(
+            link=link,
+            address=address,
+            price=parse_price(price),
+            size_m2=parse_size(size),
+            total_rooms=parse_count(rooms),
+            bedrooms=1 if bedrooms is None else parse_count(bedrooms),
+            image_url=image_url,
+        )
+
+    def copy(self) -> Listing:
+        new = Listing.__new__(Listing)
+        for name in self.__slots__:
+            setattr(new, name, getattr(self, name))
+        return new
+
+    def __eq__(self, other):
+        if not isinstance(other, Listing):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n) for n in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Listing({self.address!r}, {format_price(self.price)}, {self.link!r})"
@@ -0,0 +1,246 @@
+"""Search-result card parsers for /ajaxsearch/getresults pages.
+
+Every backend finds the same estate cards and returns the same Listings as the
+original BeautifulSoup(html, "html.parser") code:
+
+- "soup": full html.parser tree (the original, kept as the fallback).
+- "strainer": html.parser, but a SoupStrainer only builds the estate__item subtrees.
+- "lxml": lxml.html with precompiled XPath (needs lxml; the fastest).
+
+"auto" picks lxml when it is installed and otherwise the strainer. Each backend
+imports its library when it is created, so bs4 is not loaded when lxml is used. Run
+``python listing_parser.py PAGE.html ...`` to check that all available backends
+agree on saved search pages.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+from abc import ABC, abstractmethod
+from typing import Optional
+from urllib.parse import urljoin
+
+from listing import Listing
+
+CARD_CLASS = "estate__item"
+FIELD_CLASSES = {
+    "address": "estate__item-title",
+    "price": "estate__price",
+    "size": "estate__parameters--1",
+    "rooms": "estate__parameters--2",
+    "bedrooms": "estate__parameters--4",
+}
+
+
+def _is_card_class(c) -> bool:
+    return bool(c and CARD_CLASS in c)
+
+
+def build_card(fields: dict, base_url: str) -> Listing:
+    """Listing from the raw strings a backend pulled out of one card.
+
+    fields: link_href, address, price, size, rooms, bedrooms, img_src, img_data_src;
+    None where the card has no such element.
+    """
+    image_url = None
+    if fields["img_src"]:
+        image_url = urljoin(base_url, fields["img_src"])
+    elif fields["img_data_src"]:
+        image_url = urljoin(base_url, fields["img_data_src"])
+
+    link = None
+    if fields["link_href"] is not None:
+        link = urljoin(base_url, fields["link_href"])
+
+    return Listing.from_card_text(
+        link=link,
+        address=fields["address"],
+        price=fields["price"],
+        size=fields["size"],
+        rooms=fields["rooms"],
+        bedrooms=fields["bedrooms"],
+        image_url=image_url,
+    )
+
+
+class ListingCardParser(ABC):
+    """Turns one search result page into Listings (no user filters applied)."""
+
+    name = ""
+
+    @abstractmethod
+    def parse(self, html: str, base_url: str) -> list:
+        """Every estate card of html, in page order, links resolved against base_url."""
+
+
+class SoupListingCardParser(ListingCardParser):
+    name = "soup"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+
+        self._beautiful_soup = BeautifulSoup
+
+    def _soup(self, html):
+        return self._beautiful_soup(html, "html.parser")
+
+    def parse(self, html, base_url):
+        soup = self._soup(html)
+        out = []
+        for card in soup.find_all("div", class_=_is_card_class):
+            link_tag = card.find("a", class_="js-property-link", href=True)
+            image_tag = card.find("img")
+            fields = {
+                "link_href": link_tag["href"] if link_tag else None,
+                "img_src": image_tag.get("src") if image_tag else None,
+                "img_data_src": image_tag.get("data-src") if image_tag else None,
+            }
+            for key, css_class in FIELD_CLASSES.items():
+                tag = card.find("div", class_=css_class)
+                if tag is None:
+                    fields[key] = None
+                elif key == "address":
+                    fields[key] = tag.get_text(strip=True, separator=" ")
+                else:
+                    fields[key] = tag.get_text(strip=True)
+            out.append(build_card(fields, base_url))
+        return out
+
+
+class StrainedSoupListingCardParser(SoupListingCardParser):
+    name = "strainer"
+
+    def __init__(self):
+        super().__init__()
+        from bs4 import SoupStrainer
+
+        self._strainer = SoupStrainer("div", class_=_is_card_class)
+
+    def _soup(self, html):
+        return self._beautiful_soup(html, "html.parser", parse_only=self._strainer)
+
+
+# get_text() leaves the contents of these out; so must the lxml backend.
+_NON_TEXT_TAGS = frozenset(("script", "style", "template"))
+
+
+def _lxml_strings(el):
+    if el.text:
+        yield el.text
+    for child in el:
+        if isinstance(child.tag, str) and child.tag not in _NON_TEXT_TAGS:
+            yield from _lxml_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def _lxml_text(el, separator="") -> str:
+    return separator.join(s.strip() for s in _lxml_strings(el) if s.strip())
+
+
+class LxmlListingCardParser(ListingCardParser):
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from lxml import etree
+
+        self._lxml_html = lxml.html
+
+        def has_class(css_class):
+            return (
+                "contains(concat(' ', normalize-space(@class), ' '), "
+                f"' {css_class} ')"
+            )
+
+        self._cards = etree.XPath(f"//div[contains(@class, '{CARD_CLASS}')]")
+        self._link = etree.XPath(f".//a[{has_class('js-property-link')} and @href]")
+        self._img = etree.XPath(".//img")
+        self._fields = {
+            key: etree.XPath(f".//div[{has_class(css_class)}]")
+            for key, css_class in FIELD_CLASSES.items()
+        }
+
+    def parse(self, html, base_url):
+        try:
+            root = self._lxml_html.document_fromstring(html)
+        except (ValueError, self._lxml_html.etree.ParserError) as e:
+            # Empty documents and encoding-declared str input: let html.parser decide.
+            logging.debug(
+                "lxml could not parse search page (%s); using html.parser.", e
+            )
+            return get_card_parser("soup").parse(html, base_url)
+
+        out = []
+        for card in self._cards(root):
+            links = self._link(card)
+            imgs = self._img(card)
+            fields = {
+                "link_href": links[0].get("href") if links else None,
+                "img_src": imgs[0].get("src") if imgs else None,
+                "img_data_src": imgs[0].get("data-src") if imgs else None,
+            }
+            for key, xpath in self._fields.items():
+                found = xpath(card)
+                if not found:
+                    fields[key] = None
+                else:
+                    fields[key] = _lxml_text(found[0], " " if key == "address" else "")
+            out.append(build_card(fields, base_url))
+        return out
+
+
+PARSERS = {
+    "soup": SoupListingCardParser,
+    "strainer": StrainedSoupListingCardParser,
+    "lxml": LxmlListingCardParser,
+}
+
+_instances: dict = {}
+
+
+def get_card_parser(name: str = "auto") -> ListingCardParser:
+    """Shared parser instance by name; "auto" = lxml if importable, else strainer."""
+    if name == "auto":
+        try:
+            return get_card_parser("lxml")
+        except ImportError:
+            return get_card_parser("strainer")
+    if name not in _instances:
+        _instances[name] = PARSERS[name]()
+    return _instances[name]
+
+
+def available_parsers() -> list:
+    names = []
+    for name in PARSERS:
+        try:
+            get_card_parser(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def check_parity(html: str, base_url: str, names: Optional[list] = None) -> list:
+    """Names of the backends whose cards differ from the "soup" reference."""
+    reference = get_card_parser("soup").parse(html, base_url)
+    return [
+        name
+        for name in names or available_parsers()
+        if get_card_parser(name).parse(html, base_url) != reference
+    ]
+
+
+if __name__ == "__main__":
+    base = "https://fasteignir.visir.is"
+    failed = False
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8") as f:
+            mismatched = check_parity(f.read(), base)
+        print(
+            f"{path}: {'differs in ' + ', '.join(mismatched) if mismatched else 'ok'}"
+        )
+        failed = failed or bool(mismatched)
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,169 @@
+"""On-disk listing store (SQLite) for incremental runs.
+
+Listings are keyed by their link. The store remembers each listing's search-card
+fingerprint and the details fetched by Scraper.check_property_details, so a later
+run only fetches detail pages for listings that are new or whose card changed
+(price, size, rooms), and remembers per user which version was already emailed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+from listing import Listing, format_count, format_price, format_size
+
+DEFAULT_STORE_PATH = "listings.sqlite3"
+
+# Card fields whose change means the listing must be re-checked and re-reported.
+# The address is left out: Scraper.main rewrites it (", " before the zip).
+FINGERPRINT_FIELDS = ("price", "size_m2", "total_rooms", "bedrooms")
+_FINGERPRINT_FORMATS = (format_price, format_size, format_count, format_count)
+
+DETAIL_FIELDS = (
+    "has_balcony",
+    "has_terrace",
+    "has_garage",
+    "build_year",
+    "fasteignamat",
+    "image_url",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    link TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    details TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    enriched_at TEXT
+);
+CREATE TABLE IF NOT EXISTS reported (
+    user TEXT NOT NULL,
+    link TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    reported_at TEXT NOT NULL,
+    PRIMARY KEY (user, link)
+);
+"""
+
+
+def listing_fingerprint(prop: Listing) -> str:
+    # Hashes the card text as the site shows it, so fingerprints stored before
+    # listings had numeric fields still match.
+    payload = json.dumps(
+        [
+            fmt(getattr(prop, f))
+            for f, fmt in zip(FINGERPRINT_FIELDS, _FINGERPRINT_FORMATS)
+        ],
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+class ListingStore:
+    """Thread-safe wrapper around one SQLite connection (shared by a whole batch)."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def apply_known_details(self, props: list) -> set:
+        """Copy stored details onto props whose card is unchanged; records sightings.
+
+        Returns the links of the props that were filled from the store.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        reused = set()
+        with self._lock, self._conn:
+            for prop in props:
+                link = prop.link
+                if not link:
+                    continue
+                fingerprint = listing_fingerprint(prop)
+                row = self._conn.execute(
+                    "SELECT fingerprint, details FROM listings WHERE link = ?",
+                    (link,),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO listings (link, fingerprint, first_seen, last_seen)"
+                        " VALUES (?, ?, ?, ?)",
+                        (link, fingerprint, now, now),
+                    )
+                    continue
+                if row[0] == fingerprint and row[1]:
+                    for key, value in json.loads(row[1]).items():
+                        if getattr(prop, key) is None or key == "image_url":
+                            setattr(prop, key, value)
+                    reused.add(link)
+                    self._conn.execute(
+                        "UPDATE listings SET last_seen = ? WHERE link = ?",
+                        (now, link),
+                    )
+                else:
+                    # Card changed since it was enriched: details must be re-fetched.
+                    self._conn.execute(
+                        "UPDATE listings SET fingerprint = ?, details = NULL,"
+                        " enriched_at = NULL, last_seen = ? WHERE link = ?",
+                        (fingerprint, now, link),
+                    )
+        return reused
+
+    def save_details(self, props: list):
+        """Store the detail fields of props (call only for successful detail checks)."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            for prop in props:
+                if not prop.link:
+                    continue
+                details = {f: getattr(prop, f) for f in DETAIL_FIELDS}
+                self._conn.execute(
+                    "INSERT INTO listings"
+                    " (link, fingerprint, details, first_seen, last_seen, enriched_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(link) DO UPDATE SET fingerprint = excluded.fingerprint,"
+                    " details = excluded.details, last_seen = excluded.last_seen,"
+                    " enriched_at = excluded.enriched_at",
+                    (
+                        prop.link,
+                        listing_fingerprint(prop),
+                        json.dumps(details, ensure_ascii=False),
+                        now,
+                        now,
+                        now,
+                    ),
+                )
+
+    def unreported(self, user: str, props: list) -> list:
+        """Props that user has not been sent yet, or whose card changed since."""
+        with self._lock:
+            reported = dict(
+                self._conn.execute(
+                    "SELECT link, fingerprint FROM reported WHERE user = ?", (user,)
+                ).fetchall()
+            )
+        return [p for p in props if reported.get(p.link) != listing_fingerprint(p)]
+
+    def mark_reported(self, user: str, props: list):
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO reported (user, link, fingerprint, reported_at)"
+                " VALUES (?, ?, ?, ?)",
+                [(user, p.link, listing_fingerprint(p), now) for p in props],
+            )
+        logging.info(
+            "Listing store: marked %d listing(s) reported for %s.", len(props), user
+        )
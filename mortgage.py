@@ -0,0 +1,219 @@
+"""Monthly mortgage payments for the report, for every listing at once.
+
+A loan product is one or more parts, each a share of the price with its own
+nominal rate, term, indexation and amortization ("annuity" for equal payments,
+"equal" for equal principal repayments). The report shows the first month's
+payment: interest on each part plus its first principal repayment. An indexed
+part's rate is the real rate (its principal follows the CPI afterwards, which
+does not change the first payment).
+
+For a given product, each payment is the price times a constant factor, so
+LoanCalculator.attach() computes every listing × product at once as one outer
+product with NumPy (a plain loop when NumPy is not installed) and stores the
+results on the listings (Listing.payments) for the email and the console log.
+
+Products come from the optional ``loan_products`` list in config.json:
+
+    "loan_products": [
+      {"parts": [{"share": 70, "rate": 8.54}, {"share": 10, "rate": 9.25}]},
+      {"label": "Verðtryggt 25 ár", "years": 25, "indexed": true,
+       "parts": [{"share": 80, "rate": 4.1}]}
+    ]
+
+``share`` and ``rate`` are percentages; ``years``, ``indexed`` and
+``amortization`` can be set on the product (default for its parts) or per part.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+AMORTIZATIONS = ("annuity", "equal")
+
+
+class Payment(NamedTuple):
+    """First monthly payment under one loan product (whole krónur)."""
+
+    label: str
+    monthly: int
+    principal: int
+
+
+@dataclass(frozen=True)
+class LoanPart:
+    share: float  # % of the price
+    rate: float  # nominal annual %, real rate for indexed parts
+    years: int = 40
+    indexed: bool = False
+    amortization: str = "annuity"
+
+    def factors(self) -> tuple[float, float]:
+        """(interest, principal) of the first payment per króna of the price."""
+        loan = self.share / 100
+        r = self.rate / 100 / 12
+        n = self.years * 12
+        if self.amortization == "equal":
+            return loan * r, loan / n
+        if r == 0:
+            return 0.0, loan / n
+        return loan * r, loan * (r / (1 - (1 + r) ** -n) - r)
+
+
+@dataclass(frozen=True)
+class LoanProduct:
+    parts: tuple
+    label: str = ""
+
+    def __post_init__(self):
+        if not self.label:
+            object.__setattr__(self, "label", _default_label(self.parts))
+
+    def factors(self) -> tuple[float, float]:
+        interest = principal = 0.0
+        for part in self.parts:
+            part_interest, part_principal = part.factors()
+            interest += part_interest
+            principal += part_principal
+        return interest, principal
+
+
+def _format_number(value: float) -> str:
+    return f"{value:g}".replace(".", ",")
+
+
+def _default_label(parts: tuple) -> str:
+    """E.g. "Óverðtryggt, 40 ár, 80% lán" — as the report has always said."""
+    indexed = {p.indexed for p in parts}
+    if len(indexed) > 1:
+        kind = "Blandað"
+    elif indexed == {True}:
+        kind = "Verðtryggt"
+    else:
+        kind = "Óverðtryggt"
+    years = "/".join(dict.fromkeys(str(p.years) for p in parts))
+    share = _format_number(round(sum(p.share for p in parts), 6))
+    label = f"{kind}, {years} ár, {share}% lán"
+    if any(p.amortization == "equal" for p in parts):
+        label += ", jafnar afborganir"
+    return label
+
+
+DEFAULT_LOAN_PRODUCTS = (
+    LoanProduct(parts=(LoanPart(share=70, rate=8.54), LoanPart(share=10, rate=9.25))),
+)
+
+
+def parse_loan_products(config: Optional[list]) -> tuple:
+    """LoanProducts from a user's ``loan_products``; the default when missing.
+
+    Raises ValueError for malformed entries.
+    """
+    if config is None:
+        return DEFAULT_LOAN_PRODUCTS
+    if not isinstance(config, list):
+        raise ValueError("must be a list of loan products")
+    products = []
+    for i, item in enumerate(config):
+        if not isinstance(item, dict) or not item.get("parts"):
+            raise ValueError(f"[{i}] must be an object with a non-empty 'parts' list")
+        defaults = {
+            key: item[key]
+            for key in ("years", "indexed", "amortization")
+            if key in item
+        }
+        parts = []
+        for j, part in enumerate(item["parts"]):
+            try:
+                spec = {**defaults, **part}
+                loan_part = LoanPart(
+                    share=float(spec["share"]),
+                    rate=float(spec["rate"]),
+                    years=int(spec.get("years", 40)),
+                    indexed=spec.get("indexed", False),
+                    amortization=spec.get("amortization", "annuity"),
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(
+                    f"[{i}].parts[{j}] needs numeric 'share' and 'rate' ({e})"
+                ) from None
+            if loan_part.amortization not in AMORTIZATIONS:
+                raise ValueError(
+                    f"[{i}].parts[{j}] amortization must be one of "
+                    f"{', '.join(AMORTIZATIONS)}"
+                )
+            if not isinstance(loan_part.indexed, bool):
+                raise ValueError(f"[{i}].parts[{j}] indexed must be true or false")
+            if loan_part.share <= 0 or loan_part.years <= 0 or loan_part.rate < 0:
+                raise ValueError(
+                    f"[{i}].parts[{j}] share and years must be positive, rate >= 0"
+                )
+            parts.append(loan_part)
+        products.append(LoanProduct(parts=tuple(parts), label=item.get("label", "")))
+    return tuple(products)
+
+
+_numpy_warned = False
+
+
+def _warn_no_numpy():
+    global _numpy_warned
+    if not _numpy_warned:
+        _numpy_warned = True
+        logging.warning(
+            "numpy is not installed (see requirements.txt); loan payments are "
+            "computed in Python, which is slower."
+        )
+
+
+class LoanCalculator:
+    """Attaches the first monthly payment of every product to listings."""
+
+    def __init__(self, products: tuple = DEFAULT_LOAN_PRODUCTS):
+        self.products = tuple(products)
+        # Columns: interest, principal for each product in turn.
+        self._factors = [f for product in self.products for f in product.factors()]
+        self._np = None  # numpy once imported, False without it
+
+    def payments(self, prices: list) -> tuple[list, list]:
+        """(monthly, principal): one row per price, one column per product.
+
+        Interest and principal are each truncated to whole krónur.
+        """
+        if not prices:
+            return [], []
+        if self._np is None:
+            try:
+                import numpy
+
+                self._np = numpy
+            except ImportError:
+                _warn_no_numpy()
+                self._np = False
+        if self._np:
+            np = self._np
+            matrix = np.outer(np.asarray(prices, dtype=np.float64), self._factors)
+            matrix = matrix.astype(np.int64)
+            principal = matrix[:, 1::2]
+            return (matrix[:, 0::2] + principal).tolist(), principal.tolist()
+        monthly, principal = [], []
+        for price in prices:
+            row = [int(price * f) for f in self._factors]
+            principal.append(row[1::2])
+            monthly.append([i + p for i, p in zip(row[0::2], principal[-1])])
+        return monthly, principal
+
+    def attach(self, listings: list):
+        """Set listing.payments for listings with a price (None for the rest)."""
+        priced = []
+        for listing in listings:
+            if listing.price is None:
+                listing.payments = None
+            else:
+                priced.append(listing)
+        monthly, principal = self.payments([p.price for p in priced])
+        labels = [product.label for product in self.products]
+        make = Payment._make
+        for listing, monthly_row, principal_row in zip(priced, monthly, principal):
+            listing.payments = tuple(map(make, zip(labels, monthly_row, principal_row)))
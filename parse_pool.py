@@ -0,0 +1,159 @@
+"""Process pool for the CPU-bound HTML parsing (--parse-workers N).
+
+With the thread engine, search and detail pages are parsed in the fetching
+threads, so the GIL lets only one of them parse at a time however many cores the
+machine has. A ParsePool keeps the network I/O where it is (threads or the
+asyncio loop) and sends the page to worker processes instead: search pages as
+text (they are checkpointed as text), detail pages as the raw response bytes,
+decoded in the worker exactly as requests' Response.text would. Workers send back
+compact results: one tuple of Listing constructor arguments per card, and the
+small DetailExtractor dict per detail page.
+
+Workers start on first use ("forkserver" where available, so they are not forked
+from a process full of threads) and keep their parsers and extractors between
+tasks.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from listing import Listing
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+# Listing(...) arguments a card parser fills in, in constructor order.
+CARD_FIELDS = (
+    "link",
+    "address",
+    "price",
+    "size_m2",
+    "total_rooms",
+    "bedrooms",
+    "image_url",
+)
+
+_extractors: dict = {}
+
+
+def _parse_cards(parser_name: str, html: str, base_url: str) -> list:
+    from listing_parser import get_card_parser
+
+    cards = get_card_parser(parser_name).parse(html, base_url)
+    return [tuple(getattr(card, f) for f in CARD_FIELDS) for card in cards]
+
+
+def _extract_details(
+    keywords: tuple,
+    content: bytes,
+    encoding: Optional[str],
+    base_url: str,
+    want_markup: bool,
+) -> dict:
+    import requests
+
+    from detail_parser import DetailExtractor
+
+    extractor = _extractors.get(keywords)
+    if extractor is None:
+        extractor = _extractors[keywords] = DetailExtractor(dict(keywords))
+    response = requests.Response()
+    response._content = content
+    response.encoding = encoding
+    return extractor.extract(response.text, base_url, want_markup=want_markup)
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class ParsePool:
+    """Parses search and detail pages in worker processes; thread-safe."""
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers or default_workers()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.card_pages = 0
+        self.detail_pages = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context(
+                    "forkserver" if "forkserver" in methods else "spawn"
+                )
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context
+                )
+            return self._executor
+
+    def _submit_cards(self, parser_name, html, base_url):
+        with self._lock:
+            self.card_pages += 1
+        return self._pool().submit(_parse_cards, parser_name, html, base_url)
+
+    def _submit_details(self, keywords, response, base_url, want_markup):
+        with self._lock:
+            self.detail_pages += 1
+        return self._pool().submit(
+            _extract_details,
+            tuple(sorted(keywords.items())),
+            response.content,
+            response.encoding,
+            base_url,
+            want_markup,
+        )
+
+    def parse_cards(self, parser_name: str, html: str, base_url: str) -> list:
+        """Listings on one search page (ListingCardParser.parse in a worker)."""
+        rows = self._submit_cards(parser_name, html, base_url).result()
+        return [Listing(*row) for row in rows]
+
+    async def aparse_cards(self, parser_name: str, html: str, base_url: str) -> list:
+        import asyncio
+
+        rows = await asyncio.wrap_future(
+            self._submit_cards(parser_name, html, base_url)
+        )
+        return [Listing(*row) for row in rows]
+
+    def extract_details(
+        self, keywords: dict, response, base_url: str, want_markup: bool
+    ) -> dict:
+        """DetailExtractor(keywords).extract() of a response's page, in a worker.
+
+        response: anything with .content and .encoding (requests.Response,
+        CachedResponse, the asyncio engine's responses).
+        """
+        return self._submit_details(keywords, response, base_url, want_markup).result()
+
+    async def aextract_details(
+        self, keywords: dict, response, base_url: str, want_markup: bool
+    ) -> dict:
+        import asyncio
+
+        return await asyncio.wrap_future(
+            self._submit_details(keywords, response, base_url, want_markup)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "card_pages": self.card_pages,
+                "detail_pages": self.detail_pages,
+            }
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
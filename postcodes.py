@@ -0,0 +1,129 @@
+"""Icelandic postcodes: place names for the report and zip codes in addresses.
+
+POSTCODES maps every postcode (including rural "dreifbýli" and PO box codes) to
+(nominative, dative) place names; it is built once at import from the
+per-place table below, so a lookup is one dict access.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+# (nominative, dative, postcodes)
+_PLACES = (
+    ("Reykjavík", "Reykjavík", "101 102 103 104 105 107 108 109 110 111 112 113 116"),
+    ("Reykjavík", "Reykjavík", "121 123 124 125 127 128 129 150 155 161 162"),
+    ("Seltjarnarnes", "Seltjarnarnesi", "170"),
+    ("Vogar", "Vogum", "190 191"),
+    ("Kópavogur", "Kópavogi", "200 201 202 203 206"),
+    ("Garðabær", "Garðabæ", "210 212 225"),
+    ("Hafnarfjörður", "Hafnarfirði", "220 221 222"),
+    ("Keflavík", "Keflavík", "230 232"),
+    ("Hafnir", "Höfnum", "233"),
+    ("Keflavíkurflugvöllur", "Keflavíkurflugvelli", "235"),
+    ("Grindavík", "Grindavík", "240 241"),
+    ("Suðurnesjabær", "Suðurnesjabæ", "245 246 250 251"),
+    ("Njarðvík", "Njarðvík", "260"),
+    ("Reykjanesbær", "Reykjanesbæ", "262"),
+    ("Mosfellsbær", "Mosfellsbæ", "270 271 276"),
+    ("Akranes", "Akranesi", "300 301"),
+    ("Borgarnes", "Borgarnesi", "310 311"),
+    ("Reykholt", "Reykholti", "320"),
+    ("Stykkishólmur", "Stykkishólmi", "340 341 342"),
+    ("Flatey", "Flatey", "345"),
+    ("Grundarfjörður", "Grundarfirði", "350 351"),
+    ("Ólafsvík", "Ólafsvík", "355"),
+    ("Snæfellsbær", "Snæfellsbæ", "356"),
+    ("Hellissandur", "Hellissandi", "360"),
+    ("Búðardalur", "Búðardal", "370 371"),
+    ("Reykhólahreppur", "Reykhólahreppi", "380 381"),
+    ("Ísafjörður", "Ísafirði", "400 401"),
+    ("Hnífsdalur", "Hnífsdal", "410"),
+    ("Bolungarvík", "Bolungarvík", "415 416"),
+    ("Súðavík", "Súðavík", "420 421"),
+    ("Flateyri", "Flateyri", "425 426"),
+    ("Suðureyri", "Suðureyri", "430 431"),
+    ("Patreksfjörður", "Patreksfirði", "450 451"),
+    ("Tálknafjörður", "Tálknafirði", "460 461"),
+    ("Bíldudalur", "Bíldudal", "465 466"),
+    ("Þingeyri", "Þingeyri", "470 471"),
+    ("Staður", "Stað", "500"),
+    ("Hólmavík", "Hólmavík", "510 511 512"),
+    ("Drangsnes", "Drangsnesi", "520"),
+    ("Árneshreppur", "Árneshreppi", "524"),
+    ("Hvammstangi", "Hvammstanga", "530 531"),
+    ("Blönduós", "Blönduósi", "540 541"),
+    ("Skagaströnd", "Skagaströnd", "545 546"),
+    ("Sauðárkrókur", "Sauðárkróki", "550 551"),
+    ("Varmahlíð", "Varmahlíð", "560 561"),
+    ("Hofsós", "Hofsósi", "565 566"),
+    ("Fljót", "Fljótum", "570"),
+    ("Siglufjörður", "Siglufirði", "580 581"),
+    ("Akureyri", "Akureyri", "600 601 602 603 604 605 606 607"),
+    ("Grenivík", "Grenivík", "610 616"),
+    ("Grímsey", "Grímsey", "611"),
+    ("Dalvík", "Dalvík", "620 621"),
+    ("Ólafsfjörður", "Ólafsfirði", "625 626"),
+    ("Hrísey", "Hrísey", "630"),
+    ("Húsavík", "Húsavík", "640 641"),
+    ("Fosshóll", "Fosshóli", "645"),
+    ("Laugar", "Laugum", "650"),
+    ("Mývatn", "Mývatni", "660"),
+    ("Kópasker", "Kópaskeri", "670 671"),
+    ("Raufarhöfn", "Raufarhöfn", "675 676"),
+    ("Þórshöfn", "Þórshöfn", "680 681"),
+    ("Bakkafjörður", "Bakkafirði", "685 686"),
+    ("Vopnafjörður", "Vopnafirði", "690 691"),
+    ("Egilsstaðir", "Egilsstöðum", "700 701"),
+    ("Seyðisfjörður", "Seyðisfirði", "710"),
+    ("Mjóifjörður", "Mjóafirði", "715"),
+    ("Borgarfjörður eystri", "Borgarfirði eystri", "720 721"),
+    ("Reyðarfjörður", "Reyðarfirði", "730 731"),
+    ("Eskifjörður", "Eskifirði", "735 736"),
+    ("Neskaupstaður", "Neskaupstað", "740 741"),
+    ("Fáskrúðsfjörður", "Fáskrúðsfirði", "750 751"),
+    ("Stöðvarfjörður", "Stöðvarfirði", "755 756"),
+    ("Breiðdalsvík", "Breiðdalsvík", "760 761"),
+    ("Djúpivogur", "Djúpavogi", "765 766"),
+    ("Höfn í Hornafirði", "Höfn í Hornafirði", "780 781"),
+    ("Öræfi", "Öræfum", "785"),
+    ("Selfoss", "Selfossi", "800 801 802 803 804 805 806"),
+    ("Hveragerði", "Hveragerði", "810"),
+    ("Þorlákshöfn", "Þorlákshöfn", "815"),
+    ("Ölfus", "Ölfusi", "816"),
+    ("Eyrarbakki", "Eyrarbakka", "820"),
+    ("Stokkseyri", "Stokkseyri", "825"),
+    ("Laugarvatn", "Laugarvatni", "840"),
+    ("Flúðir", "Flúðum", "845 846"),
+    ("Hella", "Hellu", "850 851"),
+    ("Hvolsvöllur", "Hvolsvelli", "860 861"),
+    ("Vík", "Vík", "870 871"),
+    ("Kirkjubæjarklaustur", "Kirkjubæjarklaustri", "880 881"),
+    ("Vestmannaeyjar", "Vestmannaeyjum", "900 902"),
+    ("Vestmannaeyjabær", "Vestmannaeyjabæ", "901"),
+)
+
+POSTCODES: dict[str, tuple[str, str]] = {
+    code: (nominative, dative)
+    for nominative, dative, codes in _PLACES
+    for code in codes.split()
+}
+
+# A three-digit token not part of a longer number (house numbers, phone numbers).
+ZIP_RE = re.compile(r"(?<!\d)\d{3}(?!\d)")
+
+
+def location_names(zip_code: str) -> tuple[str, str]:
+    """(nominative, dative) place name for zip_code; ("", "") if unknown."""
+    return POSTCODES.get(zip_code, ("", ""))
+
+
+def find_zip(address: Optional[str], zip_codes) -> Optional[re.Match]:
+    """Match of the last zip-like token in address that is one of zip_codes."""
+    if not address:
+        return None
+    for match in reversed(list(ZIP_RE.finditer(address))):
+        if match.group() in zip_codes:
+            return match
+    return None
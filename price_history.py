@@ -0,0 +1,467 @@
+"""Price history: every run's listings in a partitioned Parquet dataset.
+
+With --price-history DIR each run appends the listings it found (after the
+detail checks, before the user's filters) to DIR, one row per listing per day:
+
+    DIR/date=2026-10-17/zip=101/part-….parquet   link, seen, zip, bedrooms,
+    DIR/month=2026-09/zip=101/part-0.parquet     price, size_m2, price_per_m2
+    DIR/first_seen.parquet                       link, first_seen, first_price
+
+compact() (run after every batch) merges each past day's run files into one
+file per zip, and once a month is over, its days into one file per zip, so
+years of daily snapshots stay at one file per zip and month. A listing recorded
+twice on the same day (two users, two runs) keeps its latest row.
+
+attach() sets listing.market for the report: the percentile of the listing's
+price per m² among the listings of its zip code and bedroom count seen in the
+last window_days (each counted once, at its latest price), and its price change
+since it was first recorded. Queries only open the partitions of the zips and
+days they ask for.
+
+Needs pyarrow (pip install pyarrow), imported when a PriceHistory is created.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+
+from postcodes import POSTCODES, find_zip
+
+DEFAULT_HISTORY_DIR = "price_history"
+DEFAULT_WINDOW_DAYS = 90
+MIN_PEERS = 5  # fewer listings than this in a group: no percentile
+FIRST_SEEN = "first_seen.parquet"
+COMPACTED = "part-0.parquet"
+
+_DAY_DIR = re.compile(r"date=(\d{4}-\d{2}-\d{2})$")
+_MONTH_DIR = re.compile(r"month=(\d{4}-\d{2})$")
+
+
+class MarketPosition(NamedTuple):
+    """Where a listing stands against the market (see PriceHistory.attach)."""
+
+    percentile: Optional[float]  # % of its peers with a lower price per m²
+    peers: int  # listings with its zip and bedroom count in the window
+    window_days: int
+    zip_code: str
+    first_seen: Optional[date]
+    first_price: Optional[int]
+    price_change: Optional[int]  # price now minus first_price
+
+
+def listing_zip(prop) -> Optional[str]:
+    """The postcode in prop's address, or None."""
+    match = find_zip(prop.address, POSTCODES)
+    return match.group() if match else None
+
+
+def _month_end(first: date) -> date:
+    return (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+
+
+class PriceHistory:
+    """The price history dataset in directory (shared by a batch; thread-safe).
+
+    window_days: how far back attach() and price_drops() look.
+    Raises ImportError without pyarrow.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_HISTORY_DIR,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+    ):
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+
+        self._pa = pyarrow
+        self._pc = pyarrow.compute
+        self._ds = pyarrow.dataset
+        self._pq = pyarrow.parquet
+        self.schema = pyarrow.schema(
+            [
+                ("link", pyarrow.string()),
+                ("seen", pyarrow.date32()),
+                ("zip", pyarrow.string()),
+                ("bedrooms", pyarrow.int16()),
+                ("price", pyarrow.int64()),
+                ("size_m2", pyarrow.float64()),
+                ("price_per_m2", pyarrow.int64()),
+            ]
+        )
+        self.directory = directory
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._first_seen: Optional[dict] = None  # link -> (date, price)
+        self._parts = 0
+        self.appended = 0
+        self.files_written = 0
+        self.queries = 0
+        self.files_compacted = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "appended": self.appended,
+                "files_written": self.files_written,
+                "queries": self.queries,
+                "files_compacted": self.files_compacted,
+            }
+
+    # -- writing -----------------------------------------------------------------
+
+    def append(self, listings: list, day: Optional[date] = None) -> int:
+        """Record listings as seen on day (default today); returns the rows written.
+
+        Listings without a link, a price or a postcode in the address are skipped.
+        """
+        day = day or date.today()
+        by_zip: dict[str, dict] = {}
+        for prop in listings:
+            zip_code = listing_zip(prop)
+            if prop.link and prop.price is not None and zip_code:
+                by_zip.setdefault(zip_code, {})[prop.link] = prop
+        if not by_zip:
+            return 0
+        with self._lock:
+            first_seen = self._index()
+            added = False
+            for props in by_zip.values():
+                for link, prop in props.items():
+                    known = first_seen.get(link)
+                    if known is None or day < known[0]:
+                        first_seen[link] = (day, prop.price)
+                        added = True
+            for zip_code, props in by_zip.items():
+                self._parts += 1
+                name = f"part-{time.strftime('%H%M%S')}-{os.getpid()}-{self._parts}"
+                self._write(
+                    os.path.join(
+                        self.directory,
+                        f"date={day.isoformat()}",
+                        f"zip={zip_code}",
+                        f"{name}.parquet",
+                    ),
+                    self._table(list(props.values()), zip_code, day),
+                )
+            if added:
+                self._save_index()
+            rows = sum(map(len, by_zip.values()))
+            self.appended += rows
+        return rows
+
+    def compact(self, today: Optional[date] = None) -> int:
+        """Merge past days' run files, and past months' days; returns files merged."""
+        today = today or date.today()
+        this_month = today.replace(day=1)
+        merges: dict[str, list] = {}
+        with self._lock:
+            for top in sorted(self._listdir(self.directory)):
+                match = _DAY_DIR.match(top)
+                if not match or date.fromisoformat(match.group(1)) >= today:
+                    continue
+                month = date.fromisoformat(match.group(1)).replace(day=1)
+                for zip_dir in self._listdir(os.path.join(self.directory, top)):
+                    files = self._parquet_files(
+                        os.path.join(self.directory, top, zip_dir)
+                    )
+                    if month < this_month:
+                        target_dir = f"month={month:%Y-%m}"
+                    elif len(files) > 1:
+                        target_dir = top
+                    else:
+                        continue
+                    target = os.path.join(
+                        self.directory, target_dir, zip_dir, COMPACTED
+                    )
+                    merges.setdefault(target, []).extend(files)
+            merged = 0
+            for target, files in merges.items():
+                if os.path.exists(target) and target not in files:
+                    files.insert(0, target)
+                table = self._last(self._read(files), ["link", "seen"])
+                self._write(
+                    target,
+                    table.sort_by(
+                        [
+                            ("bedrooms", "ascending"),
+                            ("link", "ascending"),
+                            ("seen", "ascending"),
+                        ]
+                    ),
+                )
+                for path in files:
+                    if path != target:
+                        os.remove(path)
+                merged += len(files)
+            self._remove_empty_dirs()
+            self.files_compacted += merged
+        if merged:
+            logging.info("Price history: compacted %d file(s).", merged)
+        return merged
+
+    # -- queries -----------------------------------------------------------------
+
+    def attach(self, listings: list, today: Optional[date] = None):
+        """Set listing.market for listings with a postcode (None for the rest)."""
+        wanted = []
+        for prop in listings:
+            prop.market = None
+            zip_code = listing_zip(prop)
+            if prop.link and zip_code:
+                wanted.append((prop, zip_code))
+        if not wanted:
+            return
+        latest, first_seen = self._latest(
+            {zip_code for _, zip_code in wanted},
+            ["zip", "bedrooms", "price_per_m2"],
+            today,
+        )
+        peers: dict[tuple, list] = {}
+        for zip_code, bedrooms, price_per_m2 in zip(
+            latest["zip"].to_pylist(),
+            latest["bedrooms"].to_pylist(),
+            latest["price_per_m2"].to_pylist(),
+        ):
+            if price_per_m2 is not None:
+                peers.setdefault((zip_code, bedrooms), []).append(price_per_m2)
+        for values in peers.values():
+            values.sort()
+
+        for prop, zip_code in wanted:
+            values = peers.get((zip_code, prop.bedrooms), [])
+            percentile = None
+            if prop.price_per_m2 is not None and len(values) >= MIN_PEERS:
+                below = bisect_left(values, prop.price_per_m2)
+                equal = bisect_right(values, prop.price_per_m2) - below
+                percentile = 100 * (below + equal / 2) / len(values)
+            first_day, first_price = first_seen.get(prop.link) or (None, None)
+            prop.market = MarketPosition(
+                percentile=percentile,
+                peers=len(values),
+                window_days=self.window_days,
+                zip_code=zip_code,
+                first_seen=first_day,
+                first_price=first_price,
+                price_change=(
+                    prop.price - first_price
+                    if prop.price is not None and first_price is not None
+                    else None
+                ),
+            )
+
+    def price_drops(
+        self, zips: Optional[set] = None, today: Optional[date] = None
+    ) -> list:
+        """Listings seen in the window whose latest price is below the first one.
+
+        [{link, zip, bedrooms, first_seen, first_price, price, seen, change}],
+        biggest drop first. zips: only these postcodes (default: all).
+        """
+        latest, first_seen = self._latest(zips, ["zip", "bedrooms", "price"], today)
+        drops = []
+        for row in latest.to_pylist():
+            first_day, first_price = first_seen.get(row["link"]) or (None, None)
+            if first_price is not None and row["price"] < first_price:
+                drops.append(
+                    dict(
+                        row,
+                        first_seen=first_day,
+                        first_price=first_price,
+                        change=row["price"] - first_price,
+                    )
+                )
+        drops.sort(key=lambda d: d["change"])
+        return drops
+
+    def _latest(self, zips: Optional[set], columns: list, today: Optional[date]):
+        """(one row per listing seen in the window at its latest, first_seen index)."""
+        since = (today or date.today()) - timedelta(days=self.window_days)
+        with self._lock:
+            self.queries += 1
+            table = self._read(
+                self._files(since, zips),
+                ["link", "seen", *columns],
+                self._ds.field("seen") >= since,
+            )
+            first_seen = self._index()
+            first_seen = {
+                link: first_seen.get(link)
+                for link in table["link"].unique().to_pylist()
+            }
+        table = self._last(table.sort_by([("seen", "ascending")]), ["link"])
+        return table, first_seen
+
+    # -- files -------------------------------------------------------------------
+
+    @staticmethod
+    def _listdir(path: str) -> list:
+        try:
+            return [name for name in os.listdir(path) if not name.startswith(".")]
+        except FileNotFoundError:
+            return []
+
+    def _parquet_files(self, path: str) -> list:
+        return [
+            os.path.join(path, name)
+            for name in sorted(self._listdir(path))
+            if name.endswith(".parquet")
+        ]
+
+    def _files(self, since: Optional[date] = None, zips: Optional[set] = None) -> list:
+        """The data files of zips (default: all) with rows seen on or after since."""
+        files = []
+        for top in sorted(self._listdir(self.directory)):
+            day = _DAY_DIR.match(top)
+            month = _MONTH_DIR.match(top)
+            if day:
+                last = date.fromisoformat(day.group(1))
+            elif month:
+                last = _month_end(date.fromisoformat(month.group(1) + "-01"))
+            else:
+                continue
+            if since is not None and last < since:
+                continue
+            for zip_dir in sorted(self._listdir(os.path.join(self.directory, top))):
+                if zip_dir.startswith("zip=") and (zips is None or zip_dir[4:] in zips):
+                    files.extend(
+                        self._parquet_files(os.path.join(self.directory, top, zip_dir))
+                    )
+        return files
+
+    def _read(self, files: list, columns: Optional[list] = None, filter=None):
+        if not files:
+            table = self.schema.empty_table()
+            return table.select(columns) if columns else table
+        dataset = self._ds.dataset(files, schema=self.schema, format="parquet")
+        return dataset.to_table(columns=columns, filter=filter)
+
+    def _write(self, path: str, table):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        self.files_written += 1
+
+    def _remove_empty_dirs(self):
+        for top in self._listdir(self.directory):
+            path = os.path.join(self.directory, top)
+            if not os.path.isdir(path):
+                continue
+            for zip_dir in self._listdir(path):
+                if not self._listdir(os.path.join(path, zip_dir)):
+                    os.rmdir(os.path.join(path, zip_dir))
+            if not self._listdir(path):
+                os.rmdir(path)
+
+    def _table(self, props: list, zip_code: str, day: date):
+        pa = self._pa
+        return pa.table(
+            {
+                "link": [p.link for p in props],
+                "seen": [day] * len(props),
+                "zip": [zip_code] * len(props),
+                "bedrooms": [p.bedrooms for p in props],
+                "price": [p.price for p in props],
+                "size_m2": [p.size_m2 for p in props],
+                "price_per_m2": [p.price_per_m2 for p in props],
+            },
+            schema=self.schema,
+        )
+
+    def _last(self, table, keys: list):
+        """One row per distinct keys: the last one in table's order."""
+        others = [name for name in table.column_names if name not in keys]
+        options = self._pc.ScalarAggregateOptions(skip_nulls=False)
+        grouped = table.group_by(keys, use_threads=False).aggregate(
+            [(name, "last", options) for name in others]
+        )
+        return grouped.rename_columns(
+            [name.removesuffix("_last") for name in grouped.column_names]
+        ).select(table.column_names)
+
+    # -- first seen index --------------------------------------------------------
+
+    def _index(self) -> dict:
+        """link -> (first day seen, price then); call with the lock held."""
+        if self._first_seen is None:
+            path = os.path.join(self.directory, FIRST_SEEN)
+            if os.path.exists(path):
+                table = self._pq.read_table(path)
+                self._first_seen = dict(
+                    zip(
+                        table["link"].to_pylist(),
+                        zip(
+                            table["first_seen"].to_pylist(),
+                            table["first_price"].to_pylist(),
+                        ),
+                    )
+                )
+            else:
+                self._first_seen = self._rebuild_index()
+        return self._first_seen
+
+    def _rebuild_index(self) -> dict:
+        table = self._read(self._files(), ["link", "seen", "price"])
+        first_seen = {}
+        if table.num_rows:
+            logging.info("Price history: rebuilding the first seen index.")
+            table = table.sort_by([("seen", "ascending")])
+            for link, day, price in zip(
+                table["link"].to_pylist(),
+                table["seen"].to_pylist(),
+                table["price"].to_pylist(),
+            ):
+                first_seen.setdefault(link, (day, price))
+        return first_seen
+
+    def _save_index(self):
+        pa = self._pa
+        links = list(self._first_seen)
+        firsts = list(self._first_seen.values())
+        self._write(
+            os.path.join(self.directory, FIRST_SEEN),
+            pa.table(
+                {
+                    "link": pa.array(links, pa.string()),
+                    "first_seen": pa.array([f[0] for f in firsts], pa.date32()),
+                    "first_price": pa.array([f[1] for f in firsts], pa.int64()),
+                }
+            ),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compact a price history or list its price drops."
+    )
+    parser.add_argument("directory", nargs="?", default=DEFAULT_HISTORY_DIR)
+    parser.add_argument("command", choices=("compact", "drops"))
+    parser.add_argument("--zip", action="append", dest="zips", metavar="ZIP")
+    parser.add_argument("--days", type=int, default=DEFAULT_WINDOW_DAYS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    history = PriceHistory(args.directory, window_days=args.days)
+    if args.command == "compact":
+        history.compact()
+        return
+    for drop in history.price_drops(set(args.zips) if args.zips else None):
+        print(
+            f"{drop['change']:>12,} kr  {drop['first_price']:>12,} -> "
+            f"{drop['price']:>12,} kr  since {drop['first_seen']}  "
+            f"{drop['zip']}  {drop['link']}".replace(",", ".")
+        )
+
+
+if __name__ == "__main__":
+    main()
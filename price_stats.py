@@ -0,0 +1,129 @@
+"""Price per m² statistics grouped by zip code and bedroom count.
+
+PriceCube.build() makes a single pass over the listings and files each price per
+m² under its (zip, bedrooms) cell. Every summary the report shows — per zip, per
+bedroom count, per bedroom count and zip — is read from the cube: cells directly,
+and the per-zip / per-bedroom margins by merging the cells' values, so the cost
+is O(n log n) in the listings instead of zips × bedrooms × listings.
+
+Listings without a price per m² still count towards ``listings`` (the report
+lists every bedroom count it saw) but not towards the statistics.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+PERCENTILES = (25, 50, 75)
+
+
+def percentile(sorted_values: list, pct: float) -> Optional[float]:
+    """Linearly interpolated percentile (0-100) of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return float(sorted_values[low])
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (
+        rank - low
+    )
+
+
+@dataclass(frozen=True)
+class PriceStats:
+    """Summary of the prices per m² in one group of listings."""
+
+    listings: int  # listings in the group, with or without a price per m²
+    count: int  # listings with a price per m²
+    total: int
+    median: Optional[float]
+    percentiles: dict = field(default_factory=dict)  # {pct: value}
+
+    @property
+    def mean(self) -> Optional[int]:
+        """Mean price per m², truncated to whole krónur as the report shows it."""
+        return int(self.total / self.count) if self.count else None
+
+    @classmethod
+    def from_values(
+        cls, listings: int, values: list, percentiles: Iterable = PERCENTILES
+    ) -> PriceStats:
+        values = sorted(values)
+        return cls(
+            listings=listings,
+            count=len(values),
+            total=sum(values),
+            median=percentile(values, 50),
+            percentiles={p: percentile(values, p) for p in percentiles},
+        )
+
+
+class PriceCube:
+    """(zip, bedrooms) cube of price per m² values, with cached summaries."""
+
+    def __init__(self, percentiles: Iterable = PERCENTILES):
+        self.percentiles = tuple(percentiles)
+        self._values: dict = {}  # (zip, bedrooms) -> [price per m²]
+        self._listings: dict = {}  # (zip, bedrooms) -> listing count
+        self._stats: dict = {}
+
+    @classmethod
+    def build(cls, properties_by_zip: dict, **kwargs) -> PriceCube:
+        """Cube over {zip: [Listing]} (Scraper._prepare_report's grouping)."""
+        cube = cls(**kwargs)
+        for zip_code, props in properties_by_zip.items():
+            for prop in props:
+                cube.add(zip_code, prop.bedrooms, prop.price_per_m2)
+        return cube
+
+    def add(self, zip_code: str, bedrooms: Optional[int], price_per_m2):
+        key = (zip_code, bedrooms)
+        self._listings[key] = self._listings.get(key, 0) + 1
+        values = self._values.setdefault(key, [])
+        if price_per_m2:
+            values.append(price_per_m2)
+        self._stats.clear()
+
+    @property
+    def zips(self) -> list:
+        """Zip codes in the cube, in the order they were first added."""
+        return list(dict.fromkeys(zip_code for zip_code, _ in self._listings))
+
+    @property
+    def bedrooms(self) -> list:
+        """Bedroom counts in the cube, ascending, unknown (None) last."""
+        counts = {bedrooms for _, bedrooms in self._listings}
+        return sorted(counts, key=lambda b: (b is None, b or 0))
+
+    def _summary(self, cache_key, keys: list) -> PriceStats:
+        stats = self._stats.get(cache_key)
+        if stats is None:
+            values = []
+            for key in keys:
+                values.extend(self._values[key])
+            stats = PriceStats.from_values(
+                sum(self._listings[key] for key in keys), values, self.percentiles
+            )
+            self._stats[cache_key] = stats
+        return stats
+
+    def cell(self, zip_code: str, bedrooms: Optional[int]) -> PriceStats:
+        key = (zip_code, bedrooms)
+        return self._summary(key, [key] if key in self._listings else [])
+
+    def by_zip(self, zip_code: str) -> PriceStats:
+        return self._summary(
+            ("zip", zip_code), [k for k in self._listings if k[0] == zip_code]
+        )
+
+    def by_bedrooms(self, bedrooms: Optional[int]) -> PriceStats:
+        return self._summary(
+            ("bedrooms", bedrooms), [k for k in self._listings if k[1] == bedrooms]
+        )
+
+    def overall(self) -> PriceStats:
+        return self._summary(("all",), list(self._listings))
@@ -0,0 +1,381 @@
+"""--profile: where a run's CPU time and memory go, per user.
+
+Two modes:
+
+- ``cprofile`` (default): every Scraper.main runs under cProfile and
+  tracemalloc. Up to Python 3.11 cProfile only sees the thread it is enabled
+  in, so the scraper hands its worker threads (detail checks, speculative search
+  pages, image fetches) to Profiler.thread() and the per-thread profiles are
+  merged. From 3.12 cProfile sees every thread but only one profiler can be
+  active in the process, so all runs share one and each report holds what it
+  recorded between the run's start and end. Writes
+  ``<user>-<time>.pstats`` (open with ``python -m pstats`` or snakeviz) and
+  ``<user>-<time>.txt``: the top functions and the allocations that grew most
+  during the run. Slows the run down noticeably.
+- ``sample``: a background thread looks at the stacks of the threads working for
+  each user every ``interval`` seconds. Cheap enough to leave on. Writes
+  ``<user>-<time>.folded`` (collapsed stacks for flamegraph.pl / speedscope) and
+  ``<user>-<time>.txt``: the hottest functions, and how the samples split between
+  running Python code, waiting on the network, being throttled by the rate
+  limiter and waiting on other threads. Memory is the process's peak RSS.
+
+With the asyncio engine every user shares one thread, so the whole engine run
+is profiled as ``asyncio``. tracemalloc and peak RSS (and from 3.12 cProfile)
+are process-wide: with users running concurrently, their work lands in each
+other's reports.
+Parse pool workers are separate processes and are not profiled.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import tracemalloc
+
+DEFAULT_PROFILE_DIR = ".profiles"
+DEFAULT_SAMPLE_INTERVAL = 0.05
+MODES = ("cprofile", "sample")
+TOP = 30
+MAX_STACK_DEPTH = 60
+# cProfile runs on sys.monitoring: one profiler for every thread of the process.
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+# Where a sampled thread's innermost Python frame is -> what it is doing.
+_STATE_BY_FILE = {
+    "socket.py": "network",
+    "ssl.py": "network",
+    "selectors.py": "network",
+    "connection.py": "network",
+    "rate_limiter.py": "throttled",
+    "threading.py": "waiting",
+    "queue.py": "waiting",
+    "thread.py": "waiting",
+    "_base.py": "waiting",
+}
+
+
+class _Session:
+    """What is collected for one profiled run."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.profiles: list = []
+        self.baseline: Optional[dict] = None  # shared profile's stats at start
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.stacks: Counter = Counter()
+        self.states: Counter = Counter()
+
+
+class Profiler:
+    """Profiles labelled runs (one per user) and writes a report per run; thread-safe."""
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_PROFILE_DIR,
+        mode: str = "cprofile",
+        interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"profile mode must be one of {', '.join(MODES)}")
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions: dict[str, _Session] = {}
+        self._threads: dict[int, str] = {}  # thread id -> label, for sampling
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._shared = None  # the process-wide cProfile.Profile, from 3.12
+        self._shared_runs = 0
+
+    @contextmanager
+    def run(self, label: str):
+        """Profile a run (e.g. one Scraper.main) and write its report at the end."""
+        session = _Session(label)
+        if self.mode == "cprofile":
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            session.snapshot = _snapshot()
+            if PROCESS_WIDE_CPROFILE:
+                session.baseline = self._start_shared()
+        else:
+            self._start_sampler()
+        with self._lock:
+            self._sessions[label] = session
+        try:
+            with self.thread(label):
+                yield
+        finally:
+            with self._lock:
+                del self._sessions[label]
+            if session.baseline is not None:
+                session.profiles.append(self._stop_shared(session.baseline))
+            try:
+                self._write(session)
+            except OSError as e:
+                logging.warning("Could not write the profile of %s: %s", label, e)
+
+    @contextmanager
+    def thread(self, label: str):
+        """Count the calling thread's work towards label's run while inside."""
+        with self._lock:
+            session = self._sessions.get(label)
+        if session is None or getattr(self._local, "label", None) is not None:
+            yield  # not profiling label, or this thread is already profiled
+            return
+        self._local.label = label
+        ident = threading.get_ident()
+        profile = None
+        if self.mode == "sample":
+            with self._lock:
+                self._threads[ident] = label
+        elif not PROCESS_WIDE_CPROFILE:
+            import cProfile
+
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            yield
+        finally:
+            self._local.label = None
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    session.profiles.append(profile)
+            elif self.mode == "sample":
+                with self._lock:
+                    self._threads.pop(ident, None)
+
+    def wrap(self, label: str, fn):
+        """fn, counting its calls (in whatever thread) towards label's run."""
+
+        def profiled(*args, **kwargs):
+            with self.thread(label):
+                return fn(*args, **kwargs)
+
+        return profiled
+
+    def close(self):
+        """Stop the sampling thread, if any."""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    # -- the shared profile (Python 3.12+) -------------------------------------
+
+    def _start_shared(self) -> Optional[dict]:
+        """Enable the process-wide profile for a run; returns its stats so far.
+
+        None if another profiler (say python -m cProfile) holds the process.
+        """
+        import cProfile
+
+        with self._lock:
+            if self._shared is None:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError as e:
+                    logging.warning("Not profiling with cProfile: %s", e)
+                    return None
+                self._shared = profile
+            self._shared_runs += 1
+            self._shared.snapshot_stats()
+            return self._shared.stats
+
+    def _stop_shared(self, baseline: dict) -> _StatsSince:
+        """What the shared profile recorded since baseline; disables it after the
+        last run."""
+        with self._lock:
+            self._shared.snapshot_stats()
+            stats = _StatsSince(self._shared.stats, baseline)
+            self._shared_runs -= 1
+            if not self._shared_runs:
+                self._shared.disable()
+                self._shared = None
+        return stats
+
+    # -- sampling -------------------------------------------------------------
+
+    def _start_sampler(self):
+        with self._lock:
+            if self._sampler is not None:
+                return
+            self._stop.clear()
+            self._sampler = threading.Thread(
+                target=self._sample_loop, name="profile-sampler", daemon=True
+            )
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads.items())
+                sessions = dict(self._sessions)
+            samples = []
+            for ident, label in threads:
+                frame = frames.get(ident)
+                if frame is not None and label in sessions:
+                    samples.append((sessions[label], *_stack(frame)))
+            del frames
+            with self._lock:
+                for session, stack, state in samples:
+                    session.stacks[stack] += 1
+                    session.states[state] += 1
+
+    # -- reports --------------------------------------------------------------
+
+    def _write(self, session: _Session):
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r"[^\w.-]", "_", session.label)
+        base = os.path.join(self.directory, f"{name}-{session.stamp}")
+        out = io.StringIO()
+        out.write(
+            f"{session.label}: {time.perf_counter() - session.started:.2f}s wall, "
+            f"{time.process_time() - session.cpu_started:.2f}s process CPU\n\n"
+        )
+        if self.mode == "cprofile":
+            if session.profiles:
+                import pstats
+
+                stats = pstats.Stats(*session.profiles, stream=out)
+                stats.dump_stats(base + ".pstats")
+                if session.baseline is not None:
+                    out.write("All threads of the process profiled.\n")
+                else:
+                    out.write(f"{len(session.profiles)} thread(s) profiled.\n")
+                stats.sort_stats("cumulative").print_stats(TOP)
+                stats.sort_stats("tottime").print_stats(TOP)
+            _write_allocations(out, session.snapshot)
+            paths = [base + ".pstats", base + ".txt"]
+        else:
+            with self._lock:
+                stacks, states = dict(session.stacks), dict(session.states)
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            _write_samples(out, stacks, states, self.interval)
+            paths = [base + ".folded", base + ".txt"]
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        logging.info("Profile of %s: %s", session.label, ", ".join(paths))
+
+
+class _StatsSince:
+    """cProfile stats minus an earlier snapshot of them, for pstats.Stats."""
+
+    def __init__(self, stats: dict, before: dict):
+        self.stats = {}
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            if func not in before:
+                self.stats[func] = (cc, nc, tt, ct, callers)
+                continue
+            bcc, bnc, btt, bct, bcallers = before[func]
+            if nc == bnc:
+                continue  # not called during the run
+            self.stats[func] = (
+                cc - bcc,
+                nc - bnc,
+                tt - btt,
+                ct - bct,
+                {
+                    caller: _minus(counts, bcallers.get(caller))
+                    for caller, counts in callers.items()
+                    if counts != bcallers.get(caller)
+                },
+            )
+
+    def create_stats(self):
+        pass  # pstats.Stats calls this before reading .stats
+
+
+def _minus(counts: tuple, before: Optional[tuple]) -> tuple:
+    if before is None:
+        return counts
+    return tuple(now - then for now, then in zip(counts, before))
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    import tracemalloc
+
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+    )
+
+
+def _write_allocations(out, before: Optional[tracemalloc.Snapshot]):
+    import tracemalloc
+
+    current, peak = tracemalloc.get_traced_memory()
+    out.write(
+        f"\nTraced memory: {current / 2**20:.1f} MB now, {peak / 2**20:.1f} MB peak "
+        "during the run.\n"
+    )
+    if before is None:
+        return
+    out.write(f"Top {TOP} allocation growth by line:\n")
+    for stat in _snapshot().compare_to(before, "lineno")[:TOP]:
+        out.write(f"  {stat}\n")
+
+
+def _stack(frame) -> tuple[str, str]:
+    """(collapsed "outer;...;inner" stack, state) of a sampled frame."""
+    names = []
+    state = None
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if state is None:
+            state = _STATE_BY_FILE.get(filename, "cpu")
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names)), state or "cpu"
+
+
+def _write_samples(out, stacks: dict, states: dict, interval: float):
+    try:
+        import resource
+
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        out.write(f"Peak RSS of the process: {peak_kb / 1024:.1f} MB\n")
+    except ImportError:  # not on Windows
+        pass
+    total = sum(states.values())
+    out.write(f"{total} samples every {interval * 1000:g} ms\n")
+    if not total:
+        return
+    for state, count in sorted(states.items(), key=lambda item: -item[1]):
+        out.write(f"  {state:<10} {count / total:6.1%}\n")
+    own, inclusive = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            inclusive[name] += count
+    for title, counter in (("self", own), ("inclusive", inclusive)):
+        out.write(f"\nTop {TOP} functions by {title} samples:\n")
+        for name, count in counter.most_common(TOP):
+            out.write(f"  {count / total:6.1%}  {name}\n")
@@ -0,0 +1,189 @@
+"""Per-host adaptive token-bucket rate limiter shared by every Scraper.
+
+Each host gets a TokenBucket: up to ``burst`` requests go out back to back, then
+``rate`` per second. Callers reserve a token under the bucket's lock and sleep
+outside it, so threads (and asyncio tasks, via aacquire) are served in the order
+they asked.
+
+The rate adapts AIMD-style to what the site tells us:
+
+- 429 / 503 halve the rate and honour Retry-After; other 5xx and connection
+  errors cut it by a quarter. Decreases are spaced out by a cooldown so one burst
+  of failures (requests sent before the first one came back) counts once.
+- Latency well above the best recent latency (``latency_factor`` times the
+  baseline) is treated as the site slowing down and trims the rate by 10%.
+- Otherwise every success adds ``1 / rate`` requests per second, i.e. about one
+  request per second more for each second at full speed, up to ``max_rate``.
+
+http_client installs the limiter on the shared session's adapter; the asyncio
+engine calls it around its aiohttp requests.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
+MIN_RATE = 0.5
+MAX_RETRY_AFTER = 120.0
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """Adaptive token bucket for one host."""
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_rate: Optional[float] = None,
+        min_rate: float = MIN_RATE,
+        latency_factor: float = 3.0,
+    ):
+        self.max_rate = max(max_rate or rate, rate)
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.latency_factor = latency_factor
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._latency: Optional[float] = None  # EWMA, seconds
+        self._baseline: Optional[float] = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0  # 429 / 503
+        self.errors = 0  # other 5xx, connection errors
+        self.waited = 0.0
+
+    def reserve(self) -> float:
+        """Take a token; returns how long the caller must sleep before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            wait = max(wait, self._paused_until - now)
+            self.requests += 1
+            self.waited += wait
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        import asyncio
+
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def observe(
+        self,
+        status: Optional[int],
+        latency: float,
+        retry_after: Optional[float] = None,
+    ):
+        """Feed back one response (status None for a connection error)."""
+        with self._lock:
+            now = time.monotonic()
+            if status in (429, 503):
+                self.throttled += 1
+                if retry_after is not None:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+                self._decrease(now, 0.5)
+            elif status is None or status >= 500:
+                self.errors += 1
+                self._decrease(now, 0.75)
+            else:
+                self._observe_latency(now, latency)
+
+    def _observe_latency(self, now: float, latency: float):
+        if self._latency is None:
+            self._latency = self._baseline = latency
+        else:
+            self._latency += 0.2 * (latency - self._latency)
+            if self._latency < self._baseline:
+                self._baseline = self._latency
+            else:
+                # Drift up slowly so one lucky fast response does not pin it.
+                self._baseline += 0.01 * (self._latency - self._baseline)
+        if self._latency > self.latency_factor * self._baseline:
+            self._decrease(now, 0.9)
+        elif self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+
+    def _decrease(self, now: float, factor: float):
+        cooldown = max(1.0, self._latency or 0.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "errors": self.errors,
+                "waited_s": round(self.waited, 1),
+            }
+
+
+class RateLimiter:
+    """One TokenBucket per host, created on first use; thread-safe."""
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_rate: Optional[float] = None,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(
+                    self.rate, self.burst, self.max_rate
+                )
+            return bucket
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {host: bucket.stats() for host, bucket in buckets.items()}
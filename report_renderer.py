@@ -0,0 +1,324 @@
+"""HTML email and log rendering for the property report.
+
+Templates are module-level constants and f-strings compiled with the module;
+every render appends to a list and joins at the end. A listing's card only depends on the listing, so
+ReportRenderer caches the rendered card under the listing's content (all Listing
+fields): users of a batch that report the same listing, and later days where it
+did not change, reuse it. The image (possibly a large data URI) is spliced in
+between the cached halves instead of being cached.
+
+Listing values are formatted by listing_facts(), which both the HTML and the log
+output use.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from operator import attrgetter
+from typing import NamedTuple, Optional
+
+from listing import Listing, format_count, format_price, format_size, format_thousands
+
+FRAGMENT_CACHE_SIZE = 20_000
+
+_CARD_OPEN = "<div style='margin-bottom: 30px; padding: 15px; border: 1px solid #ddd;'>"
+_CARD_CLOSE = "</div>"
+_IMAGE_OPEN = "<img src='"
+_IMAGE_CLOSE = (
+    "' alt='Property image' style='max-width: 600px; height: auto; margin: 10px 0;' />"
+)
+_TITLE = "<h2>{}</h2>".format
+_SUBTITLE = "<h3>{}</h3>".format
+_AVERAGE = "<li><strong>{}:</strong> {} kr.</li>".format
+
+_LOG_FIELD = "  {}: {}".format
+
+
+# Every Listing field, so any change to a listing gives it a new cache entry.
+_content_key = attrgetter(*Listing.__slots__)
+
+
+def _monthly_html(payment) -> str:
+    return (
+        f"<p><strong>Mánaðarleg afborgun ({payment.label}):</strong> "
+        f"{format_thousands(payment.monthly)} kr.</p>"
+    )
+
+
+def _yes_no(flag: bool, yes: str = "Já", no: str = "Nei") -> str:
+    return yes if flag else no
+
+
+class ListingFacts(NamedTuple):
+    """Display strings for one listing; optional ones are None when not shown."""
+
+    address: Optional[str]
+    price: str
+    fasteignamat: Optional[str]
+    price_per_m2: Optional[str]
+    size: str
+    bedrooms: str
+    payments: tuple  # mortgage.Payment per loan product; empty without a price
+    build_year: Optional[str]
+    market: Optional[tuple]  # price_history.MarketPosition, with a price history
+    price_change: Optional[str]  # since first seen, when it changed
+
+
+def _price_change(market) -> Optional[str]:
+    if market is None or not market.price_change or not market.first_price:
+        return None
+    change = market.price_change
+    percent = f"{change / market.first_price * 100:+.1f}".replace(".", ",")
+    return f"{'+' if change > 0 else ''}{format_thousands(change)} kr ({percent}%)"
+
+
+def listing_facts(prop: Listing) -> ListingFacts:
+    fasteignamat = prop.fasteignamat
+    build_year = prop.build_year
+    return ListingFacts(
+        prop.address,
+        format_price(prop.price),
+        fasteignamat if fasteignamat and fasteignamat != "N/A" else None,
+        format_thousands(prop.price_per_m2) if prop.price_per_m2 else None,
+        format_size(prop.size_m2),
+        format_count(prop.bedrooms),
+        prop.payments or (),
+        build_year if build_year and build_year != "N/A" else None,
+        prop.market,
+        _price_change(prop.market),
+    )
+
+
+def _market_html(f: ListingFacts) -> str:
+    market = f.market
+    if market is None:
+        return ""
+    out = ""
+    if market.percentile is not None:
+        out += (
+            "<p><strong>Fermetraverð miðað við markað:</strong> hærra en "
+            f"{market.percentile:.0f}% af {market.peers} eignum með "
+            f"{f.bedrooms} svefnherbergi í {market.zip_code} "
+            f"síðustu {market.window_days} daga</p>"
+        )
+    if f.price_change:
+        out += (
+            f"<p><strong>Verðbreyting frá {market.first_seen:%d.%m.%Y}:</strong> "
+            f"{f.price_change}</p>"
+        )
+    return out
+
+
+class ReportRenderer:
+    """Thread-safe; one instance is shared by every Scraper (see get_renderer)."""
+
+    def __init__(self, cache_size: int = FRAGMENT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._fragments: OrderedDict[tuple, tuple[str, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "fragments": len(self._fragments),
+            }
+
+    # -- one listing -------------------------------------------------------------
+
+    def _fragments_for(self, properties: list) -> list:
+        """[(card HTML before the image, card HTML after it)] for properties.
+
+        Looks up the whole batch under one lock acquisition and renders the misses
+        outside it.
+        """
+        keys = list(map(_content_key, properties))
+        cache = self._fragments
+        with self._lock:
+            fragments = list(map(cache.get, keys))
+            misses = fragments.count(None)
+            self.hits += len(keys) - misses
+            self.misses += misses
+            for key, fragment in zip(keys, fragments):
+                if fragment is not None:
+                    cache.move_to_end(key)
+        if not misses:
+            return fragments
+
+        rendered = {}
+        for i, fragment in enumerate(fragments):
+            if fragment is None:
+                key = keys[i]
+                fragment = rendered.get(key)
+                if fragment is None:
+                    fragment = rendered[key] = self._render_listing(properties[i])
+                fragments[i] = fragment
+        with self._lock:
+            cache.update(rendered)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return fragments
+
+    def listing_html(self, prop: Listing, image_src: Optional[str] = None) -> str:
+        """The HTML card for prop."""
+        ((head, tail),) = self._fragments_for([prop])
+        if image_src:
+            return f"{head}{_IMAGE_OPEN}{image_src}{_IMAGE_CLOSE}{tail}"
+        return head + tail
+
+    @staticmethod
+    def _render_listing(prop: Listing) -> tuple[str, str]:
+        f = listing_facts(prop)
+        balcony, terrace, garage = prop.has_balcony, prop.has_terrace, prop.has_garage
+        # One f-string per card: optional rows are "" rather than extra appends.
+        head = (
+            f"{_CARD_OPEN}<h3>{f.address}</h3>"
+            f"<p><strong>Verð:</strong> {f.price}</p>"
+            f"{f'<p><strong>Fasteignamat:</strong> {f.fasteignamat}</p>' if f.fasteignamat else ''}"
+            f"{f'<p><strong>Fermetraverð:</strong> {f.price_per_m2} kr.</p>' if f.price_per_m2 else ''}"
+            f"{_market_html(f)}"
+            f"<p><strong>Stærð:</strong> {f.size}</p>"
+            f"<p><strong>Svefnherbergi:</strong> {f.bedrooms}</p>"
+            f"{''.join(_monthly_html(p) for p in f.payments)}"
+            f"{f'<p><strong>Byggt:</strong> {f.build_year}</p>' if f.build_year else ''}"
+            f"{'' if balcony is None else f'<p><strong>Svalir:</strong> {_yes_no(balcony)}</p>'}"
+            f"{'' if terrace is None else f'<p><strong>Garður:</strong> {_yes_no(terrace)}</p>'}"
+            f"{'' if garage is None else f'<p><strong>Bílskúr:</strong> {_yes_no(garage)}</p>'}"
+        )
+        # The image goes in between; data URIs are too big to keep in the cache.
+        return head, f"<p><a href='{prop.link}'>View Property</a></p>{_CARD_CLOSE}"
+
+    @staticmethod
+    def listing_log_lines(prop: Listing, number: int) -> list:
+        """The console lines print_properties logs for prop (one log call each)."""
+        f = listing_facts(prop)
+        lines = [
+            f"\nProperty #{number}",
+            _LOG_FIELD("Address", f.address),
+            _LOG_FIELD("Price", f.price),
+        ]
+        if f.fasteignamat:
+            lines.append(_LOG_FIELD("Fasteignamat", f.fasteignamat))
+        lines.append(_LOG_FIELD("Size", f.size))
+        if f.price_per_m2:
+            lines.append(_LOG_FIELD("Price per m²", f"{f.price_per_m2} kr."))
+        market = f.market
+        if market is not None and market.percentile is not None:
+            lines.append(
+                _LOG_FIELD(
+                    "Market",
+                    f"above {market.percentile:.0f}% of {market.peers} listings with "
+                    f"{f.bedrooms} bedrooms in {market.zip_code} "
+                    f"(last {market.window_days} days)",
+                )
+            )
+        if f.price_change:
+            lines.append(
+                _LOG_FIELD(f"Price change since {market.first_seen}", f.price_change)
+            )
+        lines.append(_LOG_FIELD("Bedrooms", f.bedrooms))
+        for payment in f.payments:
+            lines.append(
+                _LOG_FIELD(
+                    f"Monthly Payment ({payment.label})",
+                    f"{format_thousands(payment.monthly)} kr.",
+                )
+            )
+            lines.append(
+                _LOG_FIELD(
+                    "Principal Paid Down", f"{format_thousands(payment.principal)} kr."
+                )
+            )
+        if f.build_year:
+            lines.append(_LOG_FIELD("Built", f.build_year))
+        for label, flag in (
+            ("Balcony", prop.has_balcony),
+            ("Terrace", prop.has_terrace),
+            ("Garage", prop.has_garage),
+        ):
+            if flag is not None:
+                lines.append(_LOG_FIELD(label, _yes_no(flag, "yes", "no")))
+        lines.append(_LOG_FIELD("Link", prop.link))
+        return lines
+
+    # -- whole email ---------------------------------------------------------------
+
+    def _listings_into(self, out: list, properties, title, image_data_uris):
+        out.append(_TITLE(title))
+        properties = list(properties)
+        for prop, (head, tail) in zip(properties, self._fragments_for(properties)):
+            out.append(head)
+            if prop.image_url:
+                out.append(_IMAGE_OPEN)
+                out.append(image_data_uris.get(prop.image_url, prop.image_url))
+                out.append(_IMAGE_CLOSE)
+            out.append(tail)
+
+    def listings_html(
+        self, properties, title: str, image_data_uris: Optional[dict] = None
+    ) -> str:
+        out = []
+        self._listings_into(out, properties, title, image_data_uris or {})
+        return "".join(out)
+
+    def report_html(
+        self,
+        zip_averages: list,
+        bedroom_averages: list,
+        bedroom_zip_averages: list,
+        sections: list,
+        image_data_uris: Optional[dict] = None,
+    ) -> str:
+        """The report email.
+
+        zip_averages: [(zip label, avg kr/m²)]; bedroom_averages: [(bedrooms, avg)];
+        bedroom_zip_averages: [(bedrooms, [(zip label, avg)])];
+        sections: [(title, listings)] in the order they appear.
+        """
+        image_data_uris = image_data_uris or {}
+        out = ["<html><body>", _TITLE("Meðalfermetraverð eftir hverfi:"), "<ul>"]
+        for label, avg in zip_averages:
+            out.append(_AVERAGE(label, format_thousands(avg)))
+        out.append("</ul>")
+
+        out.append(_TITLE("Meðalfermetraverð eftir herbergjafjölda:"))
+        out.append("<ul>")
+        for bedrooms, avg in bedroom_averages:
+            out.append(
+                _AVERAGE(
+                    f"{format_count(bedrooms)} svefnherbergi", format_thousands(avg)
+                )
+            )
+        out.append("</ul>")
+
+        out.append(_TITLE("Meðalfermetraverð eftir herbergjafjölda og hverfi:"))
+        for bedrooms, rows in bedroom_zip_averages:
+            out.append(_SUBTITLE(f"{format_count(bedrooms)} svefnherbergi:"))
+            out.append("<ul>")
+            for label, avg in rows:
+                out.append(_AVERAGE(label, format_thousands(avg)))
+            out.append("</ul>")
+        out.append("<hr>")
+
+        for title, properties in sections:
+            self._listings_into(out, properties, title, image_data_uris)
+            out.append("<hr>")
+        out.append("</body></html>")
+        return "".join(out)
+
+
+_shared: Optional[ReportRenderer] = None
+_shared_lock = threading.Lock()
+
+
+def get_renderer() -> ReportRenderer:
+    """The process-wide renderer, so the fragment cache spans users and runs."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ReportRenderer()
+        return _shared
@@ -0,0 +1,237 @@
+"""Retries with exponential backoff and jitter, and per-host circuit breakers.
+
+RetryPolicy.send() / asend() wrap one HTTP request: connection errors, timeouts
+and 429/5xx responses are retried up to ``retries`` times, sleeping a random
+("full jitter") delay of up to ``backoff * 2**attempt`` seconds (at least the
+server's Retry-After). Every attempt goes through the host's CircuitBreaker:
+after ``failure_threshold`` consecutive failures the host is considered down
+and requests fail fast with CircuitOpenError for ``reset_timeout`` seconds,
+after which one probe request is let through.
+
+http_client applies the shared policy to every request of the shared session;
+the asyncio engine applies it around its aiohttp requests.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+from rate_limiter import retry_after_seconds
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """A host's circuit breaker is open; the request was not sent."""
+
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures → half-open probe → closed."""
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._probing else "open"
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def admit(self) -> Optional[str]:
+        """Whether a request may be sent: "closed", "probe" (the one request let
+        through a half-open breaker) or None (not sent)."""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing:
+                return None
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return "probe"
+            return None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def probe_aborted(self):
+        """The probe ended without telling anything about the host (cancelled, or
+        an error that is not retried): the next request may probe instead."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (
+                self._opened_at is None and self._failures >= self.failure_threshold
+            ):
+                if not self._probing:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class RetryPolicy:
+    """Retry/backoff settings plus the per-host breakers; thread-safe."""
+
+    def __init__(
+        self,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ):
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.retried = 0
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+            return breaker
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number attempt + 1 (full jitter)."""
+        cap = min(self.max_backoff, self.backoff * 2**attempt)
+        return max(random.uniform(0, cap), retry_after or 0.0)
+
+    def _before_attempt(self, url: str, breaker: CircuitBreaker) -> str:
+        admitted = breaker.admit()
+        if admitted is None:
+            raise CircuitOpenError(f"circuit open for {urlsplit(url).hostname}")
+        return admitted
+
+    def _retry_delay(self, url, attempt, reason, retry_after=None) -> float:
+        with self._lock:
+            self.retried += 1
+        delay = self.delay(attempt, retry_after)
+        logging.info(
+            "Retrying %s in %.1fs (%s, attempt %d/%d).",
+            url,
+            delay,
+            reason,
+            attempt + 1,
+            self.retries,
+        )
+        return delay
+
+    def send(self, url: str, attempt, retry_on: tuple):
+        """Call attempt() (returns a response with status_code/headers) with retries.
+
+        Exceptions in retry_on are retried; the last one is re-raised. A response
+        with a retryable status is returned once the retries are used up.
+        """
+        breaker = self.breaker(url)
+        for n in range(self.retries + 1):
+            admitted = self._before_attempt(url, breaker)
+            try:
+                response = attempt()
+            except retry_on as e:
+                breaker.record_failure()
+                if n == self.retries:
+                    raise
+                time.sleep(self._retry_delay(url, n, type(e).__name__))
+                continue
+            except BaseException:
+                if admitted == "probe":
+                    breaker.probe_aborted()
+                raise
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if n == self.retries:
+                return response
+            time.sleep(
+                self._retry_delay(
+                    url,
+                    n,
+                    f"HTTP {response.status_code}",
+                    retry_after_seconds(response.headers.get("Retry-After")),
+                )
+            )
+
+    async def asend(self, url: str, attempt, retry_on: tuple):
+        """send() for a coroutine function attempt."""
+        import asyncio
+
+        breaker = self.breaker(url)
+        for n in range(self.retries + 1):
+            admitted = self._before_attempt(url, breaker)
+            try:
+                response = await attempt()
+            except retry_on as e:
+                breaker.record_failure()
+                if n == self.retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(url, n, type(e).__name__))
+                continue
+            except BaseException:
+                if admitted == "probe":
+                    breaker.probe_aborted()
+                raise
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if n == self.retries:
+                return response
+            await asyncio.sleep(
+                self._retry_delay(
+                    url,
+                    n,
+                    f"HTTP {response.status_code}",
+                    retry_after_seconds(response.headers.get("Retry-After")),
+                )
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+            retried = self.retried
+        return {
+            "retried": retried,
+            "breakers": {
+                host: {"state": b.state, "trips": b.trips}
+                for host, b in breakers.items()
+            },
+        }
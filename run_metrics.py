@@ -0,0 +1,229 @@
+"""Per-run timing spans and counters, exported as JSON and Prometheus text.
+
+Every Scraper has a RunMetrics. The fetch and parse code times its stages in it
+and counts what it handled:
+
+- spans: ``run``, ``scrape`` (search and detail checks, which overlap),
+  ``search`` (pagination), ``search.fetch`` / ``search.parse`` per page,
+  ``detail.fetch`` / ``detail.parse`` per listing, ``aggregate``, ``images``,
+  ``image.fetch`` per picture, ``render`` and ``send``. Per-page and per-listing
+  spans run on many threads (or coroutines) at once, so their totals add up the
+  time of each call and can exceed the run's wall time;
+- counters: pages, bytes, cards parsed and kept, detail cache hits, failures,
+  images, emails, and the HTTP status of every response.
+
+With --run-report / --metrics-textfile a RunReporter writes each user's report
+when their run ends: ``<dir>/<user>.json``, and one Prometheus textfile
+(node_exporter's textfile collector) with the latest run of every user plus the
+batch-wide stats (retries, rate limits, caches) that cannot be split per user.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+DEFAULT_REPORT_DIR = ".run_reports"
+METRIC_PREFIX = "property_scraper"
+
+
+class RunMetrics:
+    """Spans and counters of one user's run; thread-safe."""
+
+    def __init__(self, user: str):
+        self.user = user
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._spans: dict[str, list] = {}  # name -> [calls, total, max]
+        self._counters: dict[str, int] = {}
+        self._statuses: dict[int, int] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def add_span(self, name: str, seconds: float):
+        with self._lock:
+            span = self._spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def response(self, kind: str, status: int, size: int):
+        """Count one HTTP response of kind (search, detail, image)."""
+        with self._lock:
+            self._counters[f"{kind}_requests"] = (
+                self._counters.get(f"{kind}_requests", 0) + 1
+            )
+            self._counters[f"{kind}_bytes"] = (
+                self._counters.get(f"{kind}_bytes", 0) + size
+            )
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+
+    def start(self):
+        """Mark the start of the run (a rerun keeps the first start)."""
+        if self.started_at is None:
+            self.started_at = time.time()
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def report(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            spans = {
+                name: {
+                    "calls": calls,
+                    "total_seconds": round(total, 4),
+                    "max_seconds": round(longest, 4),
+                }
+                for name, (calls, total, longest) in sorted(self._spans.items())
+            }
+            statuses = {str(code): n for code, n in sorted(self._statuses.items())}
+        counters["cards_filtered"] = counters.get("cards", 0) - counters.get(
+            "cards_kept", 0
+        )
+        finished = self.finished_at or time.time()
+        started = self.started_at or finished
+        return {
+            "user": self.user,
+            "started_at": _iso(started),
+            "finished_at": _iso(finished),
+            "duration_seconds": round(finished - started, 3),
+            "spans": spans,
+            "counters": dict(sorted(counters.items())),
+            "http_status": statuses,
+        }
+
+    def summary(self) -> str:
+        """One log line: the total of every span."""
+        with self._lock:
+            spans = sorted(self._spans.items())
+        return ", ".join(
+            f"{name} {total:.2f}s" + (f" ({calls}x)" if calls > 1 else "")
+            for name, (calls, total, _) in spans
+        )
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+def _write_atomic(path: str, text: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _flatten(stats: dict, prefix: str = "") -> dict:
+    """{"a": {"b": 1}} -> {"a.b": 1}, numbers only."""
+    out = {}
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def prometheus_text(reports: list, shared: Optional[dict] = None) -> str:
+    """Prometheus text exposition of the latest run report of each user."""
+    families = {
+        "run_duration_seconds": ("Wall time of the last run.", []),
+        "last_run_timestamp_seconds": ("When the last run finished.", []),
+        "stage_seconds": (
+            "Time per stage in the last run, summed over concurrent calls.",
+            [],
+        ),
+        "stage_calls": ("Calls per stage in the last run.", []),
+        "run_count": ("Pages, bytes, cards, cache hits, ... in the last run.", []),
+        "http_responses": ("HTTP responses by status in the last run.", []),
+        "batch_stat": ("Batch-wide stats (retries, rate limits, caches).", []),
+    }
+    for report in reports:
+        user = f'user="{_label(report["user"])}"'
+        finished = datetime.fromisoformat(report["finished_at"]).timestamp()
+        families["run_duration_seconds"][1].append((user, report["duration_seconds"]))
+        families["last_run_timestamp_seconds"][1].append((user, finished))
+        for name, span in report["spans"].items():
+            labels = f'{user},stage="{_label(name)}"'
+            families["stage_seconds"][1].append((labels, span["total_seconds"]))
+            families["stage_calls"][1].append((labels, span["calls"]))
+        for name, value in report["counters"].items():
+            families["run_count"][1].append((f'{user},name="{_label(name)}"', value))
+        for code, value in report["http_status"].items():
+            families["http_responses"][1].append((f'{user},code="{code}"', value))
+    for name, value in sorted(_flatten(shared or {}).items()):
+        families["batch_stat"][1].append((f'name="{_label(name)}"', value))
+
+    lines = []
+    for family, (help_text, samples) in families.items():
+        if not samples:
+            continue
+        metric = f"{METRIC_PREFIX}_{family}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(f"{metric}{{{labels}}} {value}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+class RunReporter:
+    """Writes run reports as users finish (shared by the batch; thread-safe).
+
+    report_dir: write <report_dir>/<user>.json; textfile: rewrite this
+    Prometheus textfile with every user's latest run. shared: returns the
+    batch-wide stats added to both.
+    """
+
+    def __init__(
+        self,
+        report_dir: Optional[str] = None,
+        textfile: Optional[str] = None,
+        shared: Optional[Callable[[], dict]] = None,
+    ):
+        self.report_dir = report_dir
+        self.textfile = textfile
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._latest: dict[str, dict] = {}
+
+    def publish(self, metrics: RunMetrics):
+        report = metrics.report()
+        shared = self.shared() if self.shared else {}
+        with self._lock:
+            self._latest[metrics.user] = report
+            if self.report_dir:
+                name = re.sub(r"[^\w.-]", "_", metrics.user) + ".json"
+                _write_atomic(
+                    os.path.join(self.report_dir, name),
+                    json.dumps(dict(report, batch=shared), indent=2, default=str)
+                    + "\n",
+                )
+            if self.textfile:
+                _write_atomic(
+                    self.textfile,
+                    prometheus_text(list(self._latest.values()), shared),
+                )
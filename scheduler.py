@@ -0,0 +1,195 @@
+"""Cron schedules for --schedule: when each user runs, and which runs were missed.
+
+A user's optional ``schedule`` in config.json is a five-field cron expression
+(minute hour day-of-month month day-of-week, local time), e.g. ``"0 22 * * *"``
+or ``"30 7 * * 1-5"``. Fields take ``*``, numbers, ``a-b`` ranges, ``/step`` and
+comma lists; months and weekdays also take names (``jan``, ``mon``) and Sunday is
+0 or 7. As in cron, a day matches when either the day of month or the weekday
+does if both are restricted. ``@hourly``, ``@daily``, ``@weekly``, ``@monthly``
+and ``@yearly`` are shorthands. Users without one run at
+SCRAPER_HOUR:SCRAPER_MINUTE every day.
+
+The loop in scraper.run_schedule_loop sleeps until the next due run instead of
+polling the clock. ScheduleState remembers when each user last ran, so runs that
+fell in a time the host was down are caught up (once) after a restart.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+DEFAULT_STATE_PATH = ".schedule_state.json"
+DEFAULT_STAGGER_SECONDS = 15.0
+DEFAULT_CATCH_UP_HOURS = 24.0
+
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+_MONTHS = ("jan feb mar apr may jun jul aug sep oct nov dec").split()
+_WEEKDAYS = ("sun mon tue wed thu fri sat").split()
+# (name, low, high, names for low.., or None)
+_FIELDS = (
+    ("minute", 0, 59, None),
+    ("hour", 0, 23, None),
+    ("day of month", 1, 31, None),
+    ("month", 1, 12, _MONTHS),
+    ("day of week", 0, 7, _WEEKDAYS),
+)
+# A schedule with no matching time in this many days never matches (e.g. 30 2).
+_SEARCH_DAYS = 5 * 366
+
+
+def _parse_value(text: str, low: int, names) -> int:
+    if names and text.lower() in names:
+        return low + names.index(text.lower())
+    return int(text)
+
+
+def _parse_field(text: str, name: str, low: int, high: int, names) -> tuple:
+    values = set()
+    for item in text.split(","):
+        spec, _, step_text = item.partition("/")
+        try:
+            step = int(step_text) if step_text else 1
+            if spec == "*":
+                first, last = low, high
+            elif "-" in spec:
+                a, b = spec.split("-", 1)
+                first, last = _parse_value(a, low, names), _parse_value(b, low, names)
+            else:
+                first = _parse_value(spec, low, names)
+                last = high if step_text else first
+        except ValueError:
+            raise ValueError(f"bad {name} field {text!r}") from None
+        if step < 1 or not low <= first <= last <= high:
+            raise ValueError(f"{name} field {text!r} out of range {low}-{high}")
+        values.update(range(first, last + 1, step))
+    return tuple(sorted(values))
+
+
+@dataclass(frozen=True)
+class CronExpression:
+    """A parsed cron expression; next_after() finds its next matching minute."""
+
+    text: str
+    minutes: tuple
+    hours: tuple
+    days: tuple
+    months: tuple
+    weekdays: tuple  # 0 = Sunday
+    any_day: bool
+    any_weekday: bool
+
+    @classmethod
+    def parse(cls, text: str) -> "CronExpression":
+        """Raises ValueError for a malformed expression."""
+        if not isinstance(text, str):
+            raise ValueError("must be a cron expression string")
+        fields = _ALIASES.get(text.strip().lower(), text).split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"{text!r} must have 5 fields (minute hour day month weekday)"
+            )
+        parsed = [_parse_field(field, *spec) for field, spec in zip(fields, _FIELDS)]
+        weekdays = tuple(sorted({d % 7 for d in parsed[4]}))
+        expression = cls(
+            text,
+            *parsed[:4],
+            weekdays,
+            any_day=fields[2].startswith("*"),
+            any_weekday=fields[4].startswith("*"),
+        )
+        expression.next_after(datetime(2000, 1, 1))  # rejects e.g. "0 0 30 2 *"
+        return expression
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, after: datetime) -> datetime:
+        """The first matching minute strictly after ``after``."""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(_SEARCH_DAYS):
+            if self._day_matches(t):
+                i = bisect_left(self.hours, t.hour)
+                for hour in self.hours[i:]:
+                    first_minute = t.minute if hour == t.hour else 0
+                    j = bisect_left(self.minutes, first_minute)
+                    if j < len(self.minutes):
+                        return t.replace(hour=hour, minute=self.minutes[j])
+            t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f"{self.text!r} never matches")
+
+
+def daily(hour: int, minute: int) -> CronExpression:
+    """The SCRAPER_HOUR / SCRAPER_MINUTE schedule."""
+    return CronExpression.parse(f"{minute} {hour} * * *")
+
+
+@dataclass
+class ScheduleSettings:
+    """How run_schedule_loop spreads and catches up runs (from the CLI flags)."""
+
+    stagger_seconds: float = DEFAULT_STAGGER_SECONDS
+    jitter_seconds: float = 0.0
+    catch_up_hours: float = DEFAULT_CATCH_UP_HOURS
+    state_path: Optional[str] = DEFAULT_STATE_PATH
+
+    def start_offsets(self, count: int) -> list:
+        """Seconds after the batch starts at which each of count users starts."""
+        return [
+            i * self.stagger_seconds + random.uniform(0, self.jitter_seconds)
+            for i in range(count)
+        ]
+
+
+class ScheduleState:
+    """When each user last ran; kept in a JSON file (path=None: in memory)."""
+
+    def __init__(self, path: Optional[str] = DEFAULT_STATE_PATH):
+        self.path = path
+        self._last_run: dict[str, str] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._last_run = dict(json.load(f).get("last_run", {}))
+            except (OSError, ValueError, AttributeError) as e:
+                logging.warning("Ignoring unreadable schedule state %s: %s", path, e)
+
+    def last_run(self, user: str) -> Optional[datetime]:
+        value = self._last_run.get(user)
+        try:
+            return datetime.fromisoformat(value) if value else None
+        except ValueError:
+            return None
+
+    def record(self, users, when: datetime):
+        for user in users:
+            self._last_run[user] = when.isoformat(timespec="seconds")
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"last_run": self._last_run}, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning("Could not save schedule state %s: %s", self.path, e)
@@ -2,22 +2,67 @@ from __future__ import annotations
 
 import argparse
 import logging
+import queue
 import time
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
-from typing import Optional
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional
 
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
 
 import base64
 import os
 import json
-import requests
 import re
 
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+import http_client
+from cassette import Cassette, email_url
+from detail_parser import DetailExtractor, check_detail_keywords
+from http_cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_TTL_SECONDS,
+    DiskResponseCache,
+    ResponseCache,
+)
+from image_pipeline import (
+    DEFAULT_BUDGET_BYTES,
+    DEFAULT_IMAGE_CACHE_DIR,
+    DEFAULT_MAX_PX,
+    ImagePipeline,
+)
+from listing import Listing, format_thousands
+from listing_parser import PARSERS, ListingCardParser, get_card_parser
+from listing_store import DEFAULT_STORE_PATH, ListingStore
+from mortgage import LoanCalculator, parse_loan_products
+from parse_pool import ParsePool
+from postcodes import find_zip, location_names
+from price_history import DEFAULT_HISTORY_DIR, DEFAULT_WINDOW_DAYS, PriceHistory
+from profiling import DEFAULT_PROFILE_DIR, DEFAULT_SAMPLE_INTERVAL, MODES, Profiler
+from rate_limiter import DEFAULT_BURST, DEFAULT_RATE, RateLimiter
+from retry_policy import DEFAULT_BACKOFF, DEFAULT_RETRIES, RetryPolicy
+from run_metrics import DEFAULT_REPORT_DIR, RunMetrics, RunReporter
+from search_checkpoint import (
+    DEFAULT_CHECKPOINT_DIR,
+    SearchCheckpoints,
+    SearchIncompleteError,
+)
+from price_stats import PriceCube
+from report_renderer import ReportRenderer, get_renderer
+from scheduler import (
+    DEFAULT_CATCH_UP_HOURS,
+    DEFAULT_STAGGER_SECONDS,
+    DEFAULT_STATE_PATH,
+    CronExpression,
+    ScheduleSettings,
+    ScheduleState,
+    daily,
+)
+from search_planner import prefetch_search_results
+
+if TYPE_CHECKING:
+    import requests
 
 
 def _configure_logging():
@@ -28,6 +73,16 @@ def _configure_logging():
 
 DEFAULT_CONFIG_PATH = "config.json"
 
+_SOLD_RE = re.compile(r"\bseld\b", re.IGNORECASE)
+
+# Wait before running users whose search stopped at a failing page again.
+RERUN_DELAY_SECONDS = 60
+# The schedule loop wakes at least this often to pick up config.json changes
+# and clock jumps (suspend, NTP, DST).
+MAX_SCHEDULE_SLEEP_SECONDS = 3600
+# How often the schedule loop retries a config.json that never loaded.
+CONFIG_RETRY_SECONDS = 60
+
 
 def load_config_user_list(config_path: Optional[str] = None) -> list:
     """Load config.json: must be a JSON array of user objects (see config.example.json)."""
@@ -78,6 +133,22 @@ def load_config_user_list(config_path: Optional[str] = None) -> list:
             )
             raise SystemExit(1)
         seen_users[uid] = i
+        try:
+            check_detail_keywords(item.get("detail_keywords"))
+        except ValueError as e:
+            logging.error("config.json[%d] detail_keywords: %s", i, e)
+            raise SystemExit(1) from None
+        try:
+            parse_loan_products(item.get("loan_products"))
+        except ValueError as e:
+            logging.error("config.json[%d] loan_products: %s", i, e)
+            raise SystemExit(1) from None
+        if "schedule" in item:
+            try:
+                CronExpression.parse(item["schedule"])
+            except ValueError as e:
+                logging.error("config.json[%d] schedule: %s", i, e)
+                raise SystemExit(1) from None
 
     return data
 
@@ -95,70 +166,236 @@ def find_user_config(user_id: str, config_path: Optional[str] = None) -> dict:
     raise SystemExit(1)
 
 
-def run_schedule_loop():
-    """Wait until SCRAPER_HOUR:SCRAPER_MINUTE daily, then run Scraper for each config user in parallel."""
+def run_schedule_loop(
+    scraper_kwargs: Optional[dict] = None,
+    engine=None,
+    settings: Optional[ScheduleSettings] = None,
+):
+    """Run each config user on its schedule, sleeping until the next due run.
+
+    Users due at the same time run as one batch (sharing the search planner),
+    started settings.stagger_seconds apart plus jitter. Runs missed while the
+    process was down are caught up once on start, if no older than
+    settings.catch_up_hours.
+
+    scraper_kwargs: extra Scraper(...) arguments shared by every user (see _scraper_kwargs).
+    engine: optional AsyncEngine; None runs the users on threads.
+    """
+    scraper_kwargs = scraper_kwargs or {}
+    settings = settings or ScheduleSettings()
     from dotenv import load_dotenv
 
     load_dotenv()
+    default_schedule = _default_schedule()
+    state = ScheduleState(settings.state_path)
+    catch_up = timedelta(hours=settings.catch_up_hours)
+    started = datetime.now()
+    checked = set()  # users whose runs missed before started were looked at
+    user_configs = None
+    logged_next = None
+    while True:
+        try:
+            user_configs = load_config_user_list()
+        except SystemExit:
+            if user_configs is None:
+                logging.error(
+                    "Invalid config.json; retrying in %ds.", CONFIG_RETRY_SECONDS
+                )
+                time.sleep(CONFIG_RETRY_SECONDS)
+                continue
+            logging.error("Invalid config.json; keeping the previous user list.")
+
+        now = datetime.now()
+        due, upcoming = [], []
+        for uc in user_configs:
+            cron = _user_schedule(uc, default_schedule)
+            if cron is None:
+                continue
+            last = state.last_run(uc["user"])
+            if last is not None and last < started and uc["user"] not in checked:
+                # Runs due while this process was not running.
+                checked.add(uc["user"])
+                missed = cron.next_after(max(last, started - catch_up))
+                if missed < started:
+                    logging.info(
+                        "Catching up the run for %s missed at %s.",
+                        uc["user"],
+                        missed.strftime("%Y-%m-%d %H:%M"),
+                    )
+                    due.append(uc)
+                    continue
+                if cron.next_after(last) < started:
+                    logging.info(
+                        "Not catching up runs for %s missed more than %g hours ago.",
+                        uc["user"],
+                        settings.catch_up_hours,
+                    )
+            when = cron.next_after(max(last or started, started))
+            if when <= now:
+                due.append(uc)
+            else:
+                upcoming.append((when, uc["user"]))
 
+        if due:
+            logging.info(
+                "Running scheduled batch for: %s",
+                ", ".join(c["user"] for c in due),
+            )
+            scrapers = [Scraper(uc, **scraper_kwargs) for uc in due]
+            _run_batch(scrapers, engine, settings.start_offsets(len(scrapers)))
+            state.record([c["user"] for c in due], now)
+            _log_batch_stats(scraper_kwargs)
+            continue
+
+        if not upcoming:
+            logging.error("No user in config.json has a schedule.")
+            raise SystemExit(1)
+        next_run = min(when for when, _ in upcoming)
+        if next_run != logged_next:
+            logging.info(
+                "Next scheduled run at %s for: %s",
+                next_run.strftime("%Y-%m-%d %H:%M"),
+                ", ".join(user for when, user in upcoming if when == next_run),
+            )
+            logged_next = next_run
+        wait = (next_run - datetime.now()).total_seconds()
+        time.sleep(min(max(wait, 1), MAX_SCHEDULE_SLEEP_SECONDS))
+
+
+def _default_schedule() -> Optional[CronExpression]:
+    """Daily SCRAPER_HOUR:SCRAPER_MINUTE from the environment, if set."""
+    if "SCRAPER_HOUR" not in os.environ and "SCRAPER_MINUTE" not in os.environ:
+        return None
     try:
-        hour = int(os.environ["SCRAPER_HOUR"])
-        minute = int(os.environ["SCRAPER_MINUTE"])
+        return daily(int(os.environ["SCRAPER_HOUR"]), int(os.environ["SCRAPER_MINUTE"]))
     except KeyError:
-        logging.error(
-            "Schedule mode requires SCRAPER_HOUR and SCRAPER_MINUTE in the environment "
-            "(e.g. in a .env file)."
-        )
+        logging.error("Set both SCRAPER_HOUR and SCRAPER_MINUTE (e.g. in a .env file).")
         raise SystemExit(1) from None
     except ValueError:
-        logging.error("SCRAPER_HOUR and SCRAPER_MINUTE must be integers.")
+        logging.error("SCRAPER_HOUR and SCRAPER_MINUTE must be integers (0-23, 0-59).")
         raise SystemExit(1) from None
 
-    logging.info(
-        "Schedule mode: will run daily at %02d:%02d for each user in config.json (in parallel).",
-        hour,
-        minute,
+
+def _user_schedule(
+    user_config: dict, default: Optional[CronExpression]
+) -> Optional[CronExpression]:
+    if "schedule" in user_config:
+        return CronExpression.parse(user_config["schedule"])
+    if default is None:
+        logging.error(
+            'User %s has no "schedule" and SCRAPER_HOUR/SCRAPER_MINUTE are not '
+            "set; not scheduled.",
+            user_config["user"],
+        )
+    return default
+
+
+def _run_batch(scrapers: list, engine=None, start_offsets: Optional[list] = None):
+    """Run one scheduled batch: the shared search planner, then every user.
+
+    start_offsets: seconds after the planner at which each user starts
+    (default: all at once).
+    Users whose search stopped at a failing page are run once more after
+    RERUN_DELAY_SECONDS; their search resumes from its checkpoint.
+    """
+    _run_scrapers(scrapers, engine, plan_searches=True, start_offsets=start_offsets)
+    incomplete = [s for s in scrapers if s.search_incomplete]
+    if not incomplete:
+        return
+    logging.warning(
+        "Search incomplete for %s; running again in %ds.",
+        ", ".join(s.user_config["user"] for s in incomplete),
+        RERUN_DELAY_SECONDS,
     )
+    time.sleep(RERUN_DELAY_SECONDS)
+    _run_scrapers(incomplete, engine, plan_searches=False)
 
-    last_run_date = None
-    while True:
-        now = datetime.now()
-        if now.hour == hour and now.minute == minute:
-            if last_run_date == now.date():
-                time.sleep(1)
-                continue
-            last_run_date = now.date()
 
-            try:
-                user_configs = load_config_user_list()
-            except SystemExit:
-                logging.error(
-                    "Invalid config.json; skipping today's scheduled batch.",
-                )
-                time.sleep(60)
-                continue
+def _run_scrapers(
+    scrapers: list, engine, plan_searches: bool, start_offsets: Optional[list] = None
+):
+    if engine is not None:
+        engine.run(scrapers, plan_searches=plan_searches, start_offsets=start_offsets)
+        return
 
-            logging.info(
-                "Running scheduled batch for: %s",
-                ", ".join(c["user"] for c in user_configs),
+    if plan_searches:
+        try:
+            prefetch_search_results(scrapers)
+        except Exception:
+            logging.exception(
+                "Batch search planner failed; users will paginate on their own."
             )
 
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = [
-                    executor.submit(_run_scraper_for_user, uc) for uc in user_configs
-                ]
-                for future in futures:
-                    future.result()  # Wait for all scrapers to complete
+    start = time.monotonic()
+    start_offsets = start_offsets or [0.0] * len(scrapers)
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [
+            executor.submit(_run_scraper_for_user, scraper, start + offset)
+            for scraper, offset in zip(scrapers, start_offsets)
+        ]
+        for future in futures:
+            future.result()  # Wait for all scrapers to complete
+
+
+_BATCH_STAT_LABELS = {
+    "http_cache": "HTTP cache",
+    "images": "Images",
+    "report_fragments": "Report fragments",
+    "rate_limits": "Rate limits",
+    "retries": "Retries",
+    "parse_pool": "Parse pool",
+    "cassette": "HTTP cassette",
+    "price_history": "Price history",
+}
+
+
+def _batch_stats(scraper_kwargs: dict) -> dict:
+    """Stats of the components a batch's users share (caches, limits, retries)."""
+    components = {
+        "http_cache": scraper_kwargs.get("response_cache"),
+        "images": scraper_kwargs.get("image_pipeline"),
+        "report_fragments": get_renderer(),
+        "rate_limits": http_client.rate_limiter(),
+        "retries": http_client.retry_policy(),
+        "parse_pool": scraper_kwargs.get("parse_pool"),
+        "cassette": scraper_kwargs.get("cassette"),
+        "price_history": scraper_kwargs.get("price_history"),
+    }
+    return {
+        name: component.stats()
+        for name, component in components.items()
+        if component is not None
+    }
+
+
+def _log_batch_stats(scraper_kwargs: dict):
+    for name, stats in _batch_stats(scraper_kwargs).items():
+        logging.info("%s: %s", _BATCH_STAT_LABELS[name], stats)
+    cassette = scraper_kwargs.get("cassette")
+    if cassette is not None and cassette.recording:
+        cassette.save()
+    image_pipeline = scraper_kwargs.get("image_pipeline")
+    if image_pipeline is not None:
+        image_pipeline.prune()
+    price_history = scraper_kwargs.get("price_history")
+    if price_history is not None:
+        try:
+            price_history.compact()
+        except Exception:
+            logging.exception("Price history compaction failed.")
 
-        time.sleep(1)
 
+def _run_scraper_for_user(scraper: Scraper, start_at: Optional[float] = None):
+    """Helper function to run the scraper for a single user and handle exceptions.
 
-def _run_scraper_for_user(user_config: dict):
-    """Helper function to run the scraper for a single user and handle exceptions."""
-    uid = user_config["user"]
+    start_at: time.monotonic() value to wait for before starting.
+    """
+    uid = scraper.user_config["user"]
+    if start_at is not None and start_at > time.monotonic():
+        time.sleep(start_at - time.monotonic())
     logging.info("Running scraper for %s...", uid)
     try:
-        Scraper(user_config).main()
+        scraper.main()
     except SystemExit as e:
         if e.code not in (0, None):
             logging.error(
@@ -166,14 +403,88 @@ def _run_scraper_for_user(user_config: dict):
                 e.code,
                 uid,
             )
+    except SearchIncompleteError as e:
+        logging.error("Search incomplete for user %s: %s", uid, e)
     except Exception:
         logging.exception("Scraper failed for user %s", uid)
 
 
+@dataclass
+class ReportSelection:
+    """What Scraper._prepare_report selected for the email."""
+
+    properties: list  # every match, sorted by price
+    properties_by_zip: dict
+    allowed_zips: list
+    report_properties: list  # the ones to list in the email
+    price_stats: PriceCube  # price per m² by (zip, bedrooms), over every match
+
+
 class Scraper:
-    def __init__(self, user_config: dict):
-        """user_config: one element from the config.json array (must include \"user\" and settings)."""
+    def __init__(
+        self,
+        user_config: dict,
+        listing_store: Optional[ListingStore] = None,
+        response_cache: Optional[ResponseCache] = None,
+        session: Optional[requests.Session] = None,
+        page_window: int = 1,
+        card_parser: Optional[ListingCardParser] = None,
+        image_pipeline: Optional[ImagePipeline] = None,
+        renderer: Optional[ReportRenderer] = None,
+        search_checkpoints: Optional[SearchCheckpoints] = None,
+        parse_pool: Optional[ParsePool] = None,
+        cassette: Optional[Cassette] = None,
+        run_reporter: Optional[RunReporter] = None,
+        profiler: Optional[Profiler] = None,
+        price_history: Optional[PriceHistory] = None,
+    ):
+        """user_config: one element from the config.json array (must include \"user\" and settings).
+
+        listing_store: optional ListingStore shared by the batch for incremental runs.
+        response_cache: optional ResponseCache for detail pages (shared by the batch).
+        session: requests.Session to use; defaults to the process-wide keep-alive
+        session from http_client (created on first use), so every Scraper shares
+        one connection pool.
+        page_window: search pages kept in flight at once (1 = one page at a time).
+        card_parser: search page parser backend; defaults to get_card_parser("auto").
+        image_pipeline: fetches and embeds the email's images (shared by the batch);
+        defaults to an in-memory ImagePipeline.
+        renderer: email/log renderer; defaults to the process-wide one, whose
+        fragment cache is then shared by every user.
+        search_checkpoints: saved search pages to resume an interrupted search
+        from (shared by the batch); defaults to an in-memory SearchCheckpoints.
+        parse_pool: worker processes to parse search and detail pages in (shared
+        by the batch); None parses them in the fetching thread.
+        cassette: records the email send, or replays it instead of sending (the
+        HTTP requests go through http_client's cassette).
+        run_reporter: writes this user's run metrics when the run ends (shared
+        by the batch); the metrics are always collected and logged.
+        profiler: profiles each main() and the threads it starts (shared by the
+        batch).
+        price_history: records every run's listings and ranks the reported ones
+        against the market (shared by the batch).
+        """
         self.user_config = user_config
+        self._session = session
+        self.listing_store = listing_store
+        self.response_cache = response_cache
+        self.page_window = max(1, page_window)
+        self.card_parser = card_parser or get_card_parser()
+        self.image_pipeline = image_pipeline or ImagePipeline()
+        self.renderer = renderer or get_renderer()
+        self.search_checkpoints = search_checkpoints or SearchCheckpoints()
+        self.search_incomplete = False
+        self.parse_pool = parse_pool
+        self.cassette = cassette
+        self.run_reporter = run_reporter
+        self.profiler = profiler
+        self.price_history = price_history
+        self.metrics = RunMetrics(user_config["user"])
+        self.detail_extractor = DetailExtractor(user_config.get("detail_keywords"))
+        self.loan_calculator = LoanCalculator(
+            parse_loan_products(user_config.get("loan_products"))
+        )
+        self._detail_failures = set()
         self.args = argparse.Namespace(user=user_config["user"])
 
         self.API_KEY = self.user_config.get("BREVO_API_KEY")
@@ -184,6 +495,10 @@ class Scraper:
         self.MIN_BEDROOMS = self.user_config.get("MIN_BEDROOMS")
         self.MAX_BEDROOMS = self.user_config.get("MAX_BEDROOMS")
         self.ZIP_CODES = self.user_config.get("ZIP_CODES")
+        try:
+            self._price_range = (int(self.MIN_PRICE), int(self.MAX_PRICE))
+        except (ValueError, TypeError):
+            self._price_range = None  # no card can match, as before
 
         # Property categories
         categories = []
@@ -211,36 +526,62 @@ class Scraper:
         # If no categories specified, fallback to original default
         self.CATEGORIES = ",".join(categories) if categories else "2,1,4,7,17"
 
+        # Set by search_planner when a batch query already fetched this user's pages.
+        self.prefetched_cards = None
+        self._prefetch_zip_filter = None
+        self._prefetch_bedroom_range = None
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            self._session = http_client.shared_session(self._page_request_headers())
+        return self._session
+
     def fetch_image_as_data_uri(self, image_url, referer=None, max_size_kb=500):
         """Fetch image from URL and return a data URI for embedding, or None on failure."""
         if not image_url or not image_url.startswith("http"):
             return None
+        try:
+            content, content_type = self._fetch_image(image_url, referer)
+            return self._image_data_uri(content, content_type, max_size_kb)
+        except Exception:
+            return None
+
+    def _fetch_image(self, image_url, referer=None) -> tuple[bytes, Optional[str]]:
+        """(bytes, Content-Type) of an image; raises on HTTP errors."""
+        with self.metrics.span("image.fetch"):
+            r = self.session.get(
+                image_url, timeout=15, headers=self._image_request_headers(referer)
+            )
+        self.metrics.response("image", r.status_code, len(r.content))
+        r.raise_for_status()
+        return r.content, r.headers.get("Content-Type")
+
+    @staticmethod
+    def _image_request_headers(referer=None) -> dict:
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
         }
         if referer:
             headers["Referer"] = referer
-        try:
-            r = requests.get(image_url, timeout=15, headers=headers)
-            r.raise_for_status()
-            content = r.content
-            if len(content) > max_size_kb * 1024:
-                return None
-            content_type = (
-                r.headers.get("Content-Type", "image/jpeg").split(";")[0].strip()
-            )
-            if content_type not in (
-                "image/jpeg",
-                "image/png",
-                "image/gif",
-                "image/webp",
-            ):
-                content_type = "image/jpeg"
-            b64 = base64.b64encode(content).decode("ascii")
-            return f"data:{content_type};base64,{b64}"
-        except Exception:
+        return headers
+
+    @staticmethod
+    def _image_data_uri(content: bytes, content_type, max_size_kb=500):
+        """Base64 data URI for downloaded image bytes, or None if they are too big."""
+        if len(content) > max_size_kb * 1024:
             return None
+        content_type = (content_type or "image/jpeg").split(";")[0].strip()
+        if content_type not in (
+            "image/jpeg",
+            "image/png",
+            "image/gif",
+            "image/webp",
+        ):
+            content_type = "image/jpeg"
+        b64 = base64.b64encode(content).decode("ascii")
+        return f"data:{content_type};base64,{b64}"
 
     def send_email_notification(self, subject, html_body):
         if not all([self.API_KEY, self.FROM_EMAIL, self.TO_EMAIL]):
@@ -249,6 +590,13 @@ class Scraper:
             )
             return False
 
+        if self.cassette is not None and self.cassette.replaying:
+            return self._replay_email(html_body)
+
+        # Imported here: the SDK is slow to import and most runs send nothing.
+        import sib_api_v3_sdk
+        from sib_api_v3_sdk.rest import ApiException
+
         configuration = sib_api_v3_sdk.Configuration()
         configuration.api_key["api-key"] = self.API_KEY
         api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
@@ -263,19 +611,54 @@ class Scraper:
         )
 
         logging.info(f"Attempting to send email to {self.TO_EMAIL}...")
+        start = time.monotonic()
         try:
             api_response = api_instance.send_transac_email(send_smtp_email)
             logging.info(
                 f"Email sent successfully! Message ID: {api_response.message_id}"
             )
+            self._record_email(
+                html_body, 201, {"messageId": api_response.message_id}, start
+            )
             return True
         except ApiException as e:
             logging.error(
                 f"Exception when calling TransactionalEmailsApi->send_transac_email: {e}"
             )
+            self._record_email(html_body, e.status or 0, {"message": e.body}, start)
             return False
 
+    def _record_email(self, html_body: str, status: int, result: dict, start: float):
+        if self.cassette is None:
+            return
+        self.cassette.record(
+            "POST",
+            email_url(self.TO_EMAIL, self.user_config["user"]),
+            status,
+            {"Content-Type": "application/json"},
+            json.dumps(result).encode("utf-8"),
+            time.monotonic() - start,
+            request_body=html_body.encode("utf-8"),
+        )
+
+    def _replay_email(self, html_body: str) -> bool:
+        """send_email_notification's recorded outcome; nothing is sent."""
+        url = email_url(self.TO_EMAIL, self.user_config["user"])
+        replayed = self.cassette.replay("POST", url)
+        if replayed.delay:
+            time.sleep(replayed.delay)
+        same = self.cassette.same_request_body("POST", url, html_body.encode("utf-8"))
+        logging.info(
+            "Replay: email to %s not sent (recorded status %s; body %s the recorded one).",
+            self.TO_EMAIL,
+            replayed.status,
+            "matches" if same else "differs from",
+        )
+        return replayed.status < 300
+
     NO_SEARCH_RESULTS_TEXT = "Leitin skilaði engum niðurstöðum."
+    BASE_URL = "https://fasteignir.visir.is"
+    MAX_SEARCH_PAGES = 500
     LISTING_AJAX_URL = "https://fasteignir.visir.is/ajaxsearch/getresults"
 
     def _search_listings_query_params(self, page: int) -> dict:
@@ -300,93 +683,254 @@ class Scraper:
         }
 
     def _parse_listing_cards_from_html(
-        self, html: str, base_url: str, skip_address_substrings, processed_links: set
+        self,
+        html: str,
+        base_url: str,
+        skip_address_substrings,
+        processed_links: set,
+        cards: Optional[list] = None,
     ) -> tuple[list, int]:
-        """Parse estate cards from HTML. Returns (new prop dicts, raw card count on page)."""
-        soup = BeautifulSoup(html, "html.parser")
-        property_cards = soup.find_all(
-            "div", class_=lambda c: c and "estate__item" in c
-        )
-        raw_count = len(property_cards)
-        out = []
-        for card in property_cards:
-            link_tag = card.find("a", class_="js-property-link", href=True)
-            address_tag = card.find("div", class_="estate__item-title")
-            price_tag = card.find("div", class_="estate__price")
-            size_tag = card.find("div", class_="estate__parameters--1")
-            rooms_tag = card.find("div", class_="estate__parameters--2")
-            bedrooms_tag = card.find("div", class_="estate__parameters--4")
-
-            image_tag = card.find("img")
-            image_url = None
-            if image_tag and image_tag.get("src"):
-                image_url = urljoin(base_url, image_tag["src"])
-            elif image_tag and image_tag.get("data-src"):
-                image_url = urljoin(base_url, image_tag["data-src"])
-
-            link = urljoin(base_url, link_tag["href"]) if link_tag else "N/A"
-            address = (
-                address_tag.get_text(strip=True, separator=" ")
-                if address_tag
-                else "N/A"
-            )
+        """Parse estate cards from HTML. Returns (new Listings, raw card count on page).
+
+        cards: the page's cards when already parsed (e.g. by the parse pool).
+        """
+        if cards is None:
+            cards = self.extract_listing_cards(html, base_url)
+        out = [
+            card
+            for card in cards
+            if self._accept_listing_card(card, skip_address_substrings, processed_links)
+        ]
+        return out, len(cards)
+
+    def extract_listing_cards(self, html: str, base_url: str) -> list:
+        """Parse every estate card on a search page into a Listing (no user filters)."""
+        with self.metrics.span("search.parse"):
+            if self.parse_pool is not None:
+                return self.parse_pool.parse_cards(
+                    self.card_parser.name, html, base_url
+                )
+            return self.card_parser.parse(html, base_url)
+
+    def _accept_listing_card(
+        self, card: Listing, skip_address_substrings, processed_links: set
+    ) -> bool:
+        """Apply this user's filters to a parsed card; records accepted links."""
+        address = card.address
+        if card.link is None or address is None:
+            return False
+        if _SOLD_RE.search(address):
+            return False
 
-            if re.search(r"\bseld\b", address, re.IGNORECASE):
-                continue
+        if any(
+            substring.lower() in address.lower()
+            for substring in skip_address_substrings
+        ):
+            return False
+
+        # "Tilboð" and other non-numeric prices were parsed to None.
+        if card.price is None or self._price_range is None:
+            return False
+        low, high = self._price_range
+        if not low <= card.price <= high:
+            return False
 
-            if any(
-                substring.lower() in address.lower()
-                for substring in skip_address_substrings
+        if card.link in processed_links:
+            return False
+        processed_links.add(card.link)
+        return True
+
+    @staticmethod
+    def _zip_from_address(address: Optional[str], allowed_zips) -> Optional[str]:
+        """Last 3-digit token in the address that is one of allowed_zips, else None."""
+        match = find_zip(address, allowed_zips)
+        return match.group() if match else None
+
+    def use_prefetched_cards(
+        self,
+        cards: list,
+        zip_filter: Optional[tuple[frozenset, frozenset]] = None,
+        bedroom_range: Optional[tuple[int, int]] = None,
+    ):
+        """Serve scrape_visir_properties from cards fetched by a broader batch query.
+
+        zip_filter (batch query zips, this user's zips) / bedroom_range are set when
+        that query was wider than this user's own search, so the site-side filter
+        has to be re-applied locally.
+        """
+        self.prefetched_cards = cards
+        self._prefetch_zip_filter = zip_filter
+        self._prefetch_bedroom_range = bedroom_range
+
+    def _filter_prefetched_cards(self, skip_address_substrings) -> list:
+        processed_links = set()
+        out = []
+        for card in self.prefetched_cards:
+            if self._prefetch_zip_filter is not None:
+                query_zips, own_zips = self._prefetch_zip_filter
+                zip_code = self._zip_from_address(card.address, query_zips)
+                # No zip in the address: kept, and reported under "Annað" as
+                # the user's own search would have.
+                if zip_code is not None and zip_code not in own_zips:
+                    continue
+            if self._prefetch_bedroom_range is not None:
+                low, high = self._prefetch_bedroom_range
+                if card.bedrooms is not None and not low <= card.bedrooms <= high:
+                    continue
+            if self._accept_listing_card(
+                card, skip_address_substrings, processed_links
             ):
-                continue
+                # Cards are shared between users; later stages mutate props.
+                out.append(card.copy())
+        return out
+
+    def iter_search_pages(self, query_params: Optional[dict] = None):
+        """Yield (page_num, html) from /ajaxsearch/getresults until no hits.
+
+        query_params defaults to this user's search; "page" is filled in per request.
+        Stops at the empty-search message. Pages saved by an earlier, interrupted
+        run of the same search are replayed first and fetching resumes after them;
+        a page that still fails after the retries raises SearchIncompleteError and
+        keeps the checkpoint. With page_window > 1 the following pages are fetched
+        speculatively.
+        """
+        if query_params is None:
+            query_params = self._search_listings_query_params(1)
 
-            price_str = price_tag.get_text(strip=True) if price_tag else "N/A"
-            if price_str == "Tilboð":
-                continue
+        headers = self._page_request_headers()
+        headers["Referer"] = "https://fasteignir.visir.is/search/results/?stype=sale"
 
+        saved = self.search_checkpoints.load(query_params)
+        if saved:
+            logging.info(
+                "Resuming search from checkpoint: %d saved page(s), fetching from "
+                "page %d.",
+                len(saved),
+                len(saved) + 1,
+            )
+        else:
+            logging.info(
+                "Fetching search pages via requests → %s (page=1, 2, … until no hits).",
+                self.LISTING_AJAX_URL,
+            )
+        if self.page_window > 1:
+            fetched = self._iter_search_pages_windowed(
+                query_params, headers, len(saved) + 1
+            )
+        else:
+            fetched = self._iter_search_pages_sequential(
+                query_params, headers, len(saved) + 1
+            )
+        try:
+            yield from saved
+            for page_num, text in fetched:
+                self.search_checkpoints.save_page(query_params, page_num, text)
+                yield page_num, text
+        except GeneratorExit:
+            # The caller stopped reading (e.g. a page without cards): search done.
+            self.search_checkpoints.clear(query_params)
+            raise
+        self.search_checkpoints.clear(query_params)
+
+    def _search_page_failed(self, page_num: int, error: Exception):
+        logging.error(
+            "Error fetching search page %s: %s; stopping here (the pages so far "
+            "are checkpointed).",
+            page_num,
+            error,
+        )
+        self.search_incomplete = True
+        raise SearchIncompleteError(page_num, error) from error
+
+    def _iter_search_pages_sequential(
+        self, query_params: dict, headers, first_page: int
+    ):
+        page_num = first_page
+        while page_num <= self.MAX_SEARCH_PAGES:
             try:
-                price_num = int(price_str.replace(".", "").replace(" kr", ""))
-                if not int(self.MIN_PRICE) <= price_num <= int(self.MAX_PRICE):
-                    continue
-            except (ValueError, TypeError):
-                continue
+                text = self._fetch_search_page(query_params, page_num, headers)
+            except Exception as e:
+                self._search_page_failed(page_num, e)
 
-            size = size_tag.get_text(strip=True) if size_tag else "N/A"
-            total_rooms = rooms_tag.get_text(strip=True) if rooms_tag else "N/A"
-            bedrooms_text = bedrooms_tag.get_text(strip=True) if bedrooms_tag else "N/A"
-            bedrooms = "1" if bedrooms_text == "N/A" else bedrooms_text
+            if self._is_last_search_page(page_num, text):
+                return
+
+            yield page_num, text
+            page_num += 1
+            if http_client.rate_limiter() is None:
+                time.sleep(0.5)
+
+    def _fetch_search_page(self, query_params: dict, page_num: int, headers) -> str:
+        with self.metrics.span("search.fetch"):
+            response = self.session.get(
+                self.LISTING_AJAX_URL,
+                params=dict(query_params, page=page_num),
+                headers=headers,
+                timeout=30,
+            )
+        self.metrics.response("search", response.status_code, len(response.content))
+        response.raise_for_status()
+        return response.text
+
+    def _is_last_search_page(self, page_num: int, text: str) -> bool:
+        if self.NO_SEARCH_RESULTS_TEXT in text:
+            logging.info(
+                "Page %s: '%s' — stopping pagination.",
+                page_num,
+                self.NO_SEARCH_RESULTS_TEXT,
+            )
+            return True
+        return False
+
+    def _iter_search_pages_windowed(
+        self, query_params: dict, headers, first_page: int = 1
+    ):
+        """Speculative pagination: keep up to page_window pages in flight.
+
+        The window starts at 2 and doubles after every page with hits, up to
+        page_window. Pages are still yielded in order; requests past the detected
+        end are cancelled, or their responses discarded if already running.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.page_window)
+        pending = {}
+        window = min(2, self.page_window)
+        next_submit = first_page
+        page_num = first_page
+        try:
+            while page_num <= self.MAX_SEARCH_PAGES:
+                while (
+                    next_submit < page_num + window
+                    and next_submit <= self.MAX_SEARCH_PAGES
+                ):
+                    pending[next_submit] = executor.submit(
+                        self._profiled(self._fetch_search_page),
+                        query_params,
+                        next_submit,
+                        headers,
+                    )
+                    next_submit += 1
 
-            price_per_m2 = None
-            if size != "N/A" and price_num:
                 try:
-                    size_num = float(size.replace("m²", "").replace(",", "."))
-                    if size_num > 0:
-                        price_per_m2 = int(price_num / size_num)
-                except (ValueError, TypeError):
-                    pass
-
-            if link != "N/A" and address != "N/A":
-                if link in processed_links:
-                    continue
-                processed_links.add(link)
-                out.append(
-                    {
-                        "address": address,
-                        "price": price_str,
-                        "size_m2": size,
-                        "price_per_m2": price_per_m2,
-                        "total_rooms": total_rooms,
-                        "bedrooms": bedrooms,
-                        "link": link,
-                        "image_url": image_url,
-                    }
+                    text = pending.pop(page_num).result()
+                except Exception as e:
+                    self._search_page_failed(page_num, e)
+
+                if self._is_last_search_page(page_num, text):
+                    return
+
+                yield page_num, text
+                page_num += 1
+                window = min(window * 2, self.page_window)
+        finally:
+            if pending:
+                logging.info(
+                    "Discarding %d speculative search page(s) past the end.",
+                    len(pending),
                 )
-        return out, raw_count
-
-    def scrape_visir_properties(self):
-        base_url = "https://fasteignir.visir.is"
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        if not all(
+    def _has_search_params(self) -> bool:
+        return all(
             [
                 self.MIN_PRICE,
                 self.MAX_PRICE,
@@ -394,411 +938,257 @@ class Scraper:
                 self.MAX_BEDROOMS,
                 self.ZIP_CODES,
             ]
-        ):
-            logging.error("Missing search parameters in config file.")
-            return [], None
-
-        skip_address_substrings = self.user_config.get("ignored_strings", [])
-
-        new_properties_found_this_run = []
-        processed_links = set()
-
-        headers = self._page_request_headers()
-        headers["Referer"] = "https://fasteignir.visir.is/search/results/?stype=sale"
-
-        page_num = 1
-        max_pages = 500
+        )
 
+    def _parse_search_page(
+        self,
+        page_num: int,
+        text: str,
+        skip_address_substrings,
+        processed_links: set,
+        cards: Optional[list] = None,
+    ) -> Optional[list]:
+        """New props on one search page, or None when pagination should stop."""
+        added, raw_cards = self._parse_listing_cards_from_html(
+            text, self.BASE_URL, skip_address_substrings, processed_links, cards
+        )
+        self.metrics.count("cards", raw_cards)
+        self.metrics.count("cards_kept", len(added))
         logging.info(
-            "Fetching search pages via requests → %s (page=1, 2, … until no hits).",
-            self.LISTING_AJAX_URL,
+            "Page %s: %s card(s) on page, %s new after filters (running total %s).",
+            page_num,
+            raw_cards,
+            len(added),
+            len(processed_links),
         )
 
-        while page_num <= max_pages:
-            try:
-                response = requests.get(
-                    self.LISTING_AJAX_URL,
-                    params=self._search_listings_query_params(page_num),
-                    headers=headers,
-                    timeout=30,
-                )
-                response.raise_for_status()
-                text = response.text
-            except Exception as e:
-                logging.error("Error fetching search page %s: %s", page_num, e)
-                break
+        if raw_cards == 0:
+            logging.warning(
+                "Page %s: no listing cards in HTML and no empty-search message — stopping.",
+                page_num,
+            )
+            return None
+        return added
 
-            if self.NO_SEARCH_RESULTS_TEXT in text:
-                logging.info(
-                    "Page %s: '%s' — stopping pagination.",
-                    page_num,
-                    self.NO_SEARCH_RESULTS_TEXT,
-                )
-                break
+    def iter_new_properties(self):
+        """Yield each search page's new props (after this user's filters) once parsed."""
+        if not self._has_search_params():
+            logging.error("Missing search parameters in config file.")
+            return
 
-            added, raw_cards = self._parse_listing_cards_from_html(
-                text, base_url, skip_address_substrings, processed_links
-            )
+        skip_address_substrings = self.user_config.get("ignored_strings", [])
+
+        if self.prefetched_cards is not None:
+            out = self._filter_prefetched_cards(skip_address_substrings)
+            self.metrics.count("cards", len(self.prefetched_cards))
+            self.metrics.count("cards_kept", len(out))
             logging.info(
-                "Page %s: %s card(s) on page, %s new after filters (running total %s).",
-                page_num,
-                raw_cards,
-                len(added),
-                len(processed_links),
+                "Using %d prefetched card(s) from the batch search; %d after filters.",
+                len(self.prefetched_cards),
+                len(out),
             )
+            yield out
+            return
 
-            if raw_cards == 0:
-                logging.warning(
-                    "Page %s: no listing cards in HTML and no empty-search message — stopping.",
-                    page_num,
-                )
+        processed_links = set()
+        for page_num, text in self.iter_search_pages():
+            added = self._parse_search_page(
+                page_num, text, skip_address_substrings, processed_links
+            )
+            if added is None:
                 break
+            yield added
 
-            new_properties_found_this_run.extend(added)
-            page_num += 1
-            time.sleep(0.5)
-
+    def scrape_visir_properties(self):
+        new_properties_found_this_run = [
+            prop for page in self.iter_new_properties() for prop in page
+        ]
         return new_properties_found_this_run, None
 
-    def get_numeric_price(self, price_str):
-        try:
-            return int(price_str.replace(".", "").replace(" kr", ""))
-        except (ValueError, TypeError):
-            return 0
+    @staticmethod
+    def _page_request_headers():
+        """Same browser-like headers as image fetch (Referer set per-request).
 
-    def _page_request_headers(self):
-        """Same browser-like headers as image fetch (Referer set per-request)."""
+        Also the default headers of the shared keep-alive session (http_client).
+        """
         return {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
         }
 
+    def _get_detail_page(self, url: str, headers: dict):
+        """GET a detail page, through the response cache when one is configured."""
+        sent = []
+
+        def get(url, **kwargs):
+            response = self.session.get(url, **kwargs)
+            sent.append(response)
+            self.metrics.response("detail", response.status_code, len(response.content))
+            return response
+
+        if self.response_cache is not None:
+            response = self.response_cache.fetch(url, get, headers=headers, timeout=15)
+            if not sent:
+                self.metrics.count("detail_cache_hits")
+            elif sent[0].status_code == 304:
+                self.metrics.count("detail_cache_revalidated")
+            return response
+        response = get(url, timeout=15, headers=headers)
+        response.raise_for_status()
+        return response
+
+    @classmethod
+    def _detail_request_headers(cls) -> dict:
+        headers = cls._page_request_headers()
+        headers["Referer"] = "https://fasteignir.visir.is/"
+        return headers
+
     def check_property_details(self, prop):
         """Fetch property detail page with requests (balcony, terrace, image)."""
-        if not prop.get("link"):
+        if not prop.link:
             return prop
 
         try:
-            headers = self._page_request_headers()
-            headers["Referer"] = "https://fasteignir.visir.is/"
-            response = requests.get(prop["link"], timeout=15, headers=headers)
-            response.raise_for_status()
-
-            page_text = response.text.lower()
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            if prop.get("has_balcony") is None:
-                prop["has_balcony"] = "svalir" in page_text
-            if prop.get("has_terrace") is None:
-                prop["has_terrace"] = "sérafnota" in page_text or "garð" in page_text
-            if prop.get("has_garage") is None:
-                prop["has_garage"] = "bílskúr" in page_text
-
-            if prop.get("build_year") is None:
-                match = re.search(
-                    r"bygg(?:t|ingará[\w]*?)[^\d]{0,20}(\d{4})", page_text
+            with self.metrics.span("detail.fetch"):
+                response = self._get_detail_page(
+                    prop.link, self._detail_request_headers()
                 )
-                if match:
-                    prop["build_year"] = match.group(1)
-                else:
-                    prop["build_year"] = "N/A"
-
-            if prop.get("fasteignamat") is None:
-                fmat_elem = soup.find(string=re.compile("Fasteignamat", re.I))
-                if (
-                    fmat_elem
-                    and fmat_elem.parent
-                    and fmat_elem.parent.find_next_sibling()
-                ):
-                    prop["fasteignamat"] = (
-                        fmat_elem.parent.find_next_sibling().get_text(strip=True)
+            with self.metrics.span("detail.parse"):
+                if self.parse_pool is not None:
+                    self._apply_details(
+                        prop,
+                        self.parse_pool.extract_details(
+                            self.detail_extractor.keywords,
+                            response,
+                            prop.link,
+                            self._wants_detail_markup(prop),
+                        ),
                     )
                 else:
-                    prop["fasteignamat"] = "N/A"
-
-            if not prop.get("image_url") or "staticmap" in (
-                prop.get("image_url") or ""
-            ):
-                img_tag = soup.find(
-                    "img",
-                    src=lambda s: s and "api-beta.fasteignir.is/pictures" in s,
-                )
-                if not img_tag:
-                    for img in soup.find_all("img", attrs={"data-src": True}):
-                        if img.get(
-                            "data-src"
-                        ) and "api-beta.fasteignir.is/pictures" in img.get(
-                            "data-src", ""
-                        ):
-                            img_tag = img
-                            break
-                if img_tag:
-                    image_url = img_tag.get("src") or img_tag.get("data-src")
-                    if image_url:
-                        if not image_url.startswith("http"):
-                            image_url = urljoin(prop["link"], image_url)
-                        prop["image_url"] = image_url
-
+                    self._apply_detail_page(prop, response.text)
         except Exception as e:
-            logging.warning(
-                "Failed to check details for %s: %s", prop.get("address"), e
-            )
-            if prop.get("has_balcony") is None:
-                prop["has_balcony"] = False
-            if prop.get("has_terrace") is None:
-                prop["has_terrace"] = False
-            if prop.get("has_garage") is None:
-                prop["has_garage"] = False
-            if prop.get("build_year") is None:
-                prop["build_year"] = "N/A"
-            if prop.get("fasteignamat") is None:
-                prop["fasteignamat"] = "N/A"
+            self._apply_detail_failure(prop, e)
 
         return prop
 
     @staticmethod
-    def _get_location_names(zip_code: str) -> tuple[str, str]:
-        """Returns (nominative_name, dative_name) for a given zip code."""
-        reykjavik_zips = {
-            "101",
-            "102",
-            "103",
-            "104",
-            "105",
-            "107",
-            "108",
-            "109",
-            "110",
-            "111",
-            "112",
-            "113",
-            "116",
-            "161",
-            "162",
-        }
-        kopavogur_zips = {"200", "201", "202", "203", "206"}
-        gardabaer_zips = {"210", "212", "225"}
-        hafnarfjordur_zips = {"220", "221", "222"}
-        mosfellsbaer_zips = {"270", "271", "276"}
-        seltjarnarnes_zips = {"170"}
-        keflavik_zips = {"230", "232"}
-        hafnir_zips = {"233"}
-        reykjanesbaer_zips = {"262"}
-        grindavik_zips = {"240", "241"}
-        sudurnesjabaer_zips = {"245", "246", "250", "251"}
-        njardvik_zips = {"260"}
-        vogar_zips = {"190", "191"}
-        selfoss_zips = {"800", "801", "802", "803", "804", "805", "806"}
-        hveragerdi_zips = {"810"}
-        thorlakshofn_zips = {"815"}
-        olfus_zips = {"816"}
-        eyrarbakki_zips = {"820"}
-        stokkseyri_zips = {"825"}
-        laugarvatn_zips = {"840"}
-        fludir_zips = {"845", "846"}
-        hella_zips = {"850", "851"}
-        hvolsvollur_zips = {"860", "861"}
-        vik_zips = {"870", "871"}
-        kirkjubaejarklaustur_zips = {"880", "881"}
-        vestmannaeyjar_zips = {"900"}
-        vestmannaeyjabaer_zips = {"901"}
-
-        if zip_code in reykjavik_zips:
-            return "Reykjavík", "Reykjavík"
-        if zip_code in kopavogur_zips:
-            return "Kópavogur", "Kópavogi"
-        if zip_code in gardabaer_zips:
-            return "Garðabær", "Garðabæ"
-        if zip_code in hafnarfjordur_zips:
-            return "Hafnarfjörður", "Hafnarfirði"
-        if zip_code in mosfellsbaer_zips:
-            return "Mosfellsbær", "Mosfellsbæ"
-        if zip_code in seltjarnarnes_zips:
-            return "Seltjarnarnes", "Seltjarnarnesi"
-        if zip_code in keflavik_zips:
-            return "Keflavík", "Keflavík"
-        if zip_code in hafnir_zips:
-            return "Hafnir", "Höfnum"
-        if zip_code in reykjanesbaer_zips:
-            return "Reykjanesbær", "Reykjanesbæ"
-        if zip_code in grindavik_zips:
-            return "Grindavík", "Grindavík"
-        if zip_code in sudurnesjabaer_zips:
-            return "Suðurnesjabær", "Suðurnesjabæ"
-        if zip_code in njardvik_zips:
-            return "Njarðvík", "Njarðvík"
-        if zip_code in vogar_zips:
-            return "Vogar", "Vogum"
-        if zip_code in selfoss_zips:
-            return "Selfoss", "Selfossi"
-        if zip_code in hveragerdi_zips:
-            return "Hveragerði", "Hveragerði"
-        if zip_code in thorlakshofn_zips:
-            return "Þorlákshöfn", "Þorlákshöfn"
-        if zip_code in olfus_zips:
-            return "Ölfus", "Ölfusi"
-        if zip_code in eyrarbakki_zips:
-            return "Eyrarbakki", "Eyrarbakka"
-        if zip_code in stokkseyri_zips:
-            return "Stokkseyri", "Stokkseyri"
-        if zip_code in laugarvatn_zips:
-            return "Laugarvatn", "Laugarvatni"
-        if zip_code in fludir_zips:
-            return "Flúðir", "Flúðum"
-        if zip_code in hella_zips:
-            return "Hella", "Hellu"
-        if zip_code in hvolsvollur_zips:
-            return "Hvolsvöllur", "Hvolsvelli"
-        if zip_code in vik_zips:
-            return "Vík", "Vík"
-        if zip_code in kirkjubaejarklaustur_zips:
-            return "Kirkjubæjarklaustur", "Kirkjubæjarklaustri"
-        if zip_code in vestmannaeyjar_zips:
-            return "Vestmannaeyjar", "Vestmannaeyjum"
-        if zip_code in vestmannaeyjabaer_zips:
-            return "Vestmannaeyjabær", "Vestmannaeyjabæ"
-
-        return "", ""
-
-    def generate_property_html(self, properties, title):
-        html = f"<h2>{title}</h2>"
-        for prop in properties:
-            html += "<div style='margin-bottom: 30px; padding: 15px; border: 1px solid #ddd;'>"
-            html += f"<h3>{prop['address']}</h3>"
-            html += f"<p><strong>Verð:</strong> {prop['price']}</p>"
-            if prop.get("fasteignamat") and prop["fasteignamat"] != "N/A":
-                html += f"<p><strong>Fasteignamat:</strong> {prop['fasteignamat']}</p>"
-            if prop.get("price_per_m2"):
-                price_per_m2_formatted = f"{prop['price_per_m2']:,}".replace(",", ".")
-                html += f"<p><strong>Fermetraverð:</strong> {price_per_m2_formatted} kr.</p>"
-            html += f"<p><strong>Stærð:</strong> {prop['size_m2']}</p>"
-            html += f"<p><strong>Svefnherbergi:</strong> {prop['bedrooms']}</p>"
-
-            # Calculate monthly payment for an 80% non-indexed loan over 40 years
-            try:
-                numeric_price = int(prop["price"].replace(".", "").replace(" kr", ""))
-                loan_70 = numeric_price * 0.70
-                loan_10 = numeric_price * 0.10
-                loan_80 = numeric_price * 0.80
-
-                interest_payment = int(
-                    (loan_70 * 0.007116666666666666) + (loan_10 * 0.007708333333333334)
-                )
-                principal_payment = int(loan_80 * 0.00023890801001251563)
-
-                monthly_payment = interest_payment + principal_payment
-
-                monthly_formatted = f"{monthly_payment:,}".replace(",", ".")
-
-                html += f"<p><strong>Mánaðarleg afborgun (Óverðtryggt, 40 ár, 80% lán):</strong> {monthly_formatted} kr.</p>"
-            except (ValueError, TypeError, KeyError):
-                pass
-
-            if prop.get("build_year") and prop["build_year"] != "N/A":
-                html += f"<p><strong>Byggt:</strong> {prop['build_year']}</p>"
-            if prop.get("has_balcony") is not None:
-                html += f"<p><strong>Svalir:</strong> {'Já' if prop['has_balcony'] else 'Nei'}</p>"
-            if prop.get("has_terrace") is not None:
-                html += f"<p><strong>Garður:</strong> {'Já' if prop['has_terrace'] else 'Nei'}</p>"
-            if prop.get("has_garage") is not None:
-                html += f"<p><strong>Bílskúr:</strong> {'Já' if prop['has_garage'] else 'Nei'}</p>"
-            if prop.get("image_url"):
-                html += f"<img src='{prop['image_url']}' alt='Property image' style='max-width: 600px; height: auto; margin: 10px 0;' />"
-            html += f"<p><a href='{prop['link']}'>View Property</a></p>"
-            html += "</div>"
-        return html
+    def _wants_detail_image(prop) -> bool:
+        return not prop.image_url or "staticmap" in (prop.image_url or "")
+
+    @classmethod
+    def _wants_detail_markup(cls, prop) -> bool:
+        """Whether the detail page's HTML must be parsed (not just its text)."""
+        return cls._wants_detail_image(prop) or prop.fasteignamat is None
+
+    def _apply_detail_page(self, prop, html: str):
+        """Fill prop's missing detail fields (balcony, terrace, image, …) from html."""
+        details = self.detail_extractor.extract(
+            html, prop.link, want_markup=self._wants_detail_markup(prop)
+        )
+        self._apply_details(prop, details)
+
+    def _apply_details(self, prop, details: dict):
+        """Fill prop's missing fields from DetailExtractor.extract() output."""
+        want_image = self._wants_detail_image(prop)
+        image_url = details.pop("image_url", None)
+        for field, value in details.items():
+            if getattr(prop, field) is None:
+                setattr(prop, field, value)
+        if want_image and image_url:
+            prop.image_url = image_url
+
+    def _apply_detail_failure(self, prop, error):
+        """Leave the unknown details None: the listing stays in the report."""
+        logging.warning("Failed to check details for %s: %s", prop.address, error)
+        self._detail_failures.add(prop.link)
+        self.metrics.count("detail_failures")
+
+    def generate_property_html(self, properties, title, image_data_uris=None):
+        """HTML for properties; images in image_data_uris (url -> data URI) are inlined."""
+        return self.renderer.listings_html(properties, title, image_data_uris)
 
     def print_properties(self, properties, title):
         logging.info(f"\n--- {title} ---")
         for i, prop in enumerate(properties):
-            logging.info(f"\nProperty #{i+1}")
-            logging.info(f"  Address: {prop['address']}")
-            logging.info(f"  Price: {prop['price']}")
-            if prop.get("fasteignamat") and prop["fasteignamat"] != "N/A":
-                logging.info(f"  Fasteignamat: {prop['fasteignamat']}")
-            logging.info(f"  Size: {prop['size_m2']}")
-            if prop.get("price_per_m2"):
-                price_per_m2_formatted = f"{prop['price_per_m2']:,}".replace(",", ".")
-                logging.info(f"  Price per m²: {price_per_m2_formatted} kr.")
-            logging.info(f"  Bedrooms: {prop['bedrooms']}")
+            for line in self.renderer.listing_log_lines(prop, i + 1):
+                logging.info(line)
 
-            try:
-                numeric_price = int(prop["price"].replace(".", "").replace(" kr", ""))
-                loan_70 = numeric_price * 0.70
-                loan_10 = numeric_price * 0.10
-                loan_80 = numeric_price * 0.80
+    @staticmethod
+    def _zip_label(zip_code: str) -> str:
+        base_name, _ = location_names(zip_code)
+        if base_name:
+            return f"{zip_code} {base_name}"
+        if zip_code != "Annað":
+            return zip_code
+        return "Óþekkt"
 
-                interest_payment = int(
-                    (loan_70 * 0.007116666666666666) + (loan_10 * 0.007708333333333334)
-                )
-                principal_payment = int(loan_80 * 0.00023890801001251563)
+    @staticmethod
+    def _zip_title(zip_code: str) -> str:
+        base_name, dative_name = location_names(zip_code)
+        if base_name:
+            return f"Fasteignir í {zip_code} {dative_name}"
+        if zip_code != "Annað":
+            return f"Fasteignir í {zip_code}"
+        return "Fasteignir (óþekkt póstnúmer)"
 
-                monthly_payment = interest_payment + principal_payment
+    @staticmethod
+    def _needs_detail_check(prop) -> bool:
+        return (
+            prop.has_balcony is None
+            or prop.has_terrace is None
+            or prop.has_garage is None
+            or prop.build_year is None
+            or prop.fasteignamat is None
+            or not prop.image_url
+            or "staticmap" in (prop.image_url or "")
+        )
 
-                monthly_formatted = f"{monthly_payment:,}".replace(",", ".")
-                principal_formatted = f"{principal_payment:,}".replace(",", ".")
+    def _properties_to_check(self, new_properties: list) -> list:
+        """Props whose detail page must be fetched (after reusing the listing store)."""
+        known_links = set()
+        if self.listing_store is not None:
+            known_links = self.listing_store.apply_known_details(new_properties)
+            logging.info(
+                "Listing store: reusing details for %d / %d properties.",
+                len(known_links),
+                len(new_properties),
+            )
 
-                logging.info(
-                    f"  Monthly Payment (Non-indexed, 40 yrs, 80% loan): {monthly_formatted} kr."
-                )
-                logging.info(f"  Principal Paid Down: {principal_formatted} kr.")
-            except (ValueError, TypeError, KeyError):
-                pass
-
-            if prop.get("build_year") and prop["build_year"] != "N/A":
-                logging.info(f"  Built: {prop['build_year']}")
-            if prop.get("has_balcony") is not None:
-                logging.info(f"  Balcony: {'yes' if prop['has_balcony'] else 'no'}")
-            if prop.get("has_terrace") is not None:
-                logging.info(f"  Terrace: {'yes' if prop['has_terrace'] else 'no'}")
-            if prop.get("has_garage") is not None:
-                logging.info(f"  Garage: {'yes' if prop['has_garage'] else 'no'}")
-            logging.info(f"  Link: {prop['link']}")
+        return [
+            p
+            for p in new_properties
+            if p.link not in known_links and self._needs_detail_check(p)
+        ]
 
-    def main(self):
-        logging.info(f"Start time: {time.time()}")
-        new_properties, _driver = self.scrape_visir_properties()
-        logging.info(f"After having properties, time: {time.time()}")
-
-        def needs_detail_check(prop):
-            return (
-                prop.get("has_balcony") is None
-                or prop.get("has_terrace") is None
-                or prop.get("has_garage") is None
-                or prop.get("build_year") is None
-                or prop.get("fasteignamat") is None
-                or not prop.get("image_url")
-                or "staticmap" in (prop.get("image_url") or "")
+    def _details_checked(self, checked: list):
+        """Record the outcome of check_property_details for checked props."""
+        if self.listing_store is not None:
+            self.listing_store.save_details(
+                [p for p in checked if p.link not in self._detail_failures]
             )
 
-        to_check = [p for p in new_properties if needs_detail_check(p)]
-        logging.info(
-            "Checking %d / %d properties in parallel (requests)...",
-            len(to_check),
-            len(new_properties),
-        )
-        if to_check:
-            with ThreadPoolExecutor(max_workers=15) as executor:
-                list(executor.map(self.check_property_details, to_check))
+    def _prepare_report(self, new_properties: list) -> ReportSelection:
+        """Sort, filter and group the checked props; logs them per zip code."""
+        new_properties.sort(key=lambda x: x.price or 0)
+        found = new_properties
 
-        new_properties.sort(key=lambda x: self.get_numeric_price(x["price"]))
-        logging.info(f"After sorting properties, time: {time.time()}")
-
-        # only keep properties with a balcony, terrace or garage
+        # only keep properties with a balcony, terrace or garage (or unknown:
+        # their detail page could not be fetched)
         new_properties = [
             prop
             for prop in new_properties
-            if prop.get("has_balcony")
-            or prop.get("has_terrace")
-            or prop.get("has_garage")
+            if prop.has_balcony
+            or prop.has_terrace
+            or prop.has_garage
+            or prop.link in self._detail_failures
         ]
         logging.info(
             f"Found {len(new_properties)} properties with a balcony, terrace or garage."
         )
+        self.loan_calculator.attach(new_properties)
+        self._update_price_history(found, new_properties)
 
         # --- Split properties by zip code ---
-        import re
-
         allowed_zips = [
             z.strip() for z in (self.ZIP_CODES or "").split(",") if z.strip()
         ]
@@ -806,166 +1196,269 @@ class Scraper:
         properties_by_zip = {}
         for prop in new_properties:
             zip_code = "Annað"
-            matches = list(re.finditer(r"(?<!\d)\d{3}(?!\d)", prop["address"]))
-            for match in reversed(matches):
-                val = match.group()
-                if val in allowed_zips:
-                    zip_code = val
-                    start = match.start()
-                    prefix = prop["address"][:start].rstrip()
-                    if not prefix.endswith(","):
-                        prop["address"] = prefix + ", " + prop["address"][start:]
-                    break
+            match = find_zip(prop.address, allowed_zips)
+            if match:
+                zip_code = match.group()
+                start = match.start()
+                prefix = prop.address[:start].rstrip()
+                if not prefix.endswith(","):
+                    prop.address = prefix + ", " + prop.address[start:]
 
             properties_by_zip.setdefault(zip_code, []).append(prop)
 
+        # With a listing store, only listings this user has not been sent yet (or
+        # whose card changed) are listed; the averages still cover every match.
+        report_properties = new_properties
+        if self.listing_store is not None:
+            report_properties = self.listing_store.unreported(
+                self.args.user, new_properties
+            )
+            logging.info(
+                "%d of %d properties are new or changed since the last report.",
+                len(report_properties),
+                len(new_properties),
+            )
+
         for zip_code, props in properties_by_zip.items():
             props.sort(
                 key=lambda p: (
-                    p.get("price_per_m2") is None,
-                    p.get("price_per_m2") if p.get("price_per_m2") is not None else 0,
+                    p.price_per_m2 is None,
+                    p.price_per_m2 if p.price_per_m2 is not None else 0,
                 )
             )
-            base_name, dative_name = self._get_location_names(zip_code)
-            if base_name:
-                title = f"Fasteignir í {zip_code} {dative_name}"
-            elif zip_code != "Annað":
-                title = f"Fasteignir í {zip_code}"
-            else:
-                title = "Fasteignir (óþekkt póstnúmer)"
-            self.print_properties(props, title)
-
-        if new_properties:
-            subject = f"Fann {len(new_properties)} eignir fyrir þig"
-
-            avg_price_per_m2 = {}
-            bedroom_counts = {}
-            for prop in new_properties:
-                bedrooms = prop.get("bedrooms", "N/A")
-                if bedrooms not in avg_price_per_m2:
-                    avg_price_per_m2[bedrooms] = 0
-                    bedroom_counts[bedrooms] = 0
-
-                if prop.get("price_per_m2"):
-                    avg_price_per_m2[bedrooms] += prop["price_per_m2"]
-                    bedroom_counts[bedrooms] += 1
-
-            for bedrooms, total_price in avg_price_per_m2.items():
-                if bedroom_counts[bedrooms] > 0:
-                    avg_price_per_m2[bedrooms] = int(
-                        total_price / bedroom_counts[bedrooms]
-                    )
+            self.print_properties(props, self._zip_title(zip_code))
 
-            logging.info("Embedding property images for email...")
-            for prop in new_properties:
-                if prop.get("image_url"):
-                    self.fetch_image_as_data_uri(
-                        prop["image_url"], referer=prop.get("link")
-                    )
+        price_stats = PriceCube.build(properties_by_zip)
+        self._log_price_stats(price_stats, allowed_zips)
 
-            html_body = "<html><body>"
+        return ReportSelection(
+            properties=new_properties,
+            properties_by_zip=properties_by_zip,
+            allowed_zips=allowed_zips,
+            report_properties=report_properties,
+            price_stats=price_stats,
+        )
 
-            html_body += "<h2>Meðalfermetraverð eftir hverfi:</h2>"
-            html_body += "<ul>"
+    def _update_price_history(self, found: list, ranked: list):
+        """Record found in the price history and rank ranked against it."""
+        if self.price_history is None:
+            return
+        try:
+            with self.metrics.span("history"):
+                self.price_history.append(found)
+                self.price_history.attach(ranked)
+        except Exception:
+            logging.exception("Price history failed; listings are not ranked.")
 
-            for zip_code in allowed_zips + ["Annað"]:
-                if zip_code in properties_by_zip:
-                    zip_props = properties_by_zip[zip_code]
-                    zip_total_m2_price = sum(
-                        p.get("price_per_m2", 0)
-                        for p in zip_props
-                        if p.get("price_per_m2")
-                    )
-                    zip_props_with_m2 = sum(
-                        1 for p in zip_props if p.get("price_per_m2")
-                    )
+    def _log_price_stats(self, price_stats: PriceCube, allowed_zips: list):
+        logging.info("\n--- Fermetraverð ---")
+        for zip_code in allowed_zips + ["Annað"]:
+            stats = price_stats.by_zip(zip_code)
+            if not stats.count:
+                continue
+            p25, p75 = stats.percentiles.get(25), stats.percentiles.get(75)
+            logging.info(
+                "  %s: n=%d, mean %s, median %s, p25-p75 %s-%s kr.",
+                self._zip_label(zip_code),
+                stats.count,
+                format_thousands(stats.mean),
+                format_thousands(int(stats.median)),
+                format_thousands(int(p25)),
+                format_thousands(int(p75)),
+            )
 
-                    if zip_props_with_m2 > 0:
-                        zip_avg_m2 = int(zip_total_m2_price / zip_props_with_m2)
-                        zip_avg_m2_formatted = f"{zip_avg_m2:,}".replace(",", ".")
-
-                        base_name, _ = self._get_location_names(zip_code)
-                        if base_name:
-                            zip_label = f"{zip_code} {base_name}"
-                        elif zip_code != "Annað":
-                            zip_label = zip_code
-                        else:
-                            zip_label = "Óþekkt"
-
-                        html_body += f"<li><strong>{zip_label}:</strong> {zip_avg_m2_formatted} kr.</li>"
-            html_body += "</ul>"
-
-            html_body += "<h2>Meðalfermetraverð eftir herbergjafjölda:</h2>"
-            html_body += "<ul>"
-            for bedrooms, avg_price in sorted(avg_price_per_m2.items()):
-                avg_price_formatted = f"{avg_price:,}".replace(",", ".")
-                html_body += f"<li><strong>{bedrooms} svefnherbergi:</strong> {avg_price_formatted} kr.</li>"
-            html_body += "</ul>"
-
-            html_body += "<h2>Meðalfermetraverð eftir herbergjafjölda og hverfi:</h2>"
-            for bedrooms in sorted(avg_price_per_m2.keys()):
-                html_body += f"<h3>{bedrooms} svefnherbergi:</h3>"
-                html_body += "<ul>"
-                for zip_code in allowed_zips + ["Annað"]:
-                    if zip_code in properties_by_zip:
-                        zip_props = properties_by_zip[zip_code]
-                        zip_props_bed = [
-                            p for p in zip_props if p.get("bedrooms", "N/A") == bedrooms
-                        ]
-
-                        zip_total_m2_price_bed = sum(
-                            p.get("price_per_m2", 0)
-                            for p in zip_props_bed
-                            if p.get("price_per_m2")
-                        )
-                        zip_props_with_m2_bed = sum(
-                            1 for p in zip_props_bed if p.get("price_per_m2")
-                        )
-
-                        if zip_props_with_m2_bed > 0:
-                            zip_avg_m2_bed = int(
-                                zip_total_m2_price_bed / zip_props_with_m2_bed
-                            )
-                            zip_avg_m2_formatted_bed = f"{zip_avg_m2_bed:,}".replace(
-                                ",", "."
-                            )
-
-                            base_name, _ = self._get_location_names(zip_code)
-                            if base_name:
-                                zip_label = f"{zip_code} {base_name}"
-                            elif zip_code != "Annað":
-                                zip_label = zip_code
-                            else:
-                                zip_label = "Óþekkt"
-
-                            html_body += f"<li><strong>{zip_label}:</strong> {zip_avg_m2_formatted_bed} kr.</li>"
-                html_body += "</ul>"
-
-            html_body += "<hr>"
+    def _send_report(
+        self, selection: ReportSelection, image_data_uris: Optional[dict] = None
+    ):
+        """Build and send the email for selection.
+
+        image_data_uris: image_url -> data URI already prepared by the caller; when
+        None they are fetched here through the image pipeline.
+        """
+        new_properties = selection.properties
+        properties_by_zip = selection.properties_by_zip
+        allowed_zips = selection.allowed_zips
+        report_properties = selection.report_properties
+        report_links = {p.link for p in report_properties}
+
+        if report_properties:
+            subject = f"Fann {len(report_properties)} eignir fyrir þig"
+
+            price_stats = selection.price_stats
+            zip_order = [z for z in allowed_zips + ["Annað"] if z in properties_by_zip]
+            zip_averages = [
+                (self._zip_label(z), price_stats.by_zip(z).mean)
+                for z in zip_order
+                if price_stats.by_zip(z).count
+            ]
+            bedroom_averages = [
+                (b, price_stats.by_bedrooms(b).mean or 0) for b in price_stats.bedrooms
+            ]
+            bedroom_zip_averages = [
+                (
+                    b,
+                    [
+                        (self._zip_label(z), price_stats.cell(z, b).mean)
+                        for z in zip_order
+                        if price_stats.cell(z, b).count
+                    ],
+                )
+                for b in price_stats.bedrooms
+            ]
 
+            sections = []
             for zip_code in allowed_zips + ["Annað"]:
-                if zip_code in properties_by_zip:
-                    base_name, dative_name = self._get_location_names(zip_code)
-                    if base_name:
-                        title = f"Fasteignir í {zip_code} {dative_name}"
-                    elif zip_code != "Annað":
-                        title = f"Fasteignir í {zip_code}"
-                    else:
-                        title = "Fasteignir (óþekkt póstnúmer)"
-
-                    # Calculate average price per m2 for this specific zip code
-                    zip_props = properties_by_zip[zip_code]
-
-                    html_body += self.generate_property_html(zip_props, title)
-                    html_body += "<hr>"
+                zip_props = [
+                    p
+                    for p in properties_by_zip.get(zip_code, [])
+                    if p.link in report_links
+                ]
+                if zip_props:
+                    sections.append((self._zip_title(zip_code), zip_props))
 
-            html_body += "</body></html>"
+            logging.info("Embedding property images for email...")
+            if image_data_uris is None:
+                with self.metrics.span("images"):
+                    image_data_uris = self.image_pipeline.embed(
+                        report_properties, self._fetch_image, wrap=self._profiled
+                    )
+            self.metrics.count("images_embedded", len(image_data_uris))
+
+            with self.metrics.span("render"):
+                html_body = self.renderer.report_html(
+                    zip_averages,
+                    bedroom_averages,
+                    bedroom_zip_averages,
+                    sections,
+                    image_data_uris,
+                )
 
             logging.info("\nAttempting to send email notification...")
-            self.send_email_notification(subject, html_body)
+            with self.metrics.span("send"):
+                sent = self.send_email_notification(subject, html_body)
+            self.metrics.count("emails_sent" if sent else "emails_failed")
+            if sent and self.listing_store is not None:
+                self.listing_store.mark_reported(self.args.user, report_properties)
+        elif new_properties:
+            logging.info(
+                "\nNo new or changed properties since the last report. "
+                "No email notification sent."
+            )
         else:
             logging.info("\nNo properties found. No email notification sent.")
 
+    DETAIL_WORKERS = 15
+    DETAIL_QUEUE_SIZE = 50
+    _QUEUE_DONE = object()
+
+    def _scrape_and_check_details(self) -> list:
+        """Paginate and check details at the same time.
+
+        Each page's props are put on a bounded queue as soon as the page is parsed;
+        DETAIL_WORKERS threads consume it while pagination continues. Returns every
+        new prop once both are done.
+        """
+        work = queue.Queue(maxsize=self.DETAIL_QUEUE_SIZE)
+        checked = []
+
+        @self._profiled
+        def detail_worker():
+            while True:
+                prop = work.get()
+                if prop is self._QUEUE_DONE:
+                    return
+                self.check_property_details(prop)
+                checked.append(prop)
+
+        new_properties = []
+        with ThreadPoolExecutor(max_workers=self.DETAIL_WORKERS) as executor:
+            workers = [
+                executor.submit(detail_worker) for _ in range(self.DETAIL_WORKERS)
+            ]
+            try:
+                with self.metrics.span("search"):
+                    for page in self.iter_new_properties():
+                        new_properties.extend(page)
+                        for prop in self._properties_to_check(page):
+                            self._put_detail_work(work, prop, workers)
+            finally:
+                if any(worker.done() for worker in workers):
+                    self._drop_detail_work(work)
+                for _ in workers:
+                    self._put_detail_work(work, self._QUEUE_DONE, workers)
+        for worker in workers:
+            worker.result()  # raises what stopped a worker
+
+        logging.info(
+            "Checked %d / %d properties while paginating (requests)...",
+            len(checked),
+            len(new_properties),
+        )
+        self.metrics.count("listings", len(new_properties))
+        self.metrics.count("details_checked", len(checked))
+        if checked:
+            self._details_checked(checked)
+        return new_properties
+
+    @staticmethod
+    def _put_detail_work(work: queue.Queue, item, workers: list):
+        """work.put(item), raising instead of blocking once the workers died."""
+        while True:
+            try:
+                work.put(item, timeout=1)
+                return
+            except queue.Full:
+                for worker in workers:
+                    if worker.done():
+                        worker.result()  # raises what stopped the worker
+                if all(worker.done() for worker in workers):
+                    raise RuntimeError("The detail workers stopped early")
+
+    @staticmethod
+    def _drop_detail_work(work: queue.Queue):
+        """Empty work: a worker died, and what is queued will not be checked."""
+        while True:
+            try:
+                work.get_nowait()
+            except queue.Empty:
+                return
+
+    def main(self):
+        self.search_incomplete = False
+        self.metrics.start()
+        profiling = (
+            self.profiler.run(self.user_config["user"])
+            if self.profiler is not None
+            else nullcontext()
+        )
+        try:
+            with profiling, self.metrics.span("run"):
+                with self.metrics.span("scrape"):
+                    new_properties = self._scrape_and_check_details()
+                with self.metrics.span("aggregate"):
+                    selection = self._prepare_report(new_properties)
+                self._send_report(selection)
+        finally:
+            self._finish_run()
+
+    def _profiled(self, fn):
+        """fn, profiled as part of this user's run when --profile is on."""
+        if self.profiler is None:
+            return fn
+        return self.profiler.wrap(self.user_config["user"], fn)
+
+    def _finish_run(self):
+        """Log this run's stage timings and hand its metrics to the reporter."""
+        self.metrics.finish()
+        logging.info(
+            "Run stages for %s: %s", self.user_config["user"], self.metrics.summary()
+        )
+        if self.run_reporter is not None:
+            try:
+                self.run_reporter.publish(self.metrics)
+            except OSError as e:
+                logging.warning("Could not write the run report: %s", e)
+
 
 def _parse_args():
     parser = argparse.ArgumentParser(description="Scrape real estate listings.")
@@ -977,23 +1470,467 @@ def _parse_args():
         "--schedule",
         action="store_true",
         help=(
-            "Run in a loop: each day at SCRAPER_HOUR:SCRAPER_MINUTE (from .env), "
-            "run once per user in config.json list order."
+            'Run in a loop: each user on its config.json "schedule" (cron '
+            "expression), or daily at SCRAPER_HOUR:SCRAPER_MINUTE (from .env)."
+        ),
+    )
+    parser.add_argument(
+        "--stagger",
+        type=float,
+        default=DEFAULT_STAGGER_SECONDS,
+        metavar="SECONDS",
+        help=(
+            "Schedule mode: start the users of a batch this many seconds apart "
+            "(default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Schedule mode: add up to this random delay to each user's start.",
+    )
+    parser.add_argument(
+        "--catch-up",
+        type=float,
+        default=DEFAULT_CATCH_UP_HOURS,
+        metavar="HOURS",
+        help=(
+            "Schedule mode: on start, run users whose scheduled run was missed "
+            "less than HOURS ago (default: %(default)s, 0 disables)."
+        ),
+    )
+    parser.add_argument(
+        "--schedule-state",
+        default=DEFAULT_STATE_PATH,
+        metavar="PATH",
+        help="Schedule mode: file recording each user's last run (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?",
+        const=DEFAULT_STORE_PATH,
+        metavar="PATH",
+        help=(
+            "Keep a SQLite listing store (default path: %(const)s) so runs only fetch "
+            "details for new/changed listings and only email what was not sent before."
+        ),
+    )
+    parser.add_argument(
+        "--http-cache",
+        nargs="?",
+        const=DEFAULT_CACHE_DIR,
+        metavar="DIR",
+        help=(
+            "Cache detail pages on disk (default dir: %(const)s) and revalidate "
+            "them with ETag/Last-Modified once stale."
+        ),
+    )
+    parser.add_argument(
+        "--http-cache-ttl",
+        type=float,
+        default=DEFAULT_TTL_SECONDS / 3600,
+        metavar="HOURS",
+        help="Serve cached detail pages without a request for this long (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--http-cache-max-mb",
+        type=float,
+        default=DEFAULT_MAX_BYTES / (1024 * 1024),
+        metavar="MB",
+        help="Evict least recently used pages above this size (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--http-pool-size",
+        type=int,
+        default=http_client.DEFAULT_POOL_SIZE,
+        metavar="N",
+        help="Keep-alive connections kept per host by the shared session (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=DEFAULT_RATE,
+        metavar="RPS",
+        help=(
+            "Requests per second per host, shared by all users and threads; backs "
+            "off on 429/5xx and slow responses (default: %(default)s, 0 disables)."
+        ),
+    )
+    parser.add_argument(
+        "--rate-burst",
+        type=int,
+        default=DEFAULT_BURST,
+        metavar="N",
+        help="Requests per host that may go out back to back (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--rate-limit-max",
+        type=float,
+        default=None,
+        metavar="RPS",
+        help=(
+            "Let the rate climb above --rate-limit up to this while the site keeps "
+            "up (default: no higher than --rate-limit)."
+        ),
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        metavar="N",
+        help=(
+            "Retry a request up to N times on connection errors, timeouts, 429 and "
+            "5xx, with exponential backoff and jitter (default: %(default)s, 0 "
+            "disables)."
+        ),
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=float,
+        default=DEFAULT_BACKOFF,
+        metavar="SECONDS",
+        help="Base of the exponential retry backoff (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--checkpoints",
+        nargs="?",
+        const=DEFAULT_CHECKPOINT_DIR,
+        default=None,
+        metavar="DIR",
+        help=(
+            "Keep search pagination checkpoints on disk so a restarted run resumes "
+            f"an interrupted search (default dir: {DEFAULT_CHECKPOINT_DIR}); "
+            "otherwise they are kept in memory."
+        ),
+    )
+    parser.add_argument(
+        "--run-report",
+        nargs="?",
+        const=DEFAULT_REPORT_DIR,
+        default=None,
+        metavar="DIR",
+        help=(
+            "Write each user's stage timings and counts as DIR/<user>.json when "
+            f"their run ends (default dir: {DEFAULT_REPORT_DIR})."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        metavar="PATH",
+        help=(
+            "Also write them to a Prometheus textfile (node_exporter textfile "
+            "collector), e.g. /var/lib/node_exporter/textfile_collector/"
+            "property_scraper.prom."
+        ),
+    )
+    parser.add_argument(
+        "--price-history",
+        nargs="?",
+        const=DEFAULT_HISTORY_DIR,
+        default=None,
+        metavar="DIR",
+        help=(
+            "Append every run's listings to a Parquet price history in DIR (default: "
+            f"{DEFAULT_HISTORY_DIR}) and rank the emailed listings against it. "
+            "Needs pyarrow."
+        ),
+    )
+    parser.add_argument(
+        "--price-history-days",
+        type=int,
+        default=DEFAULT_WINDOW_DAYS,
+        metavar="DAYS",
+        help="Rank listings against the last DAYS days of history (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=DEFAULT_PROFILE_DIR,
+        default=None,
+        metavar="DIR",
+        help=(
+            "Profile each user's run and write the reports to DIR (default: "
+            f"{DEFAULT_PROFILE_DIR}); see --profile-mode."
+        ),
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=MODES,
+        default="cprofile",
+        help=(
+            "cprofile: cProfile and tracemalloc, .pstats plus top functions and "
+            "allocations (slow); sample: stack sampling into flame graph stacks, "
+            "cheap enough to leave on (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=float,
+        default=DEFAULT_SAMPLE_INTERVAL,
+        metavar="SECONDS",
+        help="Sampling profiler: time between samples (default: %(default)s).",
+    )
+    cassette_mode = parser.add_mutually_exclusive_group()
+    cassette_mode.add_argument(
+        "--record",
+        metavar="DIR",
+        help=(
+            "Record every response (search and detail pages, images) and the "
+            "email send into a cassette in DIR."
+        ),
+    )
+    cassette_mode.add_argument(
+        "--replay",
+        metavar="DIR",
+        help=(
+            "Answer every request from the cassette in DIR instead of the network; "
+            "no email is sent."
+        ),
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=_replay_latency,
+        default=0.0,
+        metavar="SECONDS|recorded",
+        help=(
+            "Replay: delay every response by SECONDS, or by the time it took "
+            "when recorded (default: no delay)."
+        ),
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("threads", "asyncio"),
+        default="threads",
+        help=(
+            "Fetch with thread pools (default) or with one asyncio event loop "
+            "(needs aiohttp)."
+        ),
+    )
+    parser.add_argument(
+        "--async-concurrency",
+        type=int,
+        default=20,
+        metavar="N",
+        help="asyncio engine: max requests in flight across all users (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--page-window",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Prefetch up to N search result pages concurrently (window grows "
+            "2, 4, … N); 1 fetches one page at a time (default)."
+        ),
+    )
+    parser.add_argument(
+        "--image-cache",
+        nargs="?",
+        const=DEFAULT_IMAGE_CACHE_DIR,
+        default=None,
+        metavar="DIR",
+        help=(
+            "Keep downloaded listing images on disk, keyed by content hash "
+            f"(default dir: {DEFAULT_IMAGE_CACHE_DIR})."
+        ),
+    )
+    parser.add_argument(
+        "--image-budget-kb",
+        type=int,
+        default=DEFAULT_BUDGET_BYTES // 1024,
+        metavar="KB",
+        help=(
+            "Max total size of the images embedded in one email (default: "
+            "%(default)s); listings over budget link to the remote image. 0 embeds none."
+        ),
+    )
+    parser.add_argument(
+        "--image-max-px",
+        type=int,
+        default=DEFAULT_MAX_PX,
+        metavar="N",
+        help=(
+            "Downscale embedded images to at most N pixels per side (needs Pillow; "
+            "default: %(default)s, 0 keeps the original size)."
+        ),
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help=(
+            "Parse search and detail pages in N worker processes while the "
+            "fetching stays in threads / asyncio (0: one per core but one; "
+            "default: parse in the fetching threads)."
+        ),
+    )
+    parser.add_argument(
+        "--card-parser",
+        choices=("auto",) + tuple(PARSERS),
+        default="auto",
+        help=(
+            "Search page parser: lxml (fastest, needs lxml), strainer (html.parser "
+            "limited to the listing cards) or soup (full html.parser tree); auto "
+            "uses lxml when installed, otherwise strainer."
         ),
     )
     return parser.parse_args()
 
 
+def _replay_latency(value: str):
+    if value == "recorded":
+        return value
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected seconds or 'recorded', got {value!r}"
+        ) from None
+
+
+def _make_profiler(args) -> Optional[Profiler]:
+    if args.profile is None:
+        return None
+    return Profiler(
+        args.profile, mode=args.profile_mode, interval=args.profile_interval
+    )
+
+
+def _make_engine(args):
+    """AsyncEngine for --engine asyncio, None for the thread engine."""
+    if args.engine != "asyncio":
+        return None
+    from async_engine import AsyncEngine
+
+    return AsyncEngine(
+        concurrency=args.async_concurrency,
+        pool_size=args.http_pool_size,
+        rate_limiter=http_client.rate_limiter(),
+        retry_policy=http_client.retry_policy(),
+        cassette=http_client.cassette(),
+        profiler=_make_profiler(args),
+    )
+
+
+def _scraper_kwargs(args) -> dict:
+    """Shared Scraper(...) arguments built once from the CLI flags."""
+    rate_limiter = None
+    if args.rate_limit > 0:
+        rate_limiter = RateLimiter(
+            args.rate_limit, args.rate_burst, max_rate=args.rate_limit_max
+        )
+    retry_policy = None
+    if args.retries > 0:
+        retry_policy = RetryPolicy(args.retries, backoff=args.retry_backoff)
+    cassette = None
+    if args.record:
+        cassette = Cassette(args.record, record=True)
+        cached = [
+            flag
+            for flag, value in (
+                ("--http-cache", args.http_cache),
+                ("--image-cache", args.image_cache),
+                ("--checkpoints", args.checkpoints),
+            )
+            if value
+        ]
+        if cached:
+            # What they answer is never requested, so it would be missing
+            # from the cassette.
+            logging.warning(
+                "--record fetches everything; ignoring %s.", ", ".join(cached)
+            )
+            args.http_cache = args.image_cache = args.checkpoints = None
+    elif args.replay:
+        latency = args.replay_latency
+        cassette = Cassette(
+            args.replay,
+            latency=0.0 if latency == "recorded" else latency,
+            recorded_latency=latency == "recorded",
+        )
+        if not cassette.responses:
+            logging.error("No cassette to replay in %s.", args.replay)
+            raise SystemExit(2)
+    http_client.configure(
+        pool_size=args.http_pool_size,
+        rate_limiter=rate_limiter,
+        retry_policy=retry_policy,
+        cassette=cassette,
+    )
+    kwargs = {
+        "page_window": args.page_window,
+        "search_checkpoints": SearchCheckpoints(args.checkpoints),
+        "card_parser": get_card_parser(args.card_parser),
+        "image_pipeline": ImagePipeline(
+            cache_dir=args.image_cache,
+            budget_bytes=args.image_budget_kb * 1024,
+            max_px=args.image_max_px,
+        ),
+    }
+    if args.parse_workers is not None:
+        kwargs["parse_pool"] = ParsePool(args.parse_workers)
+    if cassette is not None:
+        kwargs["cassette"] = cassette
+    if args.engine != "asyncio":
+        profiler = _make_profiler(args)
+        if profiler is not None:
+            kwargs["profiler"] = profiler
+    if args.run_report or args.metrics_textfile:
+        kwargs["run_reporter"] = RunReporter(
+            args.run_report,
+            args.metrics_textfile,
+            shared=lambda: _batch_stats(kwargs),
+        )
+    if args.store:
+        kwargs["listing_store"] = ListingStore(args.store)
+    if args.price_history:
+        try:
+            kwargs["price_history"] = PriceHistory(
+                args.price_history, window_days=args.price_history_days
+            )
+        except ImportError:
+            logging.error("--price-history needs pyarrow (pip install pyarrow).")
+            raise SystemExit(2) from None
+    if args.http_cache:
+        kwargs["response_cache"] = DiskResponseCache(
+            args.http_cache,
+            ttl_seconds=args.http_cache_ttl * 3600,
+            max_bytes=int(args.http_cache_max_mb * 1024 * 1024),
+        )
+    return kwargs
+
+
 if __name__ == "__main__":
     _configure_logging()
     args = _parse_args()
+    scraper_kwargs = _scraper_kwargs(args)
+    engine = _make_engine(args)
     if args.schedule:
         if args.user:
             logging.error("Do not pass --user with --schedule.")
             raise SystemExit(2)
-        run_schedule_loop()
+        run_schedule_loop(
+            scraper_kwargs,
+            engine,
+            ScheduleSettings(
+                stagger_seconds=args.stagger,
+                jitter_seconds=args.jitter,
+                catch_up_hours=args.catch_up,
+                state_path=args.schedule_state,
+            ),
+        )
     else:
         if not args.user:
             logging.error("Either --user NAME or --schedule is required.")
             raise SystemExit(2)
-        Scraper(find_user_config(args.user)).main()
+        scraper = Scraper(find_user_config(args.user), **scraper_kwargs)
+        try:
+            if engine is not None:
+                engine.run([scraper])
+            else:
+                scraper.main()
+        finally:
+            _log_batch_stats(scraper_kwargs)  # saves a --record cassette
@@ -0,0 +1,132 @@
+"""Pagination checkpoints: resume a search from the last page that was fetched.
+
+While a search paginates, every result page is saved under the query's
+parameters. If a page still fails after the retries, the search stops with
+SearchIncompleteError and keeps its checkpoint; the next run of the same query
+(the batch re-run, or a restart) replays the saved pages and carries on from the
+failed one instead of starting over. A search that reaches its last page drops
+its checkpoint.
+
+Checkpoints live in memory (shared by the users of a process), or on disk with
+``--checkpoints DIR`` (gzipped pages, one directory per query) so they survive a
+restart. They expire after ``ttl_seconds``: results older than that are stale.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+DEFAULT_CHECKPOINT_DIR = ".search_checkpoints"
+DEFAULT_TTL_SECONDS = 6 * 3600
+
+
+class SearchIncompleteError(Exception):
+    """Pagination stopped at a page that could not be fetched."""
+
+    def __init__(self, page_num: int, cause: Exception):
+        super().__init__(f"search page {page_num} failed: {cause}")
+        self.page_num = page_num
+        self.cause = cause
+
+
+def query_key(query_params: dict) -> str:
+    """Stable key for a search: hash of its parameters (page number excluded)."""
+    params = {k: str(v) for k, v in query_params.items() if k != "page"}
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:32]
+
+
+class SearchCheckpoints:
+    """Saved result pages per query; thread-safe.
+
+    directory=None keeps them in memory for the lifetime of the process.
+    """
+
+    def __init__(
+        self, directory: Optional[str] = None, ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._memory: dict[str, dict] = {}  # key -> {"started": ts, "pages": {n: html}}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def load(self, query_params: dict) -> list:
+        """[(page_num, html)] saved for this query, pages 1..n without gaps."""
+        key = query_key(query_params)
+        with self._lock:
+            if self.directory:
+                started, pages = self._load_disk(key)
+            else:
+                entry = self._memory.get(key) or {"started": 0, "pages": {}}
+                started, pages = entry["started"], entry["pages"]
+            if pages and time.time() - started > self.ttl_seconds:
+                logging.info("Search checkpoint %s expired; starting over.", key)
+                self._clear_locked(key)
+                return []
+        out = []
+        for page_num in range(1, len(pages) + 1):
+            if page_num not in pages:
+                break
+            out.append((page_num, pages[page_num]))
+        return out
+
+    def save_page(self, query_params: dict, page_num: int, html: str):
+        key = query_key(query_params)
+        with self._lock:
+            if self.directory:
+                path = os.path.join(self.directory, key)
+                os.makedirs(path, exist_ok=True)
+                meta = os.path.join(path, "meta.json")
+                if not os.path.exists(meta):
+                    with open(meta, "w", encoding="utf-8") as f:
+                        json.dump({"started": time.time(), "params": query_params}, f)
+                tmp = os.path.join(path, f"{page_num:04d}.html.gz.tmp")
+                with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                    f.write(html)
+                os.replace(tmp, os.path.join(path, f"{page_num:04d}.html.gz"))
+            else:
+                entry = self._memory.setdefault(
+                    key, {"started": time.time(), "pages": {}}
+                )
+                entry["pages"][page_num] = html
+
+    def clear(self, query_params: dict):
+        """Drop the checkpoint once the search reached its last page."""
+        with self._lock:
+            self._clear_locked(query_key(query_params))
+
+    def _clear_locked(self, key: str):
+        if self.directory:
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+        else:
+            self._memory.pop(key, None)
+
+    def _load_disk(self, key: str) -> tuple[float, dict]:
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                started = json.load(f)["started"]
+            names = os.listdir(path)
+        except (OSError, ValueError, KeyError):
+            return 0, {}
+        pages = {}
+        for name in names:
+            if not name.endswith(".html.gz"):
+                continue
+            try:
+                with gzip.open(os.path.join(path, name), "rt", encoding="utf-8") as f:
+                    pages[int(name[:4])] = f.read()
+            except (OSError, ValueError, EOFError):
+                continue
+        return started, pages
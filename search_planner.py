@@ -0,0 +1,187 @@
+"""Batch search planner: fetch each /ajaxsearch/getresults page once per batch.
+
+Users in config.json often search the same (or overlapping) zips, price and bedroom
+ranges. The planner merges their queries into as few superset queries as possible,
+paginates each merged query once, and hands every user the parsed cards so that
+Scraper.scrape_visir_properties only has to apply that user's filters locally.
+
+Categories are not shown on the listing cards, so only users with the same
+category set are merged; zips, price and bedrooms can all be re-checked locally.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+from search_checkpoint import SearchIncompleteError
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    categories: frozenset
+    zips: frozenset
+    min_price: int
+    max_price: int
+    min_bedrooms: int
+    max_bedrooms: int
+
+    @classmethod
+    def from_scraper(cls, scraper) -> Optional[SearchQuery]:
+        """Build the query a Scraper would send, or None if its config is incomplete."""
+        try:
+            zips = frozenset(
+                z.strip() for z in (scraper.ZIP_CODES or "").split(",") if z.strip()
+            )
+            query = cls(
+                categories=frozenset(scraper.CATEGORIES.split(",")),
+                zips=zips,
+                min_price=int(scraper.MIN_PRICE),
+                max_price=int(scraper.MAX_PRICE),
+                min_bedrooms=int(scraper.MIN_BEDROOMS),
+                max_bedrooms=int(scraper.MAX_BEDROOMS),
+            )
+        except (ValueError, TypeError, AttributeError):
+            return None
+        return query if zips else None
+
+    def can_merge(self, other: SearchQuery) -> bool:
+        """Same categories and overlapping price and bedroom ranges.
+
+        Disjoint ranges would make the bounding query fetch pages neither user
+        wants, so those are kept as separate queries.
+        """
+        return (
+            self.categories == other.categories
+            and self.min_price <= other.max_price
+            and other.min_price <= self.max_price
+            and self.min_bedrooms <= other.max_bedrooms
+            and other.min_bedrooms <= self.max_bedrooms
+        )
+
+    def merge(self, other: SearchQuery) -> SearchQuery:
+        return SearchQuery(
+            categories=self.categories,
+            zips=self.zips | other.zips,
+            min_price=min(self.min_price, other.min_price),
+            max_price=max(self.max_price, other.max_price),
+            min_bedrooms=min(self.min_bedrooms, other.min_bedrooms),
+            max_bedrooms=max(self.max_bedrooms, other.max_bedrooms),
+        )
+
+    def to_params(self) -> dict:
+        """Query string for /ajaxsearch/getresults, without "page"."""
+        return {
+            "stype": "sale",
+            "zip": ",".join(sorted(self.zips)),
+            "price": f"{self.min_price},{self.max_price}",
+            "bedroom": f"{self.min_bedrooms},{self.max_bedrooms}",
+            "category": ",".join(sorted(self.categories, key=int)),
+        }
+
+
+@dataclass
+class PlannedSearch:
+    query: SearchQuery
+    members: list = field(default_factory=list)  # indices into the input queries
+
+
+def plan_searches(queries: list) -> list:
+    """Greedily merge mergeable queries until no two planned searches can merge."""
+    plans = [PlannedSearch(q, [i]) for i, q in enumerate(queries)]
+    merged = True
+    while merged:
+        merged = False
+        for a in range(len(plans)):
+            for b in range(a + 1, len(plans)):
+                if plans[a].query.can_merge(plans[b].query):
+                    plans[a] = PlannedSearch(
+                        plans[a].query.merge(plans[b].query),
+                        plans[a].members + plans[b].members,
+                    )
+                    del plans[b]
+                    merged = True
+                    break
+            if merged:
+                break
+    return plans
+
+
+def _fetch_cards(scraper, query: SearchQuery) -> list:
+    cards = []
+    for page_num, text in scraper.iter_search_pages(query.to_params()):
+        page_cards = scraper.extract_listing_cards(text, scraper.BASE_URL)
+        logging.info(
+            "Batch search page %s: %s card(s) (running total %s).",
+            page_num,
+            len(page_cards),
+            len(cards) + len(page_cards),
+        )
+        if not page_cards:
+            logging.warning(
+                "Batch search page %s: no listing cards in HTML — stopping.",
+                page_num,
+            )
+            break
+        cards.extend(page_cards)
+    return cards
+
+
+def plan_batch(scrapers: list) -> list:
+    """[(PlannedSearch, [(scraper, its own SearchQuery), ...]), ...] for scrapers.
+
+    Scrapers whose config cannot be planned are left out and paginate on their own.
+    """
+    plannable = []
+    for scraper in scrapers:
+        query = SearchQuery.from_scraper(scraper)
+        if query is not None:
+            plannable.append((scraper, query))
+
+    plans = plan_searches([query for _, query in plannable])
+    logging.info(
+        "Search planner: %d user search(es) merged into %d batch quer(ies).",
+        len(plannable),
+        len(plans),
+    )
+    batch = []
+    for plan in plans:
+        members = [plannable[i] for i in plan.members]
+        logging.info(
+            "Batch query %s for: %s",
+            plan.query.to_params(),
+            ", ".join(s.user_config["user"] for s, _ in members),
+        )
+        batch.append((plan, members))
+    return batch
+
+
+def attach_cards(plan: PlannedSearch, members: list, cards: list) -> None:
+    """Hand the cards of plan's merged query to each member scraper."""
+    for scraper, query in members:
+        scraper.use_prefetched_cards(
+            cards,
+            zip_filter=(
+                (plan.query.zips, query.zips) if query.zips != plan.query.zips else None
+            ),
+            bedroom_range=(
+                (query.min_bedrooms, query.max_bedrooms)
+                if (query.min_bedrooms, query.max_bedrooms)
+                != (plan.query.min_bedrooms, plan.query.max_bedrooms)
+                else None
+            ),
+        )
+
+
+def prefetch_search_results(scrapers: list) -> None:
+    """Run the merged searches for scrapers and attach the cards to each of them."""
+    for plan, members in plan_batch(scrapers):
+        try:
+            cards = _fetch_cards(members[0][0], plan.query)
+        except SearchIncompleteError as e:
+            # Partial results would hide listings; the members search on their own.
+            logging.error("Batch query %s incomplete: %s", plan.query.to_params(), e)
+            members[0][0].search_incomplete = False
+            continue
+        attach_cards(plan, members, cards)